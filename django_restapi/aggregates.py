@@ -0,0 +1,261 @@
+"""
+Aggregate resources: the values of a collection grouped by
+one or more fields and aggregated by the database, e.g. the
+sum of the votes of the choices of each poll at
+/choices/votes/, computed with a single GROUP BY query
+instead of by clients that fetch every choice. Optionally an
+AggregateSummary keeps the results in memory and updates
+the groups that writes change, so most reads need no query.
+"""
+from django.core.serializers.json import DjangoJSONEncoder
+from django.conf import settings
+from django.core import signals as core_signals
+from django.db import transaction
+from django.db.models import Q, signals
+from django.http import HttpResponse
+from django.utils import simplejson
+from django.utils.encoding import smart_unicode
+from django.utils.xmlutils import SimplerXMLGenerator
+from resource import Resource
+from cStringIO import StringIO
+import threading, time
+
+def get_rows(queryset, group_by, aggregates):
+    """
+    Returns the list of dictionaries with the values of the
+    group_by fields and the aggregates of each group of
+    queryset, ordered by group.
+    """
+    if not group_by:
+        return [queryset.aggregate(**aggregates)]
+    return list(queryset.values(*group_by).annotate(**aggregates).order_by(*group_by))
+
+class AggregateSummary(object):
+    """
+    Materialized results of an aggregate query. The results
+    are computed with the first read. When an object of the
+    model is saved or deleted, the groups it belonged to
+    before and belongs to now are marked, and the next read
+    recomputes them with one query; the other groups and
+    reads without preceding writes need none.
+
+    The groups are not recomputed in the signal handlers,
+    which run inside the writer's transaction: a rollback
+    would leave values in the summary that were never
+    committed. A write in a transaction (e.g. with the
+    TransactionMiddleware) marks its groups again when the
+    request has finished, when its transaction has been
+    committed or rolled back, so a read in between does not
+    keep the values it saw.
+
+    Changes that bypass the model signals (QuerySet.update(),
+    raw SQL, other processes) and transactions that end
+    outside a request are only picked up by the next write to
+    the same groups or after max_age seconds, when the whole
+    summary is recomputed.
+    """
+    def __init__(self, queryset, group_by, aggregates, max_age=None):
+        """
+        queryset, group_by, aggregates:
+            see AggregateResource
+        max_age:
+            the number of seconds after which the summary is
+            recomputed; default: never
+        """
+        self.queryset = queryset
+        self.group_by = group_by
+        self.aggregates = aggregates
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._groups = None
+        self._computed = None
+        # Groups to recompute with the next read
+        self._dirty = set()
+        # Groups written in the current thread's transaction
+        self._pending = threading.local()
+        model = queryset.model
+        self.attnames = [model._meta.get_field(name).attname for name in group_by]
+        uid = 'restapi.aggregates:%d' % id(self)
+        signals.post_init.connect(self.loaded, sender=model, weak=False, dispatch_uid=uid)
+        signals.post_save.connect(self.changed, sender=model, weak=False, dispatch_uid=uid)
+        signals.post_delete.connect(self.changed, sender=model, weak=False, dispatch_uid=uid)
+        core_signals.request_finished.connect(self.finished, weak=False, dispatch_uid=uid)
+
+    def get_key(self, obj):
+        return tuple([getattr(obj, attname) for attname in self.attnames])
+
+    def loaded(self, sender, instance, **kwargs):
+        # Remember the group of the object as loaded, so that
+        # the group it leaves is updated when it moves.
+        instance.__dict__['_aggregate_group_%d' % id(self)] = self.get_key(instance)
+
+    def changed(self, sender, instance, **kwargs):
+        keys = [self.get_key(instance)]
+        original = instance.__dict__.get('_aggregate_group_%d' % id(self))
+        if original is not None and original != keys[0]:
+            keys.append(original)
+        instance.__dict__['_aggregate_group_%d' % id(self)] = keys[0]
+        self.mark(keys)
+        if transaction.is_managed():
+            # Not committed yet
+            pending = getattr(self._pending, 'keys', None)
+            if pending is None:
+                pending = self._pending.keys = set()
+            pending.update(keys)
+
+    def finished(self, sender, **kwargs):
+        # The transactions of the request have ended
+        pending = getattr(self._pending, 'keys', None)
+        if pending:
+            self._pending.keys = None
+            self.mark(pending)
+
+    def mark(self, keys):
+        """
+        Marks the groups with the given keys to be recomputed
+        with the next read.
+        """
+        self._lock.acquire()
+        try:
+            if self._groups is not None:
+                self._dirty.update(keys)
+        finally:
+            self._lock.release()
+
+    def refresh(self):
+        """
+        Recomputes all groups.
+        """
+        groups = {}
+        for row in get_rows(self.queryset._clone(), self.group_by, self.aggregates):
+            groups[tuple([row[name] for name in self.group_by])] = row
+        self._lock.acquire()
+        try:
+            self._groups = groups
+            self._computed = time.time()
+            self._dirty.clear()
+        finally:
+            self._lock.release()
+
+    def update(self, keys):
+        """
+        Recomputes the groups with the given keys (tuples of
+        the values of the group_by fields).
+        """
+        if not self.group_by:
+            self.refresh()
+            return
+        condition = None
+        for key in keys:
+            group = Q(**dict(zip([str(name) for name in self.group_by], key)))
+            if condition is None:
+                condition = group
+            else:
+                condition = condition | group
+        rows = get_rows(self.queryset.filter(condition), self.group_by, self.aggregates)
+        for key in keys:
+            self._groups.pop(key, None)
+        for row in rows:
+            self._groups[tuple([row[name] for name in self.group_by])] = row
+
+    def get_rows(self):
+        self._lock.acquire()
+        try:
+            if self._groups is None or (self.max_age is not None and
+                                        time.time() - self._computed > self.max_age):
+                self.refresh()
+            elif self._dirty:
+                keys = list(self._dirty)
+                self.update(keys)
+                self._dirty.difference_update(keys)
+            keys = self._groups.keys()
+            keys.sort()
+            return [self._groups[key] for key in keys]
+        finally:
+            self._lock.release()
+
+class AggregateResource(Resource):
+    """
+    Read-only resource with the aggregated values of a
+    collection, one entry per group with the group_by fields
+    and the aggregates. GET parameters named like group_by
+    fields select groups, e.g. /choices/votes/?poll=1.
+    Rendered as JSON (list of objects) or XML (<group>
+    elements with the values as attributes), following the
+    format of the collection's responder.
+    """
+    def __init__(self, collection, group_by, aggregates, summary=False,
+                 max_age=None, authentication=None, throttling=None):
+        """
+        collection:
+            the model_resource.Collection whose queryset is
+            aggregated
+        group_by:
+            the name of the field (or a list of names) the
+            objects are grouped by, e.g. 'poll'; None: one
+            group of all objects
+        aggregates:
+            dictionary that maps names to aggregates, e.g.
+            {'votes' : Sum('votes')}
+        summary:
+            if True, the results are kept in an AggregateSummary
+            that is updated on writes
+        max_age:
+            see AggregateSummary
+        """
+        format = getattr(collection.responder, 'format', 'json')
+        if format == 'xml':
+            mimetype = 'application/xml'
+        else:
+            mimetype = 'application/json'
+        Resource.__init__(self, authentication, ('GET',), mimetype, throttling)
+        self.collection = collection
+        self.format = format
+        if not group_by:
+            group_by = ()
+        elif isinstance(group_by, basestring):
+            group_by = (group_by,)
+        self.group_by = tuple(group_by)
+        self.aggregates = aggregates
+        if summary:
+            self.summary = AggregateSummary(collection.queryset, self.group_by,
+                                            aggregates, max_age)
+        else:
+            self.summary = None
+
+    def get_rows(self, request):
+        selected = [(name, request.GET[name]) for name in self.group_by
+                    if request.GET.has_key(name)]
+        if self.summary is not None:
+            rows = self.summary.get_rows()
+            for name, value in selected:
+                rows = [row for row in rows if smart_unicode(row[name]) == value]
+            return rows
+        queryset = self.collection.queryset._clone()
+        try:
+            if selected:
+                queryset = queryset.filter(**dict([(str(name), value) for (name, value) in selected]))
+            return get_rows(queryset, self.group_by, self.aggregates)
+        except ValueError:
+            # Invalid value of a group_by field
+            return []
+
+    def render(self, rows):
+        names = list(self.group_by) + sorted(self.aggregates.keys())
+        if self.format != 'xml':
+            return simplejson.dumps([dict([(name, row[name]) for name in names]) for row in rows],
+                                    cls=DjangoJSONEncoder)
+        stream = StringIO()
+        xml = SimplerXMLGenerator(stream, settings.DEFAULT_CHARSET)
+        xml.startDocument()
+        xml.startElement('aggregates', {})
+        for row in rows:
+            xml.addQuickElement('group', attrs=dict([(name, smart_unicode(row[name])) for name in names]))
+        xml.endElement('aggregates')
+        xml.endDocument()
+        return stream.getvalue()
+
+    def read(self, request):
+        rows = self.instrumentation.timed('query', self.get_rows, request)
+        return HttpResponse(self.instrumentation.timed('render', self.render, rows),
+                            mimetype=self.mimetype)
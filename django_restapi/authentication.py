@@ -1,6 +1,10 @@
 from django.http import HttpResponse
+from django.utils import simplejson
 from django.utils.translation import ugettext as _
-import md5, time, random
+from store import LocalStore, CacheStore, has_shared_cache
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from hashlib import sha1
+import hmac, md5, time, random
 
 def djangouser_auth(username, password):
     """
@@ -27,11 +31,119 @@ class NoAuthentication(object):
     def challenge_headers(self):
         return {}
 
+def get_challenge_headers(authentication, request):
+    """
+    Returns the challenge headers of authentication for a
+    request it has rejected. If the request was rejected
+    only because its digest nonce has expired (see
+    HttpDigestAuthentication), the challenge says so.
+    """
+    if getattr(request, 'stale_nonce', False):
+        return authentication.challenge_headers(stale=True)
+    return authentication.challenge_headers()
+
+class CredentialCache(object):
+    """
+    Remembers successful username/password verifications so
+    that repeated requests skip the user lookup and the
+    password hash check. Entries are keyed by an HMAC of the
+    credentials, so the store never holds a password.
+    
+    All entries of a user hang off a per-user generation
+    value. Saving or deleting the user (e.g. after a password
+    change) removes the generation value and thereby all
+    entries of that user.
+    """
+    def __init__(self, store=None, timeout=300, max_entries=1000,
+                 secret=None, user_model=None):
+        """
+        store:
+            The store (see django_restapi.store) that holds
+            the entries. It must be shared by all processes
+            so that invalidations reach them.
+            Default: CacheStore if Django's cache backend is
+            shared (e.g. memcached), otherwise LocalStore
+            with max_entries and timeout; a LocalStore only
+            suits single-process deployments.
+        timeout:
+            Number of seconds a verification is remembered
+        max_entries:
+            Size of a default LocalStore; least recently
+            used entries are evicted first
+        secret:
+            The key for hashing credentials.
+            Default: settings.SECRET_KEY
+        user_model:
+            The model whose post_save and post_delete signals
+            invalidate the entries for the instance's username.
+            Default: django.contrib.auth.models.User
+        """
+        from django.db.models import signals
+        if store is None:
+            if has_shared_cache():
+                store = CacheStore(timeout=timeout)
+            else:
+                store = LocalStore(max_entries=max_entries, timeout=timeout)
+        self.store = store
+        self.timeout = timeout
+        if secret is None:
+            from django.conf import settings
+            secret = settings.SECRET_KEY
+        self.secret = str(secret)
+        if user_model is None:
+            from django.contrib.auth.models import User
+            user_model = User
+        signals.post_save.connect(self.user_changed, sender=user_model)
+        signals.post_delete.connect(self.user_changed, sender=user_model)
+    
+    def hash(self, *parts):
+        return hmac.new(self.secret, "\0".join(parts), sha1).hexdigest()
+    
+    def generation_key(self, username):
+        return 'gen:%s' % self.hash(username)
+    
+    def credential_key(self, generation, username, password):
+        return 'cred:%s' % self.hash(generation, username, password)
+    
+    def lookup(self, username, password):
+        """
+        Returns True if the credentials have been verified
+        before and the entry is still valid.
+        """
+        generation = self.store.get(self.generation_key(username))
+        if generation is None:
+            return False
+        return bool(self.store.get(self.credential_key(generation, username, password)))
+    
+    def remember(self, username, password):
+        """
+        Records a successful verification.
+        """
+        key = self.generation_key(username)
+        generation = self.store.get(key)
+        if generation is None:
+            generation = md5.md5("%s:%s" % (time.time(), random.random())).hexdigest()
+            if not self.store.add(key, generation, self.timeout):
+                generation = self.store.get(key)
+                if generation is None:
+                    return
+        self.store.set(self.credential_key(generation, username, password), True, self.timeout)
+    
+    def invalidate(self, username):
+        """
+        Forgets all verifications of a user.
+        """
+        self.store.delete(self.generation_key(username))
+    
+    def user_changed(self, sender, instance, **kwargs):
+        self.invalidate(instance.username)
+
 class HttpBasicAuthentication(object):
     """
     HTTP/1.0 basic authentication.
     """    
-    def __init__(self, authfunc=djangouser_auth, realm=_('Restricted Access')):
+    def __init__(self, authfunc=djangouser_auth, realm=None,
+                 credential_cache=None):
         """
         authfunc:
             A user-defined function which takes a username and
@@ -39,10 +151,19 @@ class HttpBasicAuthentication(object):
             and returns True if the user is authenticated
         realm:
             An identifier for the authority that is requesting
-            authorization
+            authorization; default: 'Restricted Access'
+            (translated)
+        credential_cache:
+            An optional CredentialCache instance. If given,
+            successful calls of authfunc are remembered and
+            not repeated until the entry expires or the user
+            changes.
         """
+        if realm is None:
+            realm = _('Restricted Access')
         self.realm = realm
         self.authfunc = authfunc
+        self.credential_cache = credential_cache
     
     def challenge_headers(self):
         """
@@ -62,7 +183,128 @@ class HttpBasicAuthentication(object):
             return False
         auth = auth.strip().decode('base64')
         username, password = auth.split(':', 1)
-        return self.authfunc(username=username, password=password)
+        if self.credential_cache and self.credential_cache.lookup(username, password):
+            return True
+        authenticated = self.authfunc(username=username, password=password)
+        if authenticated and self.credential_cache:
+            self.credential_cache.remember(username, password)
+        return authenticated
+
+def constant_time_compare(val1, val2):
+    """
+    Compares two strings in time that does not depend on
+    the position of the first differing character.
+    """
+    if len(val1) != len(val2):
+        return False
+    result = 0
+    for x, y in zip(val1, val2):
+        result |= ord(x) ^ ord(y)
+    return result == 0
+
+def b64encode(s):
+    """
+    URL-safe base64 encoding without padding.
+    """
+    return urlsafe_b64encode(s).rstrip('=')
+
+def b64decode(s):
+    s = str(s)
+    return urlsafe_b64decode(s + '=' * (-len(s) % 4))
+
+class TokenAuthentication(object):
+    """
+    Bearer token authentication with signed tokens. A token
+    carries its claims (e.g. the username) and an expiry
+    time and is signed with HMAC-SHA1, so verifying it needs
+    neither a database lookup nor server-side state.
+    Use resource.TokenResource to issue tokens.
+    
+    The claims of an accepted token are available as
+    request.token_claims.
+    """
+    def __init__(self, secret=None, max_age=3600, realm=None):
+        """
+        secret:
+            The key used to sign tokens.
+            Default: settings.SECRET_KEY
+        max_age:
+            Number of seconds an issued token is valid
+        realm:
+            An identifier for the authority that is requesting
+            authorization; default: 'Restricted Access'
+            (translated)
+        """
+        if secret is None:
+            from django.conf import settings
+            secret = settings.SECRET_KEY
+        self.secret = str(secret)
+        self.max_age = max_age
+        if realm is None:
+            realm = _('Restricted Access')
+        self.realm = realm
+    
+    def sign(self, value):
+        return b64encode(hmac.new(self.secret, value, sha1).digest())
+    
+    def issue_token(self, claims=None, max_age=None):
+        """
+        Returns a token of the form "payload.signature" where
+        payload is the JSON encoded claims plus an "exp" claim
+        with the expiry timestamp.
+        """
+        if claims is None:
+            claims = {}
+        if max_age is None:
+            max_age = self.max_age
+        claims = dict(claims)
+        claims['exp'] = int(time.time() + max_age)
+        payload = b64encode(simplejson.dumps(claims))
+        return '%s.%s' % (payload, self.sign(payload))
+    
+    def get_claims(self, token):
+        """
+        Returns the claims of a token, or None if the token
+        is malformed, its signature is wrong or it has expired.
+        """
+        try:
+            payload, signature = token.split('.')
+        except ValueError:
+            return None
+        if not constant_time_compare(str(signature), self.sign(str(payload))):
+            return None
+        try:
+            claims = simplejson.loads(b64decode(payload))
+            if claims['exp'] < time.time():
+                return None
+        except (TypeError, ValueError, KeyError):
+            return None
+        return claims
+    
+    def challenge_headers(self):
+        """
+        Returns the http headers that ask for appropriate
+        authorization.
+        """
+        return {'WWW-Authenticate' : 'Bearer realm="%s"' % self.realm}
+    
+    def is_authenticated(self, request):
+        """
+        Checks whether a request carries a valid token.
+        """
+        if not request.META.has_key('HTTP_AUTHORIZATION'):
+            return False
+        try:
+            (authmeth, token) = request.META['HTTP_AUTHORIZATION'].split(' ', 1)
+        except ValueError:
+            return False
+        if authmeth.lower() != 'bearer':
+            return False
+        claims = self.get_claims(token.strip())
+        if claims is None:
+            return False
+        request.token_claims = claims
+        return True
 
 def digest_password(realm, username, password):
     """
@@ -75,7 +317,8 @@ class HttpDigestAuthentication(object):
     HTTP/1.1 digest authentication (RFC 2617).
     Uses code from the Python Paste Project (MIT Licence).
     """    
-    def __init__(self, authfunc, realm=_('Restricted Access')):
+    def __init__(self, authfunc, realm=None,
+                 secret=None, nonce_lifetime=300, nonce_store=None):
         """
         authfunc:
             A user-defined function which takes a username and
@@ -84,11 +327,41 @@ class HttpDigestAuthentication(object):
             authentication realm and password.
         realm:
             An identifier for the authority that is requesting
-            authorization
+            authorization; default: 'Restricted Access'
+            (translated)
+        secret:
+            The key used to sign nonces. Processes that share
+            clients must use the same secret.
+            Default: settings.SECRET_KEY
+        nonce_lifetime:
+            Number of seconds a nonce is accepted after it
+            has been issued
+        nonce_store:
+            The store (see django_restapi.store) that records
+            the nonce counts used with each nonce in order
+            to prevent replay attacks. It must be shared by
+            all processes, otherwise a request can be replayed
+            to another process.
+            Default: CacheStore if Django's cache backend is
+            shared (e.g. memcached), otherwise LocalStore with
+            up to 10000 nonces; the latter suits
+            single-process deployments only.
         """
+        if realm is None:
+            realm = _('Restricted Access')
         self.realm = realm
         self.authfunc = authfunc
-        self.nonce    = {} # prevention of replay attacks
+        if secret is None:
+            from django.conf import settings
+            secret = settings.SECRET_KEY
+        self.secret = secret
+        self.nonce_lifetime = nonce_lifetime
+        if nonce_store is None:
+            if has_shared_cache():
+                nonce_store = CacheStore(timeout=nonce_lifetime)
+            else:
+                nonce_store = LocalStore(max_entries=10000, timeout=nonce_lifetime)
+        self.nonce_store = nonce_store
 
     def get_auth_dict(self, auth_string):
         """
@@ -143,16 +416,50 @@ class HttpDigestAuthentication(object):
         computed_response = md5.md5(chk).hexdigest()
         return computed_response
     
+    def sign_nonce(self, value):
+        """
+        Returns the signature of the timestamp and salt
+        part of a nonce.
+        """
+        return hmac.new(str(self.secret), value, sha1).hexdigest()
+
+    def make_nonce(self):
+        """
+        Returns a new nonce of the form "timestamp.salt.signature".
+        Nonces can be validated by any process that knows the
+        secret, so the server doesn't need to remember them.
+        """
+        value = "%d.%s" % (time.time(), md5.md5(str(random.random())).hexdigest()[:8])
+        return "%s.%s" % (value, self.sign_nonce(value))
+
+    def is_signed_nonce(self, nonce):
+        """
+        Checks the signature of a nonce.
+        """
+        try:
+            timestamp, salt, signature = nonce.split('.')
+            int(timestamp)
+        except ValueError:
+            return False
+        return constant_time_compare(signature, self.sign_nonce('%s.%s' % (timestamp, salt)))
+
+    def is_valid_nonce(self, nonce):
+        """
+        Checks the signature and the age of a nonce.
+        """
+        if not self.is_signed_nonce(nonce):
+            return False
+        age = time.time() - int(nonce.split('.')[0])
+        return 0 <= age <= self.nonce_lifetime
+
     def challenge_headers(self, stale=''):
         """
         Returns the http headers that ask for appropriate
         authorization.
         """
-        nonce  = md5.md5(
-            "%s:%s" % (time.time(), random.random())).hexdigest()
+        nonce  = self.make_nonce()
         opaque = md5.md5(
             "%s:%s" % (time.time(), random.random())).hexdigest()
-        self.nonce[nonce] = None
         parts = {'realm': self.realm, 'qop': 'auth',
                  'nonce': nonce, 'opaque': opaque }
         if stale:
@@ -163,6 +470,10 @@ class HttpDigestAuthentication(object):
     def is_authenticated(self, request):
         """
         Checks whether a request comes from an authorized user.
+        Sets request.stale_nonce if the response is right but
+        the nonce has expired, so that the challenge tells the
+        client to retry with a new nonce (see
+        get_challenge_headers).
         """
         
         # Make sure the request is a valid HttpDigest request
@@ -191,21 +502,25 @@ class HttpDigestAuthentication(object):
                 assert nonce and nc
         except:
             return False
+        if not self.is_signed_nonce(nonce):
+            return False
 
         # Compute response key    
         computed_response = self.get_auth_response(request.method, fullpath, username, nonce, realm, qop, cnonce, nc)
         
         # Compare server-side key with key from client
-        # Prevent replay attacks
         if not computed_response or computed_response != response:
-            if nonce in self.nonce:
-                del self.nonce[nonce]
-            return False
-        pnc = self.nonce.get(nonce,'00000000')
-        if nc <= pnc:
-            if nonce in self.nonce:
-                del self.nonce[nonce]
-            return False # stale = True
-        self.nonce[nonce] = nc
-        return True
+            return False
+        
+        # The client knows the password, but has to get a new
+        # nonce
+        if not self.is_valid_nonce(nonce):
+            request.stale_nonce = True
+            return False
+        
+        # Prevent replay attacks: each nonce count may be used
+        # once with the same nonce. add() checks and records it
+        # in one step, so concurrent requests can't both pass.
+        # Entries only need to outlive the nonce itself.
+        return self.nonce_store.add('nc:%s:%s' % (nonce, nc.lower()), True, self.nonce_lifetime)
     
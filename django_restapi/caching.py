@@ -0,0 +1,169 @@
+"""
+Response caches that can be plugged into
+model_resource.Collection to serve repeated GET requests
+without querying and rendering again. Cached responses are
+invalidated by a version counter per cache that is bumped
+by every write through the collection and by the save and
+delete signals of the cached models.
+"""
+from django.db.models import signals
+from django.http import HttpResponse
+from hashlib import sha1
+from store import LocalStore, CacheStore, has_shared_cache
+from urllib import urlencode
+import time
+
+# Number of seconds a version counter is kept
+VERSION_TIMEOUT = 30 * 24 * 3600
+
+class NoResponseCache(object):
+    """
+    No response cache: Handle every request.
+    """
+    def cached(self, request, func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+    def watch(self, model):
+        pass
+
+    def invalidate(self):
+        pass
+
+class ResponseCache(object):
+    """
+    Caches successful GET responses by path and query
+    parameters. A cached response is fresh while the version
+    counter is unchanged and it is younger than timeout.
+
+    Stale while revalidate: After the version changed or the
+    response expired, it may still be served for stale_seconds.
+    The first request that finds it stale renders it again;
+    concurrent requests get the stale response meanwhile
+    instead of all querying the database at once.
+    """
+    def __init__(self, name, store=None, timeout=300, stale_seconds=0, models=None):
+        """
+        name:
+            the name of the cache; it separates the keys and
+            the version counter of caches in a shared store
+        store:
+            the store that holds the responses and the
+            version counter. It must be shared by all
+            processes so that a write invalidates the
+            responses cached by the others.
+            Default: a store.CacheStore if Django's cache
+            backend is shared (e.g. memcached), otherwise a
+            store.LocalStore of this process; the latter
+            suits single-process deployments only, since
+            other processes serve their old responses until
+            they expire.
+        timeout:
+            the number of seconds a cached response is fresh
+        stale_seconds:
+            the number of seconds a stale response may be
+            served while it is rendered again; 0 to disable
+        models:
+            further models whose changes invalidate the cache,
+            e.g. models that are embedded via includes. The
+            model of the collection is always watched.
+        """
+        self.name = name
+        if store is None:
+            if has_shared_cache():
+                store = CacheStore(timeout=timeout + stale_seconds)
+            else:
+                store = LocalStore(timeout=timeout + stale_seconds)
+        self.store = store
+        self.timeout = timeout
+        self.stale_seconds = stale_seconds
+        for model in models or ():
+            self.watch(model)
+
+    def version_key(self):
+        return 'version:%s' % self.name
+
+    def get_version(self):
+        """
+        Returns the current version. Versions are the time of
+        the last invalidation in milliseconds, so that a version
+        that has been evicted from the store is not reused.
+        """
+        version = self.store.get(self.version_key())
+        if version is None:
+            version = int(time.time() * 1000)
+            if not self.store.add(self.version_key(), version, VERSION_TIMEOUT):
+                version = self.store.get(self.version_key(), version)
+        return version
+
+    def invalidate(self):
+        """
+        Bumps the version, which makes all cached responses stale.
+        """
+        version = self.store.get(self.version_key(), 0)
+        self.store.set(self.version_key(), max(version + 1, int(time.time() * 1000)), VERSION_TIMEOUT)
+
+    def watch(self, model):
+        """
+        Invalidates the cache whenever an instance of model is
+        saved or deleted.
+        """
+        uid = 'restapi.caching:%s:%s' % (self.name, model._meta)
+        signals.post_save.connect(self.model_changed, sender=model, weak=False, dispatch_uid=uid)
+        signals.post_delete.connect(self.model_changed, sender=model, weak=False, dispatch_uid=uid)
+
+    def model_changed(self, sender, **kwargs):
+        self.invalidate()
+
+    def get_key(self, request):
+        """
+        Returns the cache key of the response to request.
+        """
+        query = request.GET.items()
+        query.sort()
+        digest = sha1('%s?%s' % (request.path.encode('utf-8'), urlencode(
+            [(k, v.encode('utf-8')) for (k, v) in query]))).hexdigest()
+        return 'response:%s:%s' % (self.name, digest)
+
+    def cached(self, request, func, *args, **kwargs):
+        """
+        Returns the cached response to a GET request or calls
+        func to create it.
+        """
+        if request.method.upper() != 'GET':
+            return func(*args, **kwargs)
+        key = self.get_key(request)
+        version = self.get_version()
+        entry = self.store.get(key)
+        now = time.time()
+        if entry is not None:
+            entry_version, created, status, content, headers = entry
+            if entry_version == version and now < created + self.timeout:
+                return self.make_response(entry, 'hit')
+            if self.stale_seconds:
+                # Stale since the version changed or the response expired
+                if entry_version != version:
+                    stale_since = version / 1000.0
+                else:
+                    stale_since = created + self.timeout
+                if now < stale_since + self.stale_seconds and \
+                   not self.store.add('revalidate:%s' % key, True, self.stale_seconds):
+                    # Another request renders the response already
+                    return self.make_response(entry, 'stale')
+        response = func(*args, **kwargs)
+        if response.status_code == 200:
+            self.store.set(key, (version, now, response.status_code,
+                                 response.content, response.items()),
+                           self.timeout + self.stale_seconds)
+            response['X-Cache'] = 'miss'
+        if entry is not None and self.stale_seconds:
+            self.store.delete('revalidate:%s' % key)
+        return response
+
+    def make_response(self, entry, state):
+        entry_version, created, status, content, headers = entry
+        response = HttpResponse(content)
+        for header, value in headers:
+            response[header] = value
+        response.status_code = status
+        response['X-Cache'] = state
+        return response
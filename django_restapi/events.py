@@ -0,0 +1,255 @@
+"""
+Server-sent events: a resource that streams the changes of
+a collection (objects created, updated and deleted) to
+clients that keep a connection open, e.g. browsers with
+EventSource, instead of polling the collection.
+
+Events are recorded from model signals into a bounded
+in-process buffer shared by all clients. Each process only
+sees the changes made by itself, so with several worker
+processes, writes and streams must be served by the same
+process (or the clients must cope with resets, see
+EventStreamResource).
+
+Delivery is at most once: events are lost when they fall
+out of the buffer or the process ends before a client has
+received them.
+"""
+from django.core import signals as core_signals
+from django.core.serializers import python
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import signals
+from django.http import HttpResponse
+from django.utils import simplejson
+from resource import Resource
+import threading, time
+
+class EventBuffer(object):
+    """
+    Ring buffer of the most recent events. Event ids are
+    consecutive integers that start at the creation time of
+    the buffer in milliseconds, so ids of an earlier process
+    are recognized as unknown.
+    """
+    def __init__(self, max_events=1000):
+        """
+        max_events:
+            the number of events kept for clients that resume
+            or fall behind
+        """
+        self.max_events = max_events
+        self.events = []
+        self.last_id = int(time.time() * 1000)
+        self._condition = threading.Condition()
+
+    def append(self, event_type, data):
+        """
+        Adds an event and wakes up the waiting clients.
+        Returns the id of the event.
+        """
+        self._condition.acquire()
+        try:
+            self.last_id += 1
+            self.events.append((self.last_id, event_type, data))
+            if len(self.events) > self.max_events:
+                del self.events[:len(self.events) - self.max_events]
+            self._condition.notifyAll()
+            return self.last_id
+        finally:
+            self._condition.release()
+
+    def _get_after(self, last_id):
+        first_id = self.last_id - len(self.events) + 1
+        if last_id < first_id - 1 or last_id > self.last_id:
+            return None
+        return self.events[last_id - first_id + 1:]
+
+    def get_after(self, last_id, timeout=0):
+        """
+        Returns the events after the event with the id last_id,
+        waiting up to timeout seconds for one. Returns None if
+        the events after last_id are no longer (or were never)
+        in the buffer.
+        """
+        self._condition.acquire()
+        try:
+            events = self._get_after(last_id)
+            if events == [] and timeout > 0:
+                self._condition.wait(timeout)
+                events = self._get_after(last_id)
+            return events
+        finally:
+            self._condition.release()
+
+class EventStreamResource(Resource):
+    """
+    Streams the objects of a collection's model that are
+    created, updated or deleted as server-sent events
+    (text/event-stream) of the types "create", "update" and
+    "delete". The data of an event is the JSON representation
+    of the object with the fields exposed by the collection
+    (deleted objects: only "pk" and "model").
+
+    Clients resume from the last event they received with the
+    header Last-Event-ID (or the GET parameter "last_event_id").
+    If the events after it are no longer buffered, the client
+    gets a "reset" event and should reload the collection.
+    Without an id, the stream starts with the next change.
+
+    The signals of a write in a transaction (e.g. with the
+    TransactionMiddleware) are sent before it is committed.
+    Its events are therefore held back until the request has
+    finished and published only if the database confirms the
+    change: created and updated objects must exist (their
+    data is read again), deleted ones must be gone. Events of
+    a rolled back transaction are dropped, and so are updates
+    of objects that have been deleted meanwhile. Transactions
+    that end outside a request (e.g. in scripts) have to call
+    publish_pending() after they have been committed or
+    rolled back.
+    """
+    def __init__(self, collection, buffer=None, timeout=30, heartbeat=15,
+                 retry=3, authentication=None, throttling=None):
+        """
+        collection:
+            the model_resource.Collection whose changes are
+            streamed. Changes of all objects of its model are
+            streamed, including objects outside its queryset.
+        buffer:
+            the EventBuffer that holds the recent events.
+            Default: an EventBuffer for this resource
+        timeout:
+            the number of seconds a connection is held open;
+            the client reconnects afterwards (after retry
+            seconds), which frees the server thread regularly
+        heartbeat:
+            the number of seconds after which a comment is sent
+            if there are no events, so that proxies do not
+            close the connection
+        retry:
+            the number of seconds clients wait before they
+            reconnect
+        """
+        Resource.__init__(self, authentication, ('GET',), 'text/event-stream',
+                          throttling)
+        self.collection = collection
+        if buffer is None:
+            buffer = EventBuffer()
+        self.buffer = buffer
+        self.timeout = timeout
+        self.heartbeat = heartbeat
+        self.retry = retry
+        model = collection.queryset.model
+        uid = 'restapi.events:%d' % id(self)
+        signals.post_save.connect(self.saved, sender=model, weak=False, dispatch_uid=uid)
+        signals.post_delete.connect(self.deleted, sender=model, weak=False, dispatch_uid=uid)
+        core_signals.request_finished.connect(self.finished, weak=False, dispatch_uid=uid)
+        # Changes of the current thread's transaction
+        self._pending = threading.local()
+
+    def serialize(self, obj):
+        fields = self.collection.responder.expose_fields
+        return python.Serializer().serialize([obj], fields=fields)[0]
+
+    def publish(self, event_type, instance):
+        if event_type == 'delete':
+            data = {
+                'pk' : instance._get_pk_val(),
+                'model' : unicode(instance._meta),
+            }
+        else:
+            data = self.serialize(instance)
+        self.buffer.append(event_type, data)
+
+    def record(self, event_type, instance):
+        if not transaction.is_managed():
+            # Committed already
+            self.publish(event_type, instance)
+            return
+        pending = getattr(self._pending, 'changes', None)
+        if pending is None:
+            pending = self._pending.changes = []
+        pending.append((event_type, instance._get_pk_val()))
+
+    def saved(self, sender, instance, created=False, raw=False, **kwargs):
+        if raw:
+            # Loaded from a fixture
+            return
+        if created:
+            event_type = 'create'
+        else:
+            event_type = 'update'
+        self.record(event_type, instance)
+
+    def deleted(self, sender, instance, **kwargs):
+        self.record('delete', instance)
+
+    def publish_pending(self):
+        """
+        Publishes the changes of the current thread's last
+        transaction that the database confirms (see above).
+        """
+        pending = getattr(self._pending, 'changes', None)
+        if not pending:
+            return
+        self._pending.changes = None
+        model = self.collection.queryset.model
+        objects = model._default_manager.in_bulk(list(set([pk for (event_type, pk) in pending])))
+        for event_type, pk in pending:
+            obj = objects.get(pk)
+            if event_type == 'delete':
+                if obj is None:
+                    self.publish(event_type, model(pk=pk))
+            elif obj is not None:
+                self.publish(event_type, obj)
+
+    def finished(self, sender, **kwargs):
+        # The transactions of the request have ended
+        self.publish_pending()
+
+    def get_last_id(self, request):
+        """
+        Returns the id of the last event the client received,
+        or None.
+        """
+        value = request.META.get('HTTP_LAST_EVENT_ID', request.GET.get('last_event_id'))
+        if value is None:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            return -1
+
+    def format_event(self, event_id, event_type, data):
+        return 'id: %d\nevent: %s\ndata: %s\n\n' % (event_id, event_type,
+            simplejson.dumps(data, cls=DjangoJSONEncoder))
+
+    def stream(self, last_id):
+        """
+        Yields the events after last_id until the timeout.
+        """
+        yield 'retry: %d\n\n' % (self.retry * 1000)
+        deadline = time.time() + self.timeout
+        while True:
+            wait = max(0, min(self.heartbeat, deadline - time.time()))
+            events = self.buffer.get_after(last_id, wait)
+            if events is None:
+                last_id = self.buffer.last_id
+                yield 'id: %d\nevent: reset\ndata: \n\n' % last_id
+                continue
+            for event in events:
+                yield self.format_event(*event)
+                last_id = event[0]
+            if time.time() >= deadline:
+                break
+            if not events:
+                yield ': keepalive\n\n'
+
+    def read(self, request):
+        last_id = self.get_last_id(request)
+        if last_id is None:
+            last_id = self.buffer.last_id
+        response = HttpResponse(self.stream(last_id), mimetype=self.mimetype)
+        response['Cache-Control'] = 'no-cache'
+        return response
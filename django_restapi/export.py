@@ -0,0 +1,233 @@
+"""
+Streaming exports of whole collections as CSV or JSON, to an
+HTTP response (ExportResource) or a file (management command
+export_collection). The objects are read in chunks from a
+consistent snapshot of the database and serialized chunk by
+chunk, so memory use does not grow with the collection.
+"""
+from django.core.serializers import python
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils import simplejson
+from django.utils.encoding import smart_str
+from resource import Resource
+from routing import use_database, using_kwargs, get_connection
+from cStringIO import StringIO
+import csv, time
+
+FORMATS = {
+    'csv' : 'text/csv; charset=utf-8',
+    'json' : 'application/json',
+}
+
+# Statements that start a transaction whose reads all see the
+# same snapshot, by database backend
+SNAPSHOT_STATEMENTS = {
+    'postgresql' : 'SET TRANSACTION ISOLATION LEVEL REPEATABLE READ',
+    'postgresql_psycopg2' : 'SET TRANSACTION ISOLATION LEVEL REPEATABLE READ',
+    'postgis' : 'SET TRANSACTION ISOLATION LEVEL REPEATABLE READ',
+    'mysql' : 'START TRANSACTION WITH CONSISTENT SNAPSHOT',
+}
+
+def get_engine(connection):
+    """
+    Returns the name of the database backend of connection,
+    e.g. 'postgresql_psycopg2'.
+    """
+    # The module of a backend's DatabaseWrapper is
+    # <backend package>.base
+    return connection.__class__.__module__.split('.')[-2]
+
+class ExportReport(object):
+    """
+    Throughput of an export.
+    """
+    def __init__(self):
+        self.objects = 0
+        self.bytes = 0
+        self.started = time.time()
+        self.finished = None
+
+    def get_seconds(self):
+        return (self.finished or time.time()) - self.started
+
+    def __str__(self):
+        seconds = self.get_seconds()
+        rate = seconds and 1.0 / seconds or 0.0
+        return 'Exported %d objects (%d bytes) in %.2f s: %.0f objects/s, %.0f KB/s' % (
+            self.objects, self.bytes, seconds, self.objects * rate, self.bytes * rate / 1024)
+
+class Exporter(object):
+    """
+    Serializes all objects of a queryset. Django's database
+    backends fetch the whole result of a query before the
+    first row is returned (SQLite included), so the objects
+    are read in chunks by primary key (keyset pagination)
+    within one transaction. On PostgreSQL and MySQL the
+    transaction reads from one snapshot; on SQLite it does
+    anyway.
+    """
+    def __init__(self, queryset, fields=None, format='csv', chunk_size=1000,
+                 using=None):
+        """
+        queryset:
+            the objects to export
+        fields:
+            the names of the exported fields;
+            default: all fields
+        format:
+            'csv' (a header row with the field names, then one
+            row per object) or 'json' (a list of objects like
+            Django's JSON serializer)
+        chunk_size:
+            the number of objects read and serialized at once
+        using:
+            the alias of the database to read from (see
+            routing); default: the default database
+        """
+        if not FORMATS.has_key(format):
+            raise ValueError('Unknown export format %s.' % format)
+        self.queryset = use_database(queryset, using)
+        self.using = using
+        self.fields = [f for f in queryset.model._meta.fields
+                       if fields is None or f.name in fields]
+        self.format = format
+        self.chunk_size = chunk_size
+        self.report = ExportReport()
+
+    def iter_chunks(self):
+        """
+        Yields lists of objects read with one query per chunk
+        in a snapshot transaction.
+        """
+        pk_name = self.queryset.model._meta.pk.name
+        kwargs = using_kwargs(self.using)
+        connection = get_connection(self.using)
+        transaction.enter_transaction_management(**kwargs)
+        transaction.managed(True, **kwargs)
+        try:
+            # Connect first: the setup queries of a new
+            # connection (e.g. SET TIME ZONE) open a transaction.
+            # Then start a new transaction, so that the snapshot
+            # statement comes first in it and the snapshot is
+            # taken now.
+            cursor = connection.cursor()
+            transaction.commit(**kwargs)
+            statement = SNAPSHOT_STATEMENTS.get(get_engine(connection))
+            if statement:
+                cursor.execute(statement)
+            queryset = self.queryset.order_by(pk_name)
+            while True:
+                chunk = list(queryset[:self.chunk_size])
+                if chunk:
+                    yield chunk
+                if len(chunk) < self.chunk_size:
+                    break
+                queryset = self.queryset.order_by(pk_name).filter(
+                    **{'%s__gt' % pk_name : chunk[-1]._get_pk_val()})
+        finally:
+            # Nothing has been written
+            transaction.rollback(**kwargs)
+            transaction.leave_transaction_management(**kwargs)
+
+    def serialize_csv(self, chunk, header=False):
+        stream = StringIO()
+        writer = csv.writer(stream)
+        if header:
+            writer.writerow([f.name for f in self.fields])
+        for obj in chunk:
+            writer.writerow([smart_str(f.value_to_string(obj)) for f in self.fields])
+        return stream.getvalue()
+
+    def serialize_json(self, chunk, header=False):
+        objects = python.Serializer().serialize(chunk, fields=[f.name for f in self.fields])
+        data = ', '.join([simplejson.dumps(obj, cls=DjangoJSONEncoder) for obj in objects])
+        if not header:
+            data = ', ' + data
+        return data
+
+    def stream(self):
+        """
+        Yields the serialized objects in pieces of one chunk.
+        """
+        self.report = ExportReport()
+        serialize = getattr(self, 'serialize_%s' % self.format)
+        first = True
+        if self.format == 'json':
+            self.report.bytes += 1
+            yield '['
+        for chunk in self.iter_chunks():
+            data = serialize(chunk, first)
+            first = False
+            self.report.objects += len(chunk)
+            self.report.bytes += len(data)
+            yield data
+        if self.format == 'json':
+            data = ']'
+        elif first:
+            # No objects: only the header row
+            data = self.serialize_csv([], True)
+        else:
+            data = ''
+        self.report.bytes += len(data)
+        self.report.finished = time.time()
+        if data:
+            yield data
+
+    def write(self, file):
+        """
+        Writes the export to a file-like object and returns
+        the ExportReport.
+        """
+        for data in self.stream():
+            file.write(data)
+        return self.report
+
+class ExportResource(Resource):
+    """
+    Streams all objects of a collection with the fields it
+    exposes as a CSV or JSON download. The GET parameter
+    "format" selects the format (default: see format).
+    """
+    def __init__(self, collection, format='csv', chunk_size=1000, report_func=None,
+                 authentication=None, throttling=None):
+        """
+        collection:
+            the model_resource.Collection to export
+        format:
+            the default format, 'csv' or 'json'
+        chunk_size:
+            see Exporter
+        report_func:
+            function that is called with the ExportReport
+            when an export is complete, e.g. to log it
+        """
+        Resource.__init__(self, authentication, ('GET',), FORMATS[format], throttling)
+        self.collection = collection
+        self.format = format
+        self.chunk_size = chunk_size
+        self.report_func = report_func
+
+    def stream(self, exporter):
+        for data in exporter.stream():
+            yield data
+        if self.report_func is not None:
+            self.report_func(exporter.report)
+
+    def read(self, request):
+        format = request.GET.get('format', self.format)
+        if not FORMATS.has_key(format):
+            response = HttpResponse('Unknown format.', mimetype='text/plain')
+            response.status_code = 400
+            return response
+        exporter = Exporter(self.collection.queryset._clone(),
+                            self.collection.responder.expose_fields,
+                            format, self.chunk_size,
+                            self.collection.routing.db_for_read(request))
+        # The response is streamed after the request has been
+        # finished; the exporter reads the database then.
+        response = HttpResponse(self.stream(exporter), mimetype=FORMATS[format])
+        response['Content-Disposition'] = 'attachment; filename=%s.%s' % (
+            self.collection.queryset.model._meta.module_name, format)
+        return response
@@ -0,0 +1,308 @@
+"""
+Bulk imports: a resource that accepts a streamed CSV or
+NDJSON (one JSON object per line) upload, validates each row
+with the form class of a collection and saves the valid rows
+in batches, one transaction per batch. The progress and the
+rows that failed are reported by a status sub-resource that
+clients can poll while the import is running.
+"""
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils import simplejson
+from django.utils.encoding import force_unicode
+from django.utils.translation import ugettext as _
+from resource import Resource, get_body_stream, reverse
+from receiver import InvalidFormData, RequestEntityTooLarge
+from routing import save_form, using_kwargs, get_connection
+from store import LocalStore
+from cStringIO import StringIO
+from hashlib import sha1
+import csv, random, tempfile, threading, time
+
+# Import formats by content type
+CONTENT_TYPES = {
+    'text/csv' : 'csv',
+    'application/x-ndjson' : 'ndjson',
+}
+
+class LineCounter(object):
+    """
+    Iterates over the lines of a file and counts the bytes of
+    the lines that have been consumed. Unlike file.tell(), the
+    count does not include what the file has read ahead.
+    """
+    def __init__(self, file):
+        self.file = file
+        self.consumed = 0
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        line = self.file.next()
+        self.consumed += len(line)
+        return line
+
+class ImportResource(Resource):
+    """
+    POST a CSV document (content type text/csv, header row
+    with the field names) or NDJSON (application/x-ndjson) to
+    import its rows into a collection; the GET parameter
+    "format" ('csv' or 'ndjson') overrides the content type.
+    The response is the status of the import (202 Accepted
+    while it runs in the background, 200 OK when it is done)
+    with the URL of the status sub-resource in the Location
+    header. GET <import URL>/<id>/ returns the status: a JSON
+    object with the keys "id", "state" ('running', 'done' or
+    'failed'), "rows", "imported", "failed", "progress"
+    (fraction of the upload processed), "errors" (list of
+    objects with "row" and "errors") and "batches".
+    """
+    def __init__(self, collection, batch_size=500, max_errors=100, background=False,
+                 store=None, status_timeout=86400, authentication=None,
+                 throttling=None, max_body_size=None):
+        """
+        collection:
+            the model_resource.Collection the rows are added
+            to; its form_class validates them
+        batch_size:
+            the number of rows saved per transaction
+        max_errors:
+            the maximum number of failed rows whose errors
+            are reported
+        background:
+            if True, the upload is stored in a temporary file
+            and imported by a thread while the POST request
+            returns 202 Accepted; otherwise it is imported
+            before the request returns
+        store:
+            the store that holds the status of imports, e.g.
+            a store.CacheStore shared by all processes.
+            Default: a store.LocalStore of this process
+        status_timeout:
+            the number of seconds the status of an import
+            is kept
+        max_body_size:
+            the maximum size in bytes of an upload;
+            default: no limit
+        """
+        Resource.__init__(self, authentication, ('GET', 'POST'), 'application/json',
+                          throttling, max_body_size)
+        self.collection = collection
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.background = background
+        if store is None:
+            store = LocalStore(timeout=status_timeout)
+        self.store = store
+        self.status_timeout = status_timeout
+
+    def get_status(self, import_id):
+        return self.store.get('import:%s' % import_id)
+
+    def set_status(self, status):
+        # Store a copy; a running import keeps changing status
+        status = dict(status, errors=list(status['errors']))
+        self.store.set('import:%s' % status['id'], status, self.status_timeout)
+
+    def get_format(self, request):
+        format = request.GET.get('format')
+        if format is None:
+            content_type = request.META.get('CONTENT_TYPE', '').split(';')[0].strip()
+            format = CONTENT_TYPES.get(content_type)
+        if format not in CONTENT_TYPES.values():
+            raise InvalidFormData
+        return format
+
+    def spool(self, request):
+        """
+        Copies the request body to a temporary file and
+        returns the file and its size.
+        """
+        try:
+            size = int(request.META.get('CONTENT_LENGTH', 0) or 0)
+        except ValueError:
+            raise InvalidFormData
+        if self.max_body_size is not None and size > self.max_body_size:
+            raise RequestEntityTooLarge
+        if hasattr(request, '_raw_post_data'):
+            stream = StringIO(request.raw_post_data)
+        else:
+            stream = get_body_stream(request)
+        file = tempfile.TemporaryFile()
+        remaining = size
+        while remaining > 0:
+            data = stream.read(min(remaining, 65536))
+            if not data:
+                break
+            file.write(data)
+            remaining -= len(data)
+        file.seek(0)
+        return file, size - remaining
+
+    def iter_rows(self, file, format):
+        """
+        Yields the rows of the upload as dictionaries, or
+        None for rows that cannot be decoded.
+        """
+        if format == 'csv':
+            reader = csv.reader(file)
+            try:
+                names = reader.next()
+            except StopIteration:
+                return
+            for values in reader:
+                if values:
+                    values = [force_unicode(value, errors='replace') for value in values]
+                    yield dict(zip(names, values))
+        else:
+            for line in file:
+                if not line.strip():
+                    continue
+                try:
+                    row = simplejson.loads(line)
+                except ValueError:
+                    row = None
+                if not isinstance(row, dict):
+                    yield None
+                else:
+                    yield dict([(str(k), v) for (k, v) in row.items()])
+
+    def add_error(self, status, row_number, errors):
+        status['failed'] += 1
+        if len(status['errors']) < self.max_errors:
+            status['errors'].append({'row' : row_number, 'errors' : errors})
+
+    def save_batch(self, batch, status, using):
+        """
+        Saves the forms of batch (pairs of row number and form)
+        in one transaction. If that fails, the rows are saved
+        one by one, so that only the failing rows are lost.
+        """
+        kwargs = using_kwargs(using)
+        try:
+            for row_number, form in batch:
+                save_form(form, using)
+            transaction.commit(**kwargs)
+            status['imported'] += len(batch)
+            return
+        except Exception:
+            transaction.rollback(**kwargs)
+        pk = self.collection.queryset.model._meta.pk
+        for row_number, form in batch:
+            if pk.primary_key and pk.auto_created:
+                # Forget the keys assigned by the rolled back inserts
+                setattr(form.instance, pk.attname, None)
+            try:
+                save_form(form, using)
+                transaction.commit(**kwargs)
+                status['imported'] += 1
+            except Exception, e:
+                transaction.rollback(**kwargs)
+                self.add_error(status, row_number, {'__all__' : [force_unicode(e)]})
+
+    def run(self, status, file, size, format, using):
+        """
+        Imports the rows of file and updates status after
+        each batch.
+        """
+        ResourceForm = self.collection.get_form_class()
+        kwargs = using_kwargs(using)
+        transaction.enter_transaction_management(**kwargs)
+        transaction.managed(True, **kwargs)
+        lines = LineCounter(file)
+        try:
+            try:
+                batch = []
+                for row in self.iter_rows(lines, format):
+                    status['rows'] += 1
+                    if row is None:
+                        self.add_error(status, status['rows'], {'__all__' : [_('Invalid row.')]})
+                        continue
+                    form = ResourceForm(row)
+                    if not form.is_valid():
+                        self.add_error(status, status['rows'], dict([
+                            (name, [force_unicode(e) for e in errors])
+                            for (name, errors) in form.errors.items()]))
+                        continue
+                    batch.append((status['rows'], form))
+                    if len(batch) == self.batch_size:
+                        self.save_batch(batch, status, using)
+                        batch = []
+                        status['batches'] += 1
+                        status['progress'] = size and min(1.0, float(lines.consumed) / size) or 1.0
+                        self.set_status(status)
+                if batch:
+                    self.save_batch(batch, status, using)
+                    status['batches'] += 1
+                status['state'] = 'done'
+            except Exception:
+                status['state'] = 'failed'
+                transaction.rollback(**kwargs)
+                raise
+        finally:
+            transaction.leave_transaction_management(**kwargs)
+            file.close()
+            status['progress'] = 1.0
+            status['finished'] = time.time()
+            self.set_status(status)
+
+    def run_in_background(self, status, file, size, format, using):
+        try:
+            try:
+                self.run(status, file, size, format, using)
+            except Exception:
+                pass # Reported as state 'failed'
+        finally:
+            # The thread's connection to the database of the import
+            get_connection(using).close()
+
+    def create(self, request, import_id=''):
+        if import_id:
+            # Status sub-resources are read-only
+            return self.not_found()
+        format = self.get_format(request)
+        file, size = self.spool(request)
+        status = {
+            'id' : sha1('%s%s' % (random.random(), time.time())).hexdigest()[:16],
+            'state' : 'running',
+            'rows' : 0,
+            'imported' : 0,
+            'failed' : 0,
+            'errors' : [],
+            'batches' : 0,
+            'progress' : 0.0,
+            'started' : time.time(),
+            'finished' : None,
+        }
+        self.set_status(status)
+        using = self.collection.routing.db_for_write(request)
+        if self.background:
+            thread = threading.Thread(target=self.run_in_background,
+                                      args=(status, file, size, format, using))
+            thread.setDaemon(True)
+            thread.start()
+            response = self.render_status(self.get_status(status['id']))
+            response.status_code = 202
+        else:
+            self.run(status, file, size, format, using)
+            response = self.render_status(status)
+        self.collection.routing.written(request)
+        response['Location'] = reverse(self, (status['id'],))
+        return response
+
+    def render_status(self, status):
+        response = HttpResponse(mimetype=self.mimetype)
+        simplejson.dump(status, response)
+        return response
+
+    def read(self, request, import_id=''):
+        status = self.get_status(import_id)
+        if status is None:
+            return self.not_found()
+        return self.render_status(status)
+
+    def not_found(self):
+        response = HttpResponse(_('Not Found'), mimetype='text/plain')
+        response.status_code = 404
+        return response
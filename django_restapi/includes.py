@@ -0,0 +1,176 @@
+"""
+Compound documents: related objects embedded in the
+representation of a collection or entry, e.g. the choices
+of the polls in /polls/?include=choice_set. The related
+objects of each relation are loaded with one query for all
+objects of the response and serialized (JSON, XML) below
+the object they belong to.
+"""
+
+class InvalidInclude(Exception):
+    """
+    Raised if the requested includes are not declared or
+    exceed the depth or size limits.
+    """
+
+class Includes(object):
+    """
+    Declares the relations a collection may include and the
+    limits that apply to them.
+    """
+    def __init__(self, relations, max_depth=2, max_size=1000):
+        """
+        relations:
+            dictionary that maps relation paths to the names of
+            the fields of the related objects that are exposed
+            (None: all fields). A path is the name of a
+            ForeignKey (e.g. 'poll') or of the accessor of a
+            reverse ForeignKey (e.g. 'choice_set'), optionally
+            following other declared paths ('choice_set.poll').
+        max_depth:
+            the maximum number of relations in a path
+        max_size:
+            the maximum total number of included objects of
+            a response
+        """
+        self.relations = relations
+        self.max_depth = max_depth
+        self.max_size = max_size
+
+    def parse(self, request):
+        """
+        Returns the sorted relation paths requested by the GET
+        parameter "include" (comma separated), including the
+        paths they extend.
+        """
+        paths = {}
+        for value in request.GET.getlist('include'):
+            for path in value.split(','):
+                path = path.strip()
+                if not path:
+                    continue
+                names = path.split('.')
+                if len(names) > self.max_depth:
+                    raise InvalidInclude('Include %s is nested too deeply.' % path)
+                for i in range(1, len(names) + 1):
+                    prefix = '.'.join(names[:i])
+                    if not self.relations.has_key(prefix):
+                        raise InvalidInclude('Include %s is not available.' % prefix)
+                    paths[prefix] = True
+        paths = paths.keys()
+        paths.sort()
+        return paths
+
+    def load(self, objects, paths):
+        """
+        Loads the related objects of objects for each path
+        with a single query per path. Returns an
+        IncludedObjects instance.
+        """
+        included = IncludedObjects(self)
+        remaining = self.max_size
+        # Parents sort before the paths that extend them
+        for path in paths:
+            if '.' in path:
+                parent_path, name = path.rsplit('.', 1)
+                sources = included.all(parent_path)
+            else:
+                name = path
+                sources = objects
+            related = load_relation(sources, name, remaining + 1)
+            for objs in related.values():
+                remaining -= len(objs)
+            if remaining < 0:
+                raise InvalidInclude('Too many included objects (more than %d).' % self.max_size)
+            included.add(path, related)
+        return included
+
+def get_relation(model, name):
+    """
+    Returns (field, related model, is_reverse) for the
+    ForeignKey named name or the reverse ForeignKey with
+    accessor name.
+    """
+    for field in model._meta.fields:
+        if field.name == name and field.rel is not None:
+            return field, field.rel.to, False
+    for related in model._meta.get_all_related_objects():
+        if related.get_accessor_name() == name:
+            return related.field, related.model, True
+    raise InvalidInclude('%s has no relation %s.' % (model._meta.object_name, name))
+
+def load_relation(sources, name, limit):
+    """
+    Returns a dictionary that maps the primary keys of
+    sources to lists of their objects related by name.
+    At most limit related objects are loaded.
+    """
+    result = {}
+    if not sources:
+        return result
+    field, related_model, is_reverse = get_relation(sources[0].__class__, name)
+    if is_reverse:
+        pks = [obj._get_pk_val() for obj in sources]
+        queryset = related_model._default_manager.filter(**{'%s__in' % field.name : pks})
+        pk_name = related_model._meta.pk.name
+        for obj in queryset.order_by(pk_name)[:limit]:
+            result.setdefault(getattr(obj, field.attname), []).append(obj)
+    else:
+        target_pks = {}
+        for obj in sources:
+            value = getattr(obj, field.attname)
+            if value is not None:
+                target_pks[value] = True
+        to_field = field.rel.get_related_field().name
+        queryset = related_model._default_manager.filter(**{'%s__in' % to_field : target_pks.keys()})
+        targets = {}
+        for obj in queryset[:limit]:
+            targets[getattr(obj, to_field)] = obj
+        for obj in sources:
+            target = targets.get(getattr(obj, field.attname))
+            if target is not None:
+                result[obj._get_pk_val()] = [target]
+    return result
+
+class IncludedObjects(object):
+    """
+    The related objects loaded for a response, by relation
+    path and primary key of the object they belong to.
+    """
+    def __init__(self, includes):
+        self.includes = includes
+        self.paths = []
+        self.related = {}
+
+    def add(self, path, related):
+        self.paths.append(path)
+        self.related[path] = related
+
+    def all(self, path):
+        """
+        Returns all objects loaded for path.
+        """
+        result = []
+        for objs in self.related.get(path, {}).values():
+            result.extend(objs)
+        return result
+
+    def get(self, path, pk):
+        return self.related.get(path, {}).get(pk, [])
+
+    def children(self, path):
+        """
+        Returns (name, path, exposed fields) for the paths
+        that directly extend path ('' for the top level).
+        """
+        result = []
+        for child in self.paths:
+            if path:
+                if not child.startswith(path + '.'):
+                    continue
+                name = child[len(path) + 1:]
+            else:
+                name = child
+            if '.' not in name:
+                result.append((name, child, self.includes.relations[child]))
+        return result
@@ -0,0 +1,137 @@
+"""
+Instrumentation classes that can be plugged into resources
+to measure how long each phase of a request takes
+(authentication, query, rendering, ...). The measurements
+are collected in histograms per resource and phase and can
+be exported in the Prometheus text format, e.g. with
+resource.MetricsResource.
+"""
+from bisect import bisect_left
+import threading, time
+
+# Upper bounds of the histogram buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram(object):
+    """
+    Counts observed durations in buckets with fixed upper bounds.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        """
+        Returns (upper bound, number of observations <= upper bound)
+        pairs, ending with the +Inf bucket.
+        """
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+class MetricsRegistry(object):
+    """
+    Holds one histogram per resource name and phase.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS, metric_name='restapi_phase_duration_seconds'):
+        self.buckets = buckets
+        self.metric_name = metric_name
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, resource_name, phase, seconds):
+        key = (resource_name, phase)
+        self._lock.acquire()
+        try:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+        finally:
+            self._lock.release()
+
+    def render(self):
+        """
+        Returns all histograms in the Prometheus text
+        exposition format.
+        """
+        name = self.metric_name
+        lines = [
+            '# HELP %s Time spent in each phase of a request.' % name,
+            '# TYPE %s histogram' % name,
+        ]
+        self._lock.acquire()
+        try:
+            keys = self.histograms.keys()
+            keys.sort()
+            for key in keys:
+                histogram = self.histograms[key]
+                labels = 'resource="%s",phase="%s"' % tuple([escape_label(k) for k in key])
+                for bound, count in histogram.cumulative_counts():
+                    lines.append('%s_bucket{%s,le="%s"} %d' % (name, labels, bound, count))
+                lines.append('%s_sum{%s} %f' % (name, labels, histogram.sum))
+                lines.append('%s_count{%s} %d' % (name, labels, histogram.count))
+        finally:
+            self._lock.release()
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self.histograms = {}
+        finally:
+            self._lock.release()
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+# Registry used by Instrumentation instances by default
+default_registry = MetricsRegistry()
+
+class NoInstrumentation(object):
+    """
+    No instrumentation: Call functions without measuring them.
+    """
+    def timed(self, phase, func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+class Instrumentation(object):
+    """
+    Measures the phases of the requests to a resource and
+    records the durations in a MetricsRegistry.
+    """
+    def __init__(self, name, registry=None):
+        """
+        name:
+            the name the resource has in the metrics
+            (label "resource")
+        registry:
+            the MetricsRegistry that collects the durations.
+            Default: default_registry
+        """
+        self.name = name
+        if registry is None:
+            registry = default_registry
+        self.registry = registry
+
+    def timed(self, phase, func, *args, **kwargs):
+        """
+        Calls func with the given arguments and records
+        how long it took as the duration of phase.
+        """
+        start = time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.registry.observe(self.name, phase, time.time() - start)
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import get_model
+from django_restapi.export import Exporter, FORMATS
+from optparse import make_option
+import sys
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--format', default='csv', dest='format',
+            help='Export format: csv or json.'),
+        make_option('--output', default=None, dest='output',
+            help='File to write the export to; default: standard output.'),
+        make_option('--chunk-size', default=1000, dest='chunk_size', type='int',
+            help='Number of objects read and serialized at once.'),
+        make_option('--database', default=None, dest='database',
+            help='Alias of the database to read from; default: the default database.'),
+    )
+    help = ('Streams all objects of a collection resource (with the fields it exposes) '
+            'or of a model to a CSV or JSON file and reports the throughput.')
+    args = '<module.collection_resource | appname.ModelName>'
+
+    def get_exporter(self, label, format, chunk_size, using=None):
+        """
+        Returns an Exporter for a Collection named by its
+        module and variable or for all objects of a model.
+        """
+        if '.' not in label:
+            raise CommandError('Enter a collection as module.variable or a model '
+                               'as appname.ModelName: %s' % label)
+        module_name, name = label.rsplit('.', 1)
+        if '.' not in module_name:
+            model = get_model(module_name, name)
+            if model is None:
+                raise CommandError('Unknown model: %s' % label)
+            return Exporter(model._default_manager.all(), None, format, chunk_size, using)
+        try:
+            module = __import__(module_name, {}, {}, [name])
+            collection = getattr(module, name)
+        except (ImportError, AttributeError):
+            raise CommandError('Unknown collection: %s' % label)
+        return Exporter(collection.queryset._clone(), collection.responder.expose_fields,
+                        format, chunk_size, using)
+
+    def handle(self, *labels, **options):
+        if len(labels) != 1:
+            raise CommandError('Enter a collection resource or a model to export.')
+        format = options.get('format', 'csv')
+        if not FORMATS.has_key(format):
+            raise CommandError('Unknown format: %s' % format)
+        exporter = self.get_exporter(labels[0], format, options.get('chunk_size', 1000),
+                                     options.get('database'))
+        output = options.get('output')
+        if output:
+            file = open(output, 'wb')
+        else:
+            file = sys.stdout
+        try:
+            report = exporter.write(file)
+        finally:
+            if output:
+                file.close()
+        sys.stderr.write('%s\n' % report)
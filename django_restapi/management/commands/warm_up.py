@@ -0,0 +1,15 @@
+from django.core.management.base import NoArgsCommand
+from django_restapi.warmup import warm_up
+from optparse import make_option
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--urlconf', default=None, dest='urlconf',
+            help='Module with the urlpatterns to warm up; default: settings.ROOT_URLCONF.'),
+    )
+    help = ('Builds the form classes, templates, serializers and URL resolver of all '
+            'resources like a worker does before it takes traffic, and reports the timings.')
+
+    def handle_noargs(self, **options):
+        report = warm_up(options.get('urlconf'))
+        return str(report)
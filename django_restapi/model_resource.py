@@ -1,15 +1,21 @@
 """
 Model-bound resource class.
 """
-from django import forms
-from django.conf.urls.defaults import patterns
-from django.http import *
+from django.db.models import Q
+from django.http import Http404, HttpResponse
 from django.forms import ModelForm, models
 from django.forms.util import ErrorDict
 from django.utils.functional import curry
 from django.utils.translation.trans_null import _
+from authentication import get_challenge_headers
 from resource import ResourceBase, load_put_and_files, reverse, HttpMethodNotAllowed
-from receiver import FormReceiver
+from throttling import retry_after
+from querydebug import NoQueryInspection
+from routing import NoRouting, READ_METHODS, use_database, save_form
+from caching import NoResponseCache
+from sync import NoChangeFeed, SyncError
+from receiver import FormReceiver, BoundReceiver, InvalidFormData, RequestEntityTooLarge
+import copy
 
 class InvalidModelData(Exception):
     """
@@ -27,7 +33,10 @@ class Collection(ResourceBase):
     """
     def __init__(self, queryset, responder, receiver=None, authentication=None,
                  permitted_methods=None, expose_fields=None, entry_class=None,
-                 form_class=None):
+                 form_class=None, throttling=None, max_body_size=None,
+                 instrumentation=None, query_inspection=None, profiling=None,
+                 includes=None, routing=None, response_cache=None,
+                 change_feed=None):
         """
         queryset:
             determines the subset of objects (of a Django model)
@@ -54,6 +63,39 @@ class Collection(ResourceBase):
         form_class:
             base form class used for data validation and
             conversion in self.create() and Entry.update()
+        throttling:
+            the throttling instance that checks whether a client
+            has exceeded its request rate
+        max_body_size:
+            the maximum size in bytes of PUT request bodies;
+            default: no limit
+        instrumentation:
+            the instrumentation instance that measures the
+            phases of each request
+        query_inspection:
+            the query inspection instance that records the SQL
+            queries of each request, e.g. a QueryInspector with
+            a query budget (see querydebug)
+        profiling:
+            the profiling instance that decides which requests
+            are profiled, e.g. a profiling.SamplingProfiler
+        includes:
+            an includes.Includes instance that declares the
+            related objects clients may request to be embedded
+            with the GET parameter "include"
+        routing:
+            the routing instance that chooses the database of
+            each request, e.g. a routing.ReplicaRouting that
+            serves reads from a replica
+        response_cache:
+            the response cache instance that serves repeated GET
+            requests, e.g. a caching.ResponseCache. Cached
+            responses are shared by all clients, so it must
+            not be used if a response depends on the client.
+        change_feed:
+            a sync.ChangeFeed that lets clients fetch only the
+            objects changed and deleted since a token (GET
+            parameter "since"); needs a SerializeResponder
         """
         # Available data
         self.queryset = queryset
@@ -67,12 +109,16 @@ class Collection(ResourceBase):
         if not form_class:
             form_class = ModelForm
         self.form_class = form_class
+        # Form classes by model (see get_form_class()); shared
+        # with the copies made by NestedCollection.bind()
+        self.form_classes = {}
         
         # Output format / responder setup
         self.responder = responder
         if not expose_fields:
             expose_fields = [field.name for field in queryset.model._meta.fields]
         responder.expose_fields = expose_fields
+        responder.includes = includes
         if hasattr(responder, 'create_form'):
             responder.create_form = curry(responder.create_form, queryset=queryset, form_class=form_class)
         if hasattr(responder, 'update_form'):
@@ -83,25 +129,105 @@ class Collection(ResourceBase):
             entry_class = Entry
         self.entry_class = entry_class
         
-        ResourceBase.__init__(self, authentication, permitted_methods)
+        # Databases
+        if not routing:
+            routing = NoRouting()
+        self.routing = routing
+        
+        # Caching
+        if not response_cache:
+            response_cache = NoResponseCache()
+        self.response_cache = response_cache
+        response_cache.watch(queryset.model)
+        
+        # Incremental synchronization
+        if not change_feed:
+            change_feed = NoChangeFeed()
+        self.change_feed = change_feed
+        
+        # The resource object in the URLconf (see routed())
+        self.root = self
+        
+        # Debugging
+        if not query_inspection:
+            query_inspection = NoQueryInspection()
+        self.query_inspection = query_inspection
+        
+        ResourceBase.__init__(self, authentication, permitted_methods,
+                              throttling, max_body_size, instrumentation,
+                              profiling)
+        responder.instrumentation = self.instrumentation
+    
+    def get_form_class(self, model=None):
+        """
+        Returns the form class for model (default: the model
+        of the queryset), built with form_class as base class
+        by the first call.
+        """
+        if model is None:
+            model = self.queryset.model
+        try:
+            return self.form_classes[model]
+        except KeyError:
+            ResourceForm = models.modelform_factory(model, form=self.form_class)
+            self.form_classes[model] = ResourceForm
+            return ResourceForm
+    
+    def warm_up(self):
+        """
+        Builds the form class and prepares the responder.
+        """
+        self.get_form_class()
+        if hasattr(self.responder, 'warm_up'):
+            self.responder.warm_up(self.queryset.model)
+        if not isinstance(self.change_feed, NoChangeFeed):
+            # Loads the serializers of change feeds
+            import serialization
     
     def __call__(self, request, *args, **kwargs):
+        """
+        Handles a request, recording its queries if
+        query inspection is enabled and profiling it if
+        it is one of the sampled requests.
+        """
+        return self.query_inspection.inspect(self.profiling.profiled,
+            request, self.handle_request, request, *args, **kwargs)
+    
+    def handle_request(self, request, *args, **kwargs):
         """
         Redirects to one of the CRUD methods depending 
         on the HTTP method of the request. Checks whether
         the requested method is allowed for this resource.
         Catches errors.
         """
+        # Refuse clients with too many failed authentications
+        # before their credentials are checked again
+        wait = self.throttling.check_failures(request)
+        if wait:
+            response = self.responder.error(request, 429)
+            response['Retry-After'] = retry_after(wait)
+            return response
+        
         # Check authentication
-        if not self.authentication.is_authenticated(request):
+        if not self.instrumentation.timed('authentication',
+                self.authentication.is_authenticated, request):
+            self.throttling.failed(request)
             response = self.responder.error(request, 401)
-            challenge_headers = self.authentication.challenge_headers()
+            challenge_headers = get_challenge_headers(self.authentication, request)
             for k,v in challenge_headers.items():
                 response[k] = v
             return response
         
-        # Remove queryset cache
-        self.queryset = self.queryset._clone()
+        # Check request rate before any query is run
+        wait = self.throttling.check(request)
+        if wait:
+            response = self.responder.error(request, 429)
+            response['Retry-After'] = retry_after(wait)
+            return response
+        
+        # Handle the request with a copy of this collection
+        # whose queryset uses the chosen database
+        collection = self.routed(request)
         
         # Determine whether the collection or a specific
         # entry is requested. If not specified as a keyword
@@ -113,14 +239,45 @@ class Collection(ResourceBase):
             eval_args = tuple([x for x in args if x != ''])
             is_entry = bool(eval_args or kwargs)
         
+        response = self.response_cache.cached(request, collection.respond,
+                                              request, is_entry, *args, **kwargs)
+        if request.method.upper() not in READ_METHODS and response.status_code < 400:
+            self.response_cache.invalidate()
+        return response
+    
+    def routed(self, request):
+        """
+        Returns a copy of this collection for request whose
+        queryset (without result cache) uses the database that
+        routing chooses for the request method. Each request
+        is handled by its own copy, so concurrent reads and
+        writes do not change each other's database.
+        """
+        if request.method.upper() in READ_METHODS:
+            using = self.routing.db_for_read(request)
+        else:
+            using = self.routing.db_for_write(request)
+        routed = copy.copy(self)
+        routed.queryset = use_database(self.queryset._clone(), using)
+        return routed
+    
+    def respond(self, request, is_entry, *args, **kwargs):
+        """
+        Calls the CRUD method of the collection or of the
+        entry identified by args/kwargs and maps errors to
+        error responses.
+        """
         # Redirect either to entry method
         # or to collection method. Catch errors.
         try:
             if is_entry:
-                entry = self.get_entry(*args, **kwargs)
-                return self.dispatch(request, entry)
+                entry = self.instrumentation.timed('query',
+                    self.get_entry, *args, **kwargs)
+                return self.instrumentation.timed('dispatch',
+                    self.dispatch, request, entry)
             else:
-                return self.dispatch(request, self)
+                return self.instrumentation.timed('dispatch',
+                    self.dispatch, request, self)
         except HttpMethodNotAllowed:
             response = self.responder.error(request, 405)
             response['Allow'] = ', '.join(self.permitted_methods)
@@ -129,6 +286,10 @@ class Collection(ResourceBase):
             return self.responder.error(request, 404)
         except InvalidModelData, i:
             return self.responder.error(request, 400, i.errors)
+        except RequestEntityTooLarge:
+            return self.responder.error(request, 413)
+        except InvalidFormData:
+            return self.responder.error(request, 400)
         
         # No other methods allowed: 400 Bad Request
         return self.responder.error(request, 400)
@@ -139,7 +300,7 @@ class Collection(ResourceBase):
         redirects to the resource URI. 
         """
         # Create form filled with POST data
-        ResourceForm = models.modelform_factory(self.queryset.model, form=self.form_class)
+        ResourceForm = self.get_form_class()
         data = self.receiver.get_post_data(request)
         form = ResourceForm(data)
         
@@ -148,7 +309,8 @@ class Collection(ResourceBase):
         # URI in the location header and a representation
         # of the model in the response body.
         if form.is_valid():
-            new_model = form.save()
+            new_model = save_form(form, self.routing.db_for_write(request))
+            self.routing.written(request)
             model_entry = self.entry_class(self, new_model)
             response = model_entry.read(request)
             response.status_code = 201
@@ -164,7 +326,17 @@ class Collection(ResourceBase):
         The format depends on which responder (e.g. JSONResponder)
         is assigned to this ModelResource instance. Usually called by a
         HTTP request to the factory URI with method GET.
+        With a change feed, the GET parameter "since" limits
+        the representation to the changes after a token.
         """
+        if request.GET.has_key('since'):
+            try:
+                changes = self.instrumentation.timed('query',
+                    self.change_feed.get_changes, self.queryset, request.GET['since'])
+            except SyncError:
+                return self.responder.error(request, 400)
+            if changes is not None:
+                return self.responder.changes(request, changes)
         return self.responder.list(request, self.queryset)
     
     def get_entry(self, pk_value):
@@ -189,7 +361,7 @@ class Entry(object):
         Returns the URL for this resource object.
         """
         pk_value = getattr(self.model, self.model._meta.pk.name)
-        return reverse(self.collection, (pk_value,))
+        return reverse(self.collection.root, (pk_value,))
     
     def create(self, request):
         raise Http404
@@ -210,7 +382,7 @@ class Entry(object):
         request to the resource URI with method PUT.
         """
         # Create a form from the model/PUT data
-        ResourceForm = models.modelform_factory(self.model.__class__, form=self.collection.form_class)
+        ResourceForm = self.collection.get_form_class(self.model.__class__)
         data = self.collection.receiver.get_put_data(request)
 
         form = ResourceForm(data, instance=self.model)
@@ -221,7 +393,8 @@ class Entry(object):
         # URI in the location header and a representation
         # of the model in the response body.
         if form.is_valid():
-            form.save()
+            save_form(form, self.collection.routing.db_for_write(request))
+            self.collection.routing.written(request)
             response = self.read(request)
             response.status_code = 200
             response['Location'] = self.get_url()
@@ -236,7 +409,145 @@ class Entry(object):
         Usually called by a HTTP request to the entry URI
         with method DELETE.
         """
+        pk_value = self.model._get_pk_val()
         self.model.delete()
+        self.collection.change_feed.deleted(self.model.__class__, pk_value,
+            self.collection.routing.db_for_write(request))
+        self.collection.routing.written(request)
         return HttpResponse(_("Object successfully deleted."), self.collection.responder.mimetype)
+
+class NestedCollection(Collection):
+    """
+    Resource for the models that belong to a parent object
+    (through a ForeignKey), e.g. the choices of a poll at
+    /polls/<poll_id>/choices/. The parent is bound from a
+    keyword argument of the URL pattern for each request:
+    the queryset is filtered by it and it is set as the
+    value of the ForeignKey of created and updated models.
+    
+    Entries are identified either by primary key or by
+    their ordinal (1-based position among their siblings).
+    Ordinal lookups run a single LIMIT/OFFSET query and
+    ordinals for URLs a single COUNT query, so neither
+    loads the list of siblings.
+    """
+    def __init__(self, queryset, responder, parent_field, parent_kwarg=None,
+                 entry_kwarg='pk', ordinal=False, order_field=None,
+                 entry_class=None, **kwargs):
+        """
+        parent_field:
+            the name of the ForeignKey of the model that
+            refers to the parent
+        parent_kwarg:
+            the name of the URL keyword argument that contains
+            the primary key of the parent;
+            default: parent_field + '_id'
+        entry_kwarg:
+            the name of the URL keyword argument that identifies
+            an entry
+        ordinal:
+            if True, entries are identified by their ordinal,
+            otherwise by their primary key
+        order_field:
+            the model field that determines the ordinals;
+            default: the primary key
+        
+        For the other arguments see Collection. The default
+        entry_class is NestedEntry.
+        """
+        if not entry_class:
+            entry_class = NestedEntry
+        Collection.__init__(self, queryset, responder, entry_class=entry_class, **kwargs)
+        self.parent_field = parent_field
+        if not parent_kwarg:
+            parent_kwarg = parent_field + '_id'
+        self.parent_kwarg = parent_kwarg
+        self.entry_kwarg = entry_kwarg
+        self.ordinal = ordinal
+        if not order_field:
+            order_field = queryset.model._meta.pk.name
+        self.order_field = order_field
+        
+        # The resource object in the URLconf (see bind())
+        self.root = self
+        self.parent_pk = None
+    
+    def bind(self, parent_pk):
+        """
+        Returns a copy of this collection that is restricted to
+        the children of the parent with the given primary key.
+        Each request is handled by its own copy, so concurrent
+        requests for different parents do not interfere.
+        """
+        bound = copy.copy(self)
+        bound.parent_pk = parent_pk
+        bound.queryset = self.queryset.filter(**{self.parent_field : parent_pk})
+        bound.receiver = BoundReceiver(self.receiver, {self.parent_field : parent_pk})
+        return bound
+    
+    def handle_request(self, request, *args, **kwargs):
+        if self.parent_pk is None:
+            try:
+                parent_pk = kwargs.pop(self.parent_kwarg)
+            except KeyError:
+                return self.responder.error(request, 404)
+            return self.bind(parent_pk).handle_request(request, *args, **kwargs)
+        return Collection.handle_request(self, request, *args, **kwargs)
+    
+    def get_url(self):
+        return reverse(self.root, (), {self.parent_kwarg : self.parent_pk})
     
+    def get_entry(self, *args, **kwargs):
+        """
+        Returns the entry identified by the URL argument
+        entry_kwarg (or the first positional argument).
+        """
+        if kwargs.has_key(self.entry_kwarg):
+            value = kwargs[self.entry_kwarg]
+        elif args:
+            value = args[0]
+        else:
+            raise self.queryset.model.DoesNotExist
+        if not self.ordinal:
+            return Collection.get_entry(self, value)
+        try:
+            ordinal = int(value)
+        except ValueError:
+            raise self.queryset.model.DoesNotExist
+        if ordinal < 1:
+            raise self.queryset.model.DoesNotExist
+        pk_name = self.queryset.model._meta.pk.name
+        objects = list(self.queryset.order_by(self.order_field, pk_name)[ordinal-1:ordinal])
+        if not objects:
+            raise self.queryset.model.DoesNotExist
+        return self.entry_class(self, objects[0])
+    
+    def get_ordinal(self, model):
+        """
+        Returns the ordinal of model among the models
+        of the collection.
+        """
+        pk_name = model._meta.pk.name
+        pk_value = getattr(model, pk_name)
+        if self.order_field == pk_name:
+            before = self.queryset.filter(**{'%s__lt' % pk_name : pk_value})
+        else:
+            value = getattr(model, self.order_field)
+            before = self.queryset.filter(
+                Q(**{'%s__lt' % self.order_field : value}) |
+                Q(**{self.order_field : value, '%s__lt' % pk_name : pk_value}))
+        return before.count() + 1
 
+class NestedEntry(Entry):
+    """
+    Resource for a single model of a NestedCollection.
+    """
+    def get_url(self):
+        collection = self.collection
+        parent_pk = getattr(self.model, self.model._meta.get_field(collection.parent_field).attname)
+        if collection.ordinal:
+            value = collection.get_ordinal(self.model)
+        else:
+            value = getattr(self.model, self.model._meta.pk.name)
+        return reverse(collection.root, (), {collection.parent_kwarg : parent_pk,
+                                             collection.entry_kwarg : value})
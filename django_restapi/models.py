@@ -0,0 +1,22 @@
+"""
+Models of django_restapi. Add 'django_restapi' to
+INSTALLED_APPS to use them (see sync.ChangeFeed).
+"""
+from datetime import datetime
+from django.db import models
+
+class Tombstone(models.Model):
+    """
+    Records the deletion of a model object through a
+    resource, so that clients that synchronize a collection
+    (see sync.ChangeFeed) learn about deleted objects.
+    """
+    model = models.CharField(max_length=100, db_index=True)
+    object_pk = models.CharField(max_length=255)
+    deleted = models.DateTimeField(default=datetime.now)
+
+    class Meta:
+        ordering = ('id',)
+
+    def __unicode__(self):
+        return u'%s %s' % (self.model, self.object_pk)
@@ -0,0 +1,231 @@
+"""
+Profiling classes that can be plugged into resources to
+profile the handling of live requests. A SamplingProfiler
+profiles one in N requests and requests that carry a
+trusted header; the overhead for all other requests is a
+counter increment. The profiles are aggregated per resource
+and request method in a ProfileRegistry, from where they can
+be dumped to files for pstats or served by
+resource.ProfileResource.
+
+The profiler and pstats are only imported when the first
+request is profiled.
+"""
+from authentication import constant_time_compare
+from cStringIO import StringIO
+import marshal, os, re, threading
+
+# Sort keys of pstats.Stats.sort_stats() accepted by format_stats()
+SORT_KEYS = ('calls', 'cumulative', 'file', 'module', 'name', 'nfl',
+             'pcalls', 'line', 'stdname', 'time')
+
+class ProfileRegistry(object):
+    """
+    Holds the aggregated profile statistics (pstats.Stats)
+    of the sampled requests per resource name and request
+    method.
+    """
+    def __init__(self):
+        self.stats = {}
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, resource_name, method, profiler):
+        key = (resource_name, method)
+        self._lock.acquire()
+        try:
+            stats = self.stats.get(key)
+            if stats is None:
+                import pstats
+                self.stats[key] = pstats.Stats(profiler)
+            else:
+                stats.add(profiler)
+            self.samples[key] = self.samples.get(key, 0) + 1
+        finally:
+            self._lock.release()
+
+    def keys(self):
+        """
+        Returns the sorted (resource name, method) pairs
+        that have been profiled.
+        """
+        self._lock.acquire()
+        try:
+            keys = self.stats.keys()
+        finally:
+            self._lock.release()
+        keys.sort()
+        return keys
+
+    def get_stats(self, resource_name, method):
+        return self.stats.get((resource_name, method))
+
+    def get_samples(self, resource_name, method):
+        return self.samples.get((resource_name, method), 0)
+
+    def format_stats(self, resource_name, method, sort='cumulative', limit=50):
+        """
+        Returns the pstats report of the statistics sorted by
+        sort (a key of pstats.Stats.sort_stats()) and limited
+        to limit functions, or None.
+        """
+        if sort not in SORT_KEYS:
+            sort = 'cumulative'
+        output = StringIO()
+        self._lock.acquire()
+        try:
+            stats = self.stats.get((resource_name, method))
+            if stats is None:
+                return None
+            stream = stats.stream
+            stats.stream = output
+            try:
+                stats.sort_stats(sort).print_stats(limit)
+            finally:
+                stats.stream = stream
+        finally:
+            self._lock.release()
+        return output.getvalue()
+
+    def marshal(self, resource_name, method):
+        """
+        Returns the statistics in the file format of
+        pstats.Stats.dump_stats(), or None.
+        """
+        self._lock.acquire()
+        try:
+            stats = self.stats.get((resource_name, method))
+            if stats is None:
+                return None
+            return marshal.dumps(stats.stats)
+        finally:
+            self._lock.release()
+
+    def dump(self, directory, keys=None):
+        """
+        Writes the statistics of each (resource name, method)
+        pair in keys (default: all) to a file in directory
+        that can be loaded with pstats.Stats(filename).
+        Returns the file names.
+        """
+        filenames = []
+        for resource_name, method in keys or self.keys():
+            data = self.marshal(resource_name, method)
+            if data is None:
+                continue
+            filename = os.path.join(directory, profile_filename(resource_name, method))
+            # Write to a temporary file first so that readers
+            # never see a partially written profile.
+            temp_filename = '%s.%d.tmp' % (filename, os.getpid())
+            f = open(temp_filename, 'wb')
+            try:
+                f.write(data)
+            finally:
+                f.close()
+            os.rename(temp_filename, filename)
+            filenames.append(filename)
+        return filenames
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self.stats = {}
+            self.samples = {}
+        finally:
+            self._lock.release()
+
+UNSAFE_FILENAME_CHARS = re.compile(r'[^\w.-]')
+
+def profile_filename(resource_name, method):
+    return '%s.%s.prof' % (UNSAFE_FILENAME_CHARS.sub('_', str(resource_name)),
+                           UNSAFE_FILENAME_CHARS.sub('_', str(method)))
+
+# Registry used by SamplingProfiler instances by default
+default_profile_registry = ProfileRegistry()
+
+class NoProfiling(object):
+    """
+    No profiling: Handle requests unchanged.
+    """
+    def profiled(self, request, func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+class SamplingProfiler(object):
+    """
+    Profiles a sample of the requests to a resource and
+    aggregates the profiles in a ProfileRegistry.
+    """
+    def __init__(self, name, rate=100, header='X-Profile', secret=None,
+                 registry=None, directory=None):
+        """
+        name:
+            the name of the resource in the registry and in
+            the names of dumped files
+        rate:
+            profile one in rate requests; 0 or None to only
+            profile requests that carry the trusted header
+        header:
+            the name of the request header that asks for a
+            request to be profiled
+        secret:
+            the value the header must have. Without a secret,
+            the header is ignored.
+        registry:
+            the ProfileRegistry that aggregates the profiles.
+            Default: default_profile_registry
+        directory:
+            if given, the aggregated statistics of a resource
+            and method are written to this directory after each
+            profiled request
+        """
+        self.name = name
+        self.rate = rate
+        self.meta_key = 'HTTP_' + header.upper().replace('-', '_')
+        self.secret = secret
+        if registry is None:
+            registry = default_profile_registry
+        self.registry = registry
+        self.directory = directory
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def should_profile(self, request):
+        """
+        Returns True if request is one of the sampled requests
+        or carries the trusted header.
+        """
+        if self.secret:
+            value = request.META.get(self.meta_key)
+            if value and constant_time_compare(value, self.secret):
+                return True
+        if not self.rate:
+            return False
+        self._lock.acquire()
+        try:
+            self._counter += 1
+            if self._counter < self.rate:
+                return False
+            self._counter = 0
+            return True
+        finally:
+            self._lock.release()
+
+    def profiled(self, request, func, *args, **kwargs):
+        """
+        Calls func with the given arguments, profiling the
+        call if request should be profiled.
+        """
+        if not self.should_profile(request):
+            return func(*args, **kwargs)
+        try:
+            import cProfile as profile
+        except ImportError:
+            import profile
+        profiler = profile.Profile()
+        try:
+            return profiler.runcall(func, *args, **kwargs)
+        finally:
+            method = request.method.upper()
+            self.registry.add(self.name, method, profiler)
+            if self.directory:
+                self.registry.dump(self.directory, [(self.name, method)])
@@ -0,0 +1,206 @@
+"""
+Query inspection classes that can be plugged into
+model_resource.Collection to find out which SQL queries a
+request runs. Meant for development and tests: they record
+every query, flag repeated near-identical queries (the
+typical sign of an N+1 problem, i.e. one query per row of
+a list) and check the number of queries against a budget.
+"""
+import re, time
+
+def get_connections():
+    """
+    Returns the connections to all configured databases
+    (only the default one before Django 1.2).
+    """
+    import django.db
+    if not hasattr(django.db, 'connections'):
+        return [django.db.connection]
+    connections = django.db.connections
+    return [connections[alias] for alias in connections]
+
+class NoQueryInspection(object):
+    """
+    No query inspection: Handle requests unchanged.
+    """
+    def inspect(self, func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+class RecordingCursor(object):
+    """
+    Wraps a database cursor and records the queries run
+    through it in a QueryReport.
+    """
+    def __init__(self, cursor, report, using=None):
+        self.cursor = cursor
+        self.report = report
+        self.using = using
+
+    def execute(self, sql, params=()):
+        start = time.time()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            self.report.add(sql, start, time.time() - start, self.using)
+
+    def executemany(self, sql, param_list):
+        start = time.time()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            self.report.add(sql, start, time.time() - start, self.using)
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+# Literals that differ between otherwise identical queries
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+VALUE_LIST = re.compile(r"\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)")
+
+def normalize_sql(sql):
+    """
+    Replaces literals and parameter lists in sql by
+    placeholders so that queries that only differ in
+    their values become identical.
+    """
+    sql = STRING_LITERAL.sub('?', sql)
+    sql = NUMBER_LITERAL.sub('?', sql)
+    sql = VALUE_LIST.sub('(...)', sql)
+    return ' '.join(sql.split())
+
+class QueryReport(object):
+    """
+    The queries run while handling a single request.
+    Each query is recorded as a dictionary with the keys
+    sql, start (seconds since the start of the request),
+    time (duration in seconds) and using (the alias of the
+    database, None before Django 1.2).
+    """
+    def __init__(self, budget=None, repeat_threshold=3):
+        self.budget = budget
+        self.repeat_threshold = repeat_threshold
+        self.started = time.time()
+        self.queries = []
+
+    def add(self, sql, start, duration, using=None):
+        self.queries.append({
+            'sql' : sql,
+            'start' : start - self.started,
+            'time' : duration,
+            'using' : using,
+        })
+
+    def count(self):
+        return len(self.queries)
+    count = property(count)
+
+    def total_time(self):
+        return sum([query['time'] for query in self.queries])
+    total_time = property(total_time)
+
+    def exceeded(self):
+        """
+        True if more queries were run than the budget allows.
+        """
+        return self.budget is not None and self.count > self.budget
+    exceeded = property(exceeded)
+
+    def suspects(self):
+        """
+        Returns (normalized sql, number of executions) pairs
+        for all queries that were run at least repeat_threshold
+        times with different values, most frequent first.
+        """
+        counts = {}
+        for query in self.queries:
+            sql = normalize_sql(query['sql'])
+            counts[sql] = counts.get(sql, 0) + 1
+        suspects = [(sql, n) for (sql, n) in counts.items() if n >= self.repeat_threshold]
+        suspects.sort(key=lambda suspect: -suspect[1])
+        return suspects
+    suspects = property(suspects)
+
+class QueryInspector(object):
+    """
+    Records the queries of each request in a QueryReport.
+    The report is attached to the response as
+    response.query_report (which the Django test client
+    passes through) and summarized in the response headers
+    X-Query-Count, X-Query-Time (milliseconds),
+    X-Query-Budget and X-Query-Suspects.
+    """
+    def __init__(self, budget=None, repeat_threshold=3, headers=True):
+        """
+        budget:
+            the maximum number of queries a request to this
+            resource should need; default: no budget
+        repeat_threshold:
+            the number of executions of the same query (with
+            different values) from which on it is considered
+            an N+1 suspect
+        headers:
+            whether to add the X-Query-* headers to responses
+        """
+        self.budget = budget
+        self.repeat_threshold = repeat_threshold
+        self.headers = headers
+
+    def inspect(self, func, *args, **kwargs):
+        """
+        Calls func, which must return an HttpResponse, and
+        records the queries it runs on any database.
+        """
+        report = QueryReport(self.budget, self.repeat_threshold)
+        # The connection objects are thread-local, so replacing
+        # their cursor methods only affects the current request.
+        connections = get_connections()
+        previous_cursors = []
+        for connection in connections:
+            previous_cursors.append(connection.__dict__.get('cursor'))
+            connection.cursor = self.make_recording_cursor(connection, report)
+        try:
+            response = func(*args, **kwargs)
+        finally:
+            for connection, previous_cursor in zip(connections, previous_cursors):
+                if previous_cursor is None:
+                    del connection.cursor
+                else:
+                    connection.cursor = previous_cursor
+        response.query_report = report
+        if self.headers:
+            response['X-Query-Count'] = str(report.count)
+            response['X-Query-Time'] = '%.3f' % (report.total_time * 1000)
+            if self.budget is not None:
+                response['X-Query-Budget'] = str(self.budget)
+            response['X-Query-Suspects'] = str(len(report.suspects))
+        return response
+
+    def make_recording_cursor(self, connection, report):
+        """
+        Returns a replacement for the cursor method of
+        connection that records the queries in report.
+        """
+        make_cursor = connection.cursor
+        using = getattr(connection, 'alias', None)
+        return lambda: RecordingCursor(make_cursor(), report, using)
+
+class QueryBudgetTestMixin(object):
+    """
+    Assertions for TestCase classes that test resources
+    with a QueryInspector.
+    """
+    def assertWithinQueryBudget(self, response):
+        report = response.query_report
+        if report.exceeded:
+            self.fail('%d queries exceed the budget of %d:\n%s' % (report.count,
+                report.budget, '\n'.join([query['sql'] for query in report.queries])))
+
+    def assertNoRepeatedQueries(self, response):
+        suspects = response.query_report.suspects
+        if suspects:
+            self.fail('Repeated queries (N+1 suspects):\n%s' % '\n'.join(
+                ['%d times: %s' % (n, sql) for (sql, n) in suspects]))
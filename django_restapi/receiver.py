@@ -4,8 +4,8 @@ model_resource.ModelResource and determine how submissions
 of model data need to look like (e.g. form submission MIME types,
 XML, JSON, ...).
 """
-from django.core import serializers
 from django.forms import model_to_dict
+from django.utils import simplejson
 
 class InvalidFormData(Exception):
     """
@@ -13,6 +13,12 @@ class InvalidFormData(Exception):
     pairs.
     """
 
+class RequestEntityTooLarge(InvalidFormData):
+    """
+    Raised if the request body exceeds the maximum size
+    a receiver accepts.
+    """
+
 class Receiver(object):
     """
     Base class for all "receiver" data format classes.
@@ -41,12 +47,49 @@ class SerializeReceiver(Receiver):
     Base class for all data formats possible
     within Django's serializer framework.
     """
-    def __init__(self, format):
+    def __init__(self, format, max_size=None):
+        """
+        format:
+            may be every format that works with Django's serializer
+            framework. By default: xml, python, json, (yaml).
+        max_size:
+            Maximum size of the request body in bytes.
+            Default: no limit
+        """
         self.format = format
+        self.max_size = max_size
+    
+    def get_body(self, request):
+        """
+        Returns the request body. Checks the announced size
+        before the body is read.
+        """
+        if self.max_size is not None:
+            try:
+                content_length = int(request.META.get('CONTENT_LENGTH', 0) or 0)
+            except ValueError:
+                raise InvalidFormData
+            if content_length > self.max_size:
+                raise RequestEntityTooLarge
+        body = request.raw_post_data
+        if not body.strip():
+            raise InvalidFormData
+        if self.max_size is not None and len(body) > self.max_size:
+            raise RequestEntityTooLarge
+        return body
     
     def get_data(self, request, method):
+        return self.decode(self.get_body(request))
+    
+    def decode(self, body):
+        """
+        Decodes a serialized model into a dictionary of form
+        data. Uses Django's deserializer; subclasses may
+        decode the format directly.
+        """
+        from django.core import serializers
         try:
-            deserialized_objects = list(serializers.deserialize(self.format, request.raw_post_data))
+            deserialized_objects = list(serializers.deserialize(self.format, body))
         except serializers.base.DeserializationError:
             raise InvalidFormData
         if len(deserialized_objects) != 1:
@@ -60,13 +103,106 @@ class JSONReceiver(SerializeReceiver):
     Data format class for form submission in JSON, 
     e.g. for web browsers.
     """
-    def __init__(self):
-        self.format = 'json'
+    def __init__(self, max_size=None):
+        SerializeReceiver.__init__(self, 'json', max_size)
+    
+    def decode(self, body):
+        """
+        Returns the "fields" of the only object in a list
+        serialized by Django's JSON serializer, without
+        building a model instance.
+        """
+        try:
+            objects = simplejson.loads(body)
+        except ValueError:
+            raise InvalidFormData
+        if not isinstance(objects, list) or len(objects) != 1:
+            raise InvalidFormData
+        fields = objects[0].get('fields') if isinstance(objects[0], dict) else None
+        if not isinstance(fields, dict):
+            raise InvalidFormData
+        return fields
 
 class XMLReceiver(SerializeReceiver):
     """
     Data format class for form submission in XML, 
     e.g. for software clients.
     """
-    def __init__(self):
-        self.format = 'xml'
+    def __init__(self, max_size=None):
+        SerializeReceiver.__init__(self, 'xml', max_size)
+    
+    def decode(self, body):
+        """
+        Returns the fields of the only object in a document
+        serialized by Django's XML serializer, without
+        building a model instance.
+        """
+        from xml.dom import minidom
+        from xml.parsers.expat import ExpatError
+        try:
+            document = minidom.parseString(body)
+        except ExpatError:
+            raise InvalidFormData
+        root = document.documentElement
+        if root.tagName != 'django-objects':
+            raise InvalidFormData
+        objects = [node for node in root.childNodes if node.nodeName == 'object']
+        if len(objects) != 1:
+            raise InvalidFormData
+        data = {}
+        for field_node in objects[0].getElementsByTagName('field'):
+            field_name = field_node.getAttribute('name')
+            if not field_name:
+                raise InvalidFormData
+            if field_node.getAttribute('rel') == 'ManyToManyRel':
+                data[field_name] = [node.getAttribute('pk') for node in field_node.getElementsByTagName('object')]
+            elif field_node.getElementsByTagName('None'):
+                data[field_name] = None
+            else:
+                data[field_name] = get_inner_text(field_node).strip()
+        document.unlink()
+        return data
+
+class BoundReceiver(Receiver):
+    """
+    Wraps another receiver and sets fixed values in the data
+    it returns, e.g. the parent of a nested collection that
+    is given by the URL.
+    """
+    def __init__(self, receiver, values):
+        """
+        receiver:
+            the receiver that decodes the submitted data
+        values:
+            dictionary of field names and the values they
+            are set to, regardless of the submitted data
+        """
+        self.receiver = receiver
+        self.values = values
+    
+    def bind(self, data):
+        data = data.copy()
+        for key, value in self.values.items():
+            data[key] = value
+        return data
+    
+    def get_data(self, request, method):
+        return self.bind(self.receiver.get_data(request, method))
+    
+    def get_post_data(self, request):
+        return self.bind(self.receiver.get_post_data(request))
+    
+    def get_put_data(self, request):
+        return self.bind(self.receiver.get_put_data(request))
+
+def get_inner_text(node):
+    """
+    Returns the text of all text nodes below node.
+    """
+    inner_text = []
+    for child in node.childNodes:
+        if child.nodeType in (child.TEXT_NODE, child.CDATA_SECTION_NODE):
+            inner_text.append(child.data)
+        elif child.nodeType == child.ELEMENT_NODE:
+            inner_text.append(get_inner_text(child))
+    return u''.join(inner_text)
@@ -0,0 +1,276 @@
+"""
+Resource registry that generates the URLs of resources
+instead of hand-written regular expressions per resource.
+Requests are routed to the registered resources through a
+tree of path segments in a single pass, no matter how many
+resources are registered, and resource.reverse() builds
+their URLs from the same table.
+"""
+from django.conf.urls.defaults import patterns, url
+from django.core.urlresolvers import get_script_prefix
+from django.http import Http404
+from django.utils.http import urlquote
+from model_resource import Collection, NestedCollection
+from resource import url_registries
+import re
+
+class Parameter(object):
+    """
+    A variable path segment, e.g. <poll_id> (any value) or
+    <int:poll_id> (digits only).
+    """
+    def __init__(self, name, converter=None):
+        self.name = name
+        self.converter = converter
+
+    def accepts(self, value):
+        if self.converter == 'int':
+            return value.isdigit()
+        return True
+
+    def __str__(self):
+        if self.converter:
+            return '<%s:%s>' % (self.converter, self.name)
+        return '<%s>' % self.name
+
+segment_re = re.compile(r'^<(?:(int):)?(\w+)>$')
+
+def parse_segment(segment):
+    match = segment_re.match(segment)
+    if match is None:
+        return segment
+    return Parameter(match.group(2), match.group(1))
+
+class Route(object):
+    """
+    A registered URL of a resource: the collection URL or
+    the URL of its entries.
+    """
+    def __init__(self, resource, segments, is_entry, positional):
+        """
+        segments:
+            the path segments (strings and Parameters)
+        is_entry:
+            None for resources that are not collections,
+            otherwise whether the route addresses an entry
+        positional:
+            the name of the parameter that is passed as
+            positional argument, or None
+        """
+        self.resource = resource
+        self.segments = segments
+        self.is_entry = is_entry
+        self.positional = positional
+
+    def get_arguments(self, values):
+        """
+        Returns the arguments (args, kwargs) of the resource
+        for the list of parameter values of a path.
+        """
+        args = ()
+        kwargs = {}
+        names = [s.name for s in self.segments if isinstance(s, Parameter)]
+        for name, value in zip(names, values):
+            if name == self.positional:
+                args = (value,)
+            else:
+                kwargs[str(name)] = value
+        if self.is_entry is not None:
+            kwargs['is_entry'] = self.is_entry
+        return args, kwargs
+
+    def build(self, args, kwargs):
+        """
+        Returns the path for the arguments of a reverse()
+        call, or None if they do not fit.
+        """
+        values = dict(kwargs)
+        if args:
+            if self.positional is None or len(args) != 1:
+                return None
+            values[self.positional] = args[0]
+        names = [s.name for s in self.segments if isinstance(s, Parameter)]
+        if len(names) != len(values):
+            return None
+        path = []
+        for segment in self.segments:
+            if isinstance(segment, Parameter):
+                if not values.has_key(segment.name):
+                    return None
+                value = urlquote(values[segment.name], '')
+                if not value or not segment.accepts(value):
+                    return None
+                path.append(value)
+            else:
+                path.append(segment)
+        return '/'.join(path) + '/'
+
+class Node(object):
+    """
+    A node of the segment tree.
+    """
+    def __init__(self):
+        self.children = {}
+        # Child nodes of parameter segments by converter
+        self.parameters = {}
+        self.route = None
+
+def merge_nodes(primary, fallback):
+    """
+    Returns a tree with the routes of both trees; where both
+    have a route, that of primary.
+    """
+    node = Node()
+    node.route = primary.route or fallback.route
+    for attr in ('children', 'parameters'):
+        children = getattr(node, attr)
+        children.update(getattr(fallback, attr))
+        for key, child in getattr(primary, attr).items():
+            if children.has_key(key):
+                child = merge_nodes(child, children[key])
+            children[key] = child
+    return node
+
+def compile_node(node):
+    """
+    Returns a copy of a tree that can be searched without
+    backtracking: digits select the <int:...> child of a node,
+    so that child also gets the routes below the child for
+    other parameters.
+    """
+    compiled = Node()
+    compiled.route = node.route
+    for segment, child in node.children.items():
+        compiled.children[segment] = compile_node(child)
+    for converter, child in node.parameters.items():
+        if converter == 'int' and node.parameters.has_key(None):
+            child = merge_nodes(child, node.parameters[None])
+        compiled.parameters[converter] = compile_node(child)
+    return compiled
+
+class ResourceRegistry(object):
+    """
+    Maps URL paths to resources. Collections are registered
+    with the path of the collection (e.g. 'polls'); their
+    entries get the path with one more segment ('polls/1/').
+    Paths may contain parameters for nested collections, e.g.
+    'polls/<int:poll_id>/choices'. Static segments take
+    precedence over <int:...> parameters, and those over
+    other parameters. The registered paths are compiled to a
+    tree that resolves a path in one pass over its segments,
+    without backtracking.
+
+    Include the urlpatterns of the registry in the root
+    URLconf, so that the URLs it builds are complete.
+    """
+    def __init__(self, prefix=''):
+        """
+        prefix:
+            the URL prefix of all registered resources,
+            e.g. 'api/'
+        """
+        self.prefix = prefix
+        self.root = Node()
+        self.compiled = None
+        self.routes = {}
+        url_registries.append(self)
+
+    def add_route(self, route):
+        node = self.root
+        for segment in route.segments:
+            if isinstance(segment, Parameter):
+                node = node.parameters.setdefault(segment.converter, Node())
+            else:
+                node = node.children.setdefault(segment, Node())
+        if node.route is not None:
+            raise ValueError('Path %s is already registered.' % '/'.join(map(str, route.segments)))
+        node.route = route
+        self.compiled = None
+        self.routes.setdefault(route.resource, []).append(route)
+
+    def register(self, path, resource, entries=None):
+        """
+        Registers resource at path (without leading and
+        trailing slash).
+
+        entries:
+            whether the resource also handles the URLs one
+            segment below path, with the segment as argument;
+            default: True for collections. Entries of a
+            NestedCollection are passed as its entry_kwarg,
+            all others as positional argument.
+        """
+        segments = [parse_segment(s) for s in path.strip('/').split('/') if s]
+        if isinstance(resource, Collection):
+            is_entry, entry_is_entry = False, True
+        else:
+            is_entry = entry_is_entry = None
+        if entries is None:
+            entries = is_entry is not None
+        self.add_route(Route(resource, segments, is_entry, None))
+        if entries:
+            if isinstance(resource, NestedCollection):
+                entry = Parameter(resource.entry_kwarg)
+                positional = None
+            else:
+                entry = Parameter('pk')
+                positional = 'pk'
+            self.add_route(Route(resource, segments + [entry], entry_is_entry, positional))
+
+    def compile(self):
+        """
+        Compiles the tree of the registered paths; otherwise
+        the first resolve() after a registration does.
+        """
+        self.compiled = compile_node(self.root)
+        return self.compiled
+
+    def resolve(self, path):
+        """
+        Returns the Route and the list of parameter values
+        for path (relative to the prefix), or (None, None).
+        """
+        node = self.compiled
+        if node is None:
+            node = self.compile()
+        values = []
+        path = path.strip('/')
+        if path:
+            for segment in path.split('/'):
+                child = node.children.get(segment)
+                if child is None and segment:
+                    if segment.isdigit():
+                        child = node.parameters.get('int')
+                    if child is None:
+                        child = node.parameters.get(None)
+                    values.append(segment)
+                if child is None:
+                    return None, None
+                node = child
+        if node.route is None:
+            return None, None
+        return node.route, values
+
+    def reverse(self, resource, args=(), kwargs=None):
+        """
+        Returns the URL of a registered resource, or None.
+        """
+        for route in self.routes.get(resource, ()):
+            path = route.build(args, kwargs or {})
+            if path is not None:
+                return '%s%s%s' % (get_script_prefix(), self.prefix, path)
+        return None
+
+    def dispatch(self, request, path):
+        """
+        View that calls the resource registered for path.
+        """
+        route, values = self.resolve(path)
+        if route is None:
+            raise Http404
+        args, kwargs = route.get_arguments(values)
+        return route.resource(request, *args, **kwargs)
+
+    def get_urlpatterns(self):
+        return patterns('', url(r'^%s(?P<path>.*)$' % re.escape(self.prefix), self.dispatch))
+    urlpatterns = property(get_urlpatterns)
@@ -0,0 +1,185 @@
+"""
+Resources for the pairs of objects related by a
+many-to-many field, e.g. the friendships of a symmetrical
+Person.friends = ManyToManyField('self'). The pairs are read
+from the intermediary table with a single joined query, so
+listing them does not need a query per object.
+"""
+from django.db import connection
+from django.http import Http404, HttpResponseRedirect
+from django.shortcuts import render_to_response
+from django.template import RequestContext
+from resource import Resource
+
+class RelationshipCollection(Resource):
+    """
+    Lists the pairs (source object, target object) of a
+    many-to-many field. Pairs of a symmetrical field are
+    stored in both directions; they are listed once, with
+    the lower object (by order_field, then primary key)
+    first.
+    """
+    def __init__(self, model, field_name, template_name, order_field=None,
+                 paginate_by=None, template_object_name='relationship',
+                 authentication=None, permitted_methods=None, mimetype=None):
+        """
+        model:
+            the model the many-to-many field belongs to
+        field_name:
+            the name of the many-to-many field
+        template_name:
+            the template that renders the list of pairs. It
+            gets the context variable "<template_object_name>_list"
+            and the pagination variables page, has_next,
+            has_previous, next and previous.
+        order_field:
+            the name of the field the pairs are ordered by;
+            default: the primary key
+        paginate_by:
+            the number of pairs per page (GET parameter "page");
+            default: all pairs on one page
+        template_object_name:
+            see template_name
+        """
+        Resource.__init__(self, authentication, permitted_methods, mimetype)
+        self.model = model
+        self.field = model._meta.get_field(field_name)
+        self.symmetrical = self.field.rel.to == model and self.field.rel.symmetrical
+        self.template_name = template_name
+        if order_field is None:
+            order_field = model._meta.pk.name
+        self.order_field = order_field
+        self.paginate_by = paginate_by
+        self.template_object_name = template_object_name
+
+    def get_sql(self, where=None, limit=None, offset=None):
+        """
+        Returns the query that selects the columns of both
+        objects of the pairs in order.
+        """
+        qn = connection.ops.quote_name
+        source, target = self.model._meta, self.field.rel.to._meta
+        source_order = qn(source.get_field(self.order_field).column)
+        target_order = qn(target.get_field(self.order_field).column)
+        columns = ['s.%s' % qn(f.column) for f in source.fields] + \
+                  ['t.%s' % qn(f.column) for f in target.fields]
+        sql = ['SELECT %s FROM %s r' % (', '.join(columns), qn(self.field.m2m_db_table())),
+               'INNER JOIN %s s ON s.%s = r.%s' % (qn(source.db_table), qn(source.pk.column),
+                                                   qn(self.field.m2m_column_name())),
+               'INNER JOIN %s t ON t.%s = r.%s' % (qn(target.db_table), qn(target.pk.column),
+                                                   qn(self.field.m2m_reverse_name()))]
+        conditions = []
+        if where:
+            conditions.append(where)
+        if self.symmetrical:
+            # Both directions are stored; keep the ordered one
+            conditions.append('(s.%s < t.%s OR (s.%s = t.%s AND s.%s < t.%s))' % (
+                source_order, target_order, source_order, target_order,
+                qn(source.pk.column), qn(target.pk.column)))
+        if conditions:
+            sql.append('WHERE %s' % ' AND '.join(conditions))
+        sql.append('ORDER BY s.%s, t.%s, s.%s, t.%s' % (source_order, target_order,
+                                                        qn(source.pk.column), qn(target.pk.column)))
+        if limit is not None:
+            sql.append('LIMIT %d' % limit)
+            if offset:
+                sql.append('OFFSET %d' % offset)
+        return ' '.join(sql)
+
+    def get_pairs(self, where=None, params=(), limit=None, offset=None):
+        """
+        Returns the ordered (source, target) pairs of model
+        objects.
+        """
+        cursor = connection.cursor()
+        cursor.execute(self.get_sql(where, limit, offset), params)
+        source_model, target_model = self.model, self.field.rel.to
+        n = len(source_model._meta.fields)
+        return [(source_model(*row[:n]), target_model(*row[n:]))
+                for row in cursor.fetchall()]
+
+    def get_pair(self, source_pk, target_pk):
+        """
+        Returns the pair of the objects with the given primary
+        keys in list order, or raises Http404 if they are not
+        related.
+        """
+        qn = connection.ops.quote_name
+        where = 'r.%s = %%s AND r.%s = %%s' % (qn(self.field.m2m_column_name()),
+                                               qn(self.field.m2m_reverse_name()))
+        params = (source_pk, target_pk)
+        if self.symmetrical:
+            # Match both directions; the ordering condition
+            # keeps the one the pair is listed in.
+            where = '((%s) OR (%s))' % (where, where)
+            params = (source_pk, target_pk, target_pk, source_pk)
+        pairs = self.get_pairs(where, params)
+        if not pairs:
+            raise Http404
+        return pairs[0]
+
+    def read(self, request):
+        """
+        Renders one page of pairs. One more pair than fits on
+        the page is fetched to find out whether there is a
+        next page, so no COUNT query is needed.
+        """
+        if self.paginate_by:
+            try:
+                page = int(request.GET.get('page', 1))
+            except ValueError:
+                raise Http404
+            if page < 1:
+                raise Http404
+            pairs = self.get_pairs(limit=self.paginate_by + 1,
+                                   offset=(page - 1) * self.paginate_by)
+            if not pairs and page > 1:
+                raise Http404
+            has_next = len(pairs) > self.paginate_by
+            pairs = pairs[:self.paginate_by]
+        else:
+            page, has_next = 1, False
+            pairs = self.get_pairs()
+        context = RequestContext(request, {
+            '%s_list' % self.template_object_name : pairs,
+            'is_paginated' : page > 1 or has_next,
+            'page' : page,
+            'has_next' : has_next,
+            'has_previous' : page > 1,
+            'next' : page + 1,
+            'previous' : page - 1,
+        })
+        return render_to_response(self.template_name, context_instance=context,
+                                  mimetype=self.mimetype)
+
+class RelationshipEntry(Resource):
+    """
+    A single pair of a RelationshipCollection, addressed by
+    the primary keys of both objects (URL arguments).
+    """
+    def __init__(self, collection, template_name, authentication=None,
+                 permitted_methods=None, mimetype=None):
+        """
+        collection:
+            the RelationshipCollection the pair belongs to
+        template_name:
+            the template that renders the pair (context
+            variable "<template_object_name>" of the collection)
+        """
+        Resource.__init__(self, authentication, permitted_methods, mimetype)
+        self.collection = collection
+        self.template_name = template_name
+
+    def read(self, request, source_pk, target_pk):
+        pair = self.collection.get_pair(source_pk, target_pk)
+        context = RequestContext(request, {self.collection.template_object_name : pair})
+        return render_to_response(self.template_name, context_instance=context,
+                                  mimetype=self.mimetype)
+
+    def delete(self, request, source_pk, target_pk):
+        """
+        Removes the relation and redirects to the collection.
+        """
+        source, target = self.collection.get_pair(source_pk, target_pk)
+        getattr(source, self.collection.field.name).remove(target)
+        return HttpResponseRedirect(self.collection.get_url())
@@ -1,25 +1,79 @@
 """
 Generic resource class.
 """
+from django.utils import simplejson
 from django.utils.translation import ugettext as _
-from authentication import NoAuthentication
-from django.core.urlresolvers import reverse as _reverse
-from django.http import Http404, HttpResponse, HttpResponseNotAllowed
+from authentication import NoAuthentication, djangouser_auth, get_challenge_headers
+from throttling import NoThrottling, retry_after
+from instrumentation import NoInstrumentation, default_registry
+from profiling import NoProfiling, default_profile_registry, profile_filename
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.urlresolvers import get_resolver, Resolver404, reverse as _reverse
+from django.db import transaction
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed, QueryDict
+from django.http.multipartparser import MultiPartParserError
+from django.utils.datastructures import MultiValueDict
+from django.utils.encoding import smart_str
+from receiver import InvalidFormData, RequestEntityTooLarge
+from cStringIO import StringIO
+from urllib import urlencode
 
-def load_put_and_files(request):
-    """
-    Populates request.PUT and request.FILES from
-    request.raw_post_data. PUT and POST requests differ 
-    only in REQUEST_METHOD, not in the way data is encoded. 
-    Therefore we can use Django's POST data retrieval method 
-    for PUT.
-    """
-    if request.method == 'PUT':
-        request.method = 'POST'
-        request._load_post_and_files()
-        request.method = 'PUT'
-        request.PUT = request.POST
-        del request._post
+def load_put_and_files(request, max_size=None):
+    """
+    Populates request.PUT and request.FILES from the body of
+    PUT requests without touching request.method.
+    
+    Multipart bodies are parsed as a stream by Django's upload
+    handlers, which keep small files in memory and write files
+    larger than settings.FILE_UPLOAD_MAX_MEMORY_SIZE to temporary
+    files. URL-encoded bodies are decoded like form submissions.
+    Bodies of other content types are left to the receiver.
+    
+    max_size:
+        Maximum size of the request body in bytes. Larger
+        bodies are refused before they are read.
+    """
+    if request.method.upper() != 'PUT' or hasattr(request, 'PUT'):
+        return
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH', 0) or 0)
+    except ValueError:
+        raise InvalidFormData
+    if max_size is not None and content_length > max_size:
+        raise RequestEntityTooLarge
+    content_type = request.META.get('CONTENT_TYPE', '')
+    if content_type.startswith('multipart'):
+        if hasattr(request, '_raw_post_data'):
+            # The body has already been read (e.g. by a middleware)
+            stream = StringIO(request.raw_post_data)
+        else:
+            stream = get_body_stream(request)
+        try:
+            data, files = request.parse_file_upload(request.META, stream)
+        except MultiPartParserError:
+            raise InvalidFormData
+    elif not content_type or content_type.startswith('application/x-www-form-urlencoded'):
+        data = QueryDict(request.raw_post_data, encoding=request.encoding)
+        files = MultiValueDict()
+    else:
+        data = QueryDict('', encoding=request.encoding)
+        files = MultiValueDict()
+    request.PUT = data
+    request._files = files
+
+def get_body_stream(request):
+    """
+    Returns the file-like object the request body can be
+    read from.
+    """
+    if hasattr(request, 'environ'):
+        return request.environ['wsgi.input'] # WSGI
+    return request._req # mod_python
+
+# The registry.ResourceRegistry instances; they build the URLs
+# of their resources without Django's URL resolver
+url_registries = []
 
 def reverse(viewname, args=(), kwargs=None):
     """
@@ -29,6 +83,10 @@ def reverse(viewname, args=(), kwargs=None):
     """
     if not kwargs:
         kwargs = {}
+    for registry in url_registries:
+        url = registry.reverse(viewname, args, kwargs)
+        if url is not None:
+            return url
     url = _reverse(viewname, None, args, kwargs)
     if url[-2:] == '/?':
         url = url[:-1]
@@ -45,7 +103,9 @@ class ResourceBase(object):
     Base class for both model-based and non-model-based 
     resources.
     """
-    def __init__(self, authentication=None, permitted_methods=None):
+    def __init__(self, authentication=None, permitted_methods=None,
+                 throttling=None, max_body_size=None, instrumentation=None,
+                 profiling=None):
         """
         authentication:
             the authentication instance that checks whether a
@@ -53,15 +113,41 @@ class ResourceBase(object):
         permitted_methods:
             the HTTP request methods that are allowed for this 
             resource e.g. ('GET', 'PUT')
+        throttling:
+            the throttling instance that checks whether a client
+            has exceeded its request rate
+        max_body_size:
+            the maximum size in bytes of PUT request bodies;
+            default: no limit
+        instrumentation:
+            the instrumentation instance that measures the
+            phases of each request
+        profiling:
+            the profiling instance that decides which requests
+            are profiled, e.g. a profiling.SamplingProfiler
         """
         # Access restrictions
         if not authentication:
             authentication = NoAuthentication()
         self.authentication = authentication
         
+        if not throttling:
+            throttling = NoThrottling()
+        self.throttling = throttling
+        
         if not permitted_methods:
             permitted_methods = ["GET"]
         self.permitted_methods = [m.upper() for m in permitted_methods]
+        
+        self.max_body_size = max_body_size
+        
+        if not instrumentation:
+            instrumentation = NoInstrumentation()
+        self.instrumentation = instrumentation
+        
+        if not profiling:
+            profiling = NoProfiling()
+        self.profiling = profiling
     
     def dispatch(self, request, target, *args, **kwargs):
         """
@@ -75,7 +161,7 @@ class ResourceBase(object):
         elif request_method == 'POST':
             return target.create(request, *args, **kwargs)
         elif request_method == 'PUT':
-            load_put_and_files(request)
+            load_put_and_files(request, self.max_body_size)
             return target.update(request, *args, **kwargs)
         elif request_method == 'DELETE':
             return target.delete(request, *args, **kwargs)
@@ -87,6 +173,14 @@ class ResourceBase(object):
         Returns resource URL.
         """
         return reverse(self)
+    
+    def warm_up(self):
+        """
+        Builds what the first requests of a worker would
+        otherwise build, e.g. form classes and templates
+        (see warmup.warm_up()).
+        """
+        pass
 
     # The four CRUD methods that any class that 
     # inherits from Resource may implement:
@@ -109,7 +203,8 @@ class Resource(ResourceBase):
     resources that are not based on Django models.
     """
     def __init__(self, authentication=None, permitted_methods=None,
-                 mimetype=None):
+                 mimetype=None, throttling=None, max_body_size=None,
+                 instrumentation=None, profiling=None):
         """
         authentication:
             the authentication instance that checks whether a
@@ -120,29 +215,400 @@ class Resource(ResourceBase):
         mimetype:
             if the default None is not changed, any HttpResponse calls 
             use settings.DEFAULT_CONTENT_TYPE and settings.DEFAULT_CHARSET
+        throttling:
+            the throttling instance that checks whether a client
+            has exceeded its request rate
+        max_body_size:
+            the maximum size in bytes of PUT request bodies;
+            default: no limit
+        instrumentation:
+            the instrumentation instance that measures the
+            phases of each request
+        profiling:
+            the profiling instance that decides which requests
+            are profiled, e.g. a profiling.SamplingProfiler
         """
-        ResourceBase.__init__(self, authentication, permitted_methods)
+        ResourceBase.__init__(self, authentication, permitted_methods,
+                              throttling, max_body_size, instrumentation,
+                              profiling)
         self.mimetype = mimetype
     
     def __call__(self, request, *args, **kwargs):
+        """
+        Handles a request, profiling it if it is one of
+        the sampled requests.
+        """
+        return self.profiling.profiled(request, self.handle_request, request, *args, **kwargs)
+    
+    def handle_request(self, request, *args, **kwargs):
         """
         Redirects to one of the CRUD methods depending 
         on the HTTP method of the request. Checks whether
         the requested method is allowed for this resource.
         """
+        # Refuse clients with too many failed authentications
+        # before their credentials are checked again
+        wait = self.throttling.check_failures(request)
+        if wait:
+            response = HttpResponse(_('Too Many Requests'), mimetype=self.mimetype)
+            response['Retry-After'] = retry_after(wait)
+            response.status_code = 429
+            return response
+        
         # Check permission
-        if not self.authentication.is_authenticated(request):
+        if not self.instrumentation.timed('authentication',
+                self.authentication.is_authenticated, request):
+            self.throttling.failed(request)
             response = HttpResponse(_('Authorization Required'), mimetype=self.mimetype)
-            challenge_headers = self.authentication.challenge_headers()
+            challenge_headers = get_challenge_headers(self.authentication, request)
             for k,v in challenge_headers.items():
                 response[k] = v
             response.status_code = 401
             return response
         
+        # Check request rate
+        wait = self.throttling.check(request)
+        if wait:
+            response = HttpResponse(_('Too Many Requests'), mimetype=self.mimetype)
+            response['Retry-After'] = retry_after(wait)
+            response.status_code = 429
+            return response
+        
         try:
-            return self.dispatch(request, self, *args, **kwargs)
+            return self.instrumentation.timed('dispatch',
+                self.dispatch, request, self, *args, **kwargs)
         except HttpMethodNotAllowed:
             response = HttpResponseNotAllowed(self.permitted_methods)
             response.mimetype = self.mimetype
             return response
+        except RequestEntityTooLarge:
+            response = HttpResponse(_('Request Entity Too Large'), mimetype=self.mimetype)
+            response.status_code = 413
+            return response
+        except InvalidFormData:
+            response = HttpResponse(_('Bad Request'), mimetype=self.mimetype)
+            response.status_code = 400
+            return response
+    
+
+class MetricsResource(Resource):
+    """
+    Exports the histograms of a MetricsRegistry (see
+    instrumentation.Instrumentation) in the Prometheus text
+    format. Protect it with an authentication instance if the
+    metrics should not be public.
+    """
+    def __init__(self, registry=None, authentication=None):
+        """
+        registry:
+            the MetricsRegistry to export.
+            Default: instrumentation.default_registry
+        authentication:
+            the authentication instance that checks whether a
+            request is authenticated
+        """
+        Resource.__init__(self, authentication, ('GET',), 'text/plain; version=0.0.4')
+        if registry is None:
+            registry = default_registry
+        self.registry = registry
+    
+    def read(self, request):
+        return HttpResponse(self.registry.render(), mimetype=self.mimetype)
+
+class ProfileResource(Resource):
+    """
+    Serves the profiles aggregated in a ProfileRegistry (see
+    profiling.SamplingProfiler). Without parameters it lists
+    the profiled resources and methods. With the parameters
+    "resource" and "method" it returns the pstats report of
+    one of them, sorted by "sort" (default: cumulative) and
+    limited to "limit" lines (default: 50), or with
+    "format=pstats" the statistics in the file format of
+    pstats.Stats.dump_stats(). Protect it with an
+    authentication instance: profiles reveal code internals.
+    """
+    def __init__(self, registry=None, authentication=None):
+        """
+        registry:
+            the ProfileRegistry to serve.
+            Default: profiling.default_profile_registry
+        authentication:
+            the authentication instance that checks whether a
+            request is authenticated
+        """
+        Resource.__init__(self, authentication, ('GET',), 'text/plain')
+        if registry is None:
+            registry = default_profile_registry
+        self.registry = registry
     
+    def read(self, request):
+        resource_name = request.GET.get('resource')
+        method = request.GET.get('method', 'GET').upper()
+        if not resource_name:
+            lines = ['%s %s %d' % (name, m, self.registry.get_samples(name, m))
+                     for (name, m) in self.registry.keys()]
+            return HttpResponse(''.join([line + '\n' for line in lines]), mimetype=self.mimetype)
+        
+        if request.GET.get('format') == 'pstats':
+            data = self.registry.marshal(resource_name, method)
+            if data is None:
+                raise Http404
+            response = HttpResponse(data, mimetype='application/octet-stream')
+            response['Content-Disposition'] = 'attachment; filename=%s' % profile_filename(resource_name, method)
+            return response
+        
+        try:
+            limit = int(request.GET.get('limit', 50))
+        except ValueError:
+            limit = 50
+        report = self.registry.format_stats(resource_name, method,
+                                            request.GET.get('sort', 'cumulative'), limit)
+        if report is None:
+            raise Http404
+        return HttpResponse(report, mimetype=self.mimetype)
+
+class TokenResource(Resource):
+    """
+    Issues tokens for authentication.TokenAuthentication.
+    Clients POST "username" and "password" and get back a
+    JSON object with the token and its expiry timestamp.
+    """
+    def __init__(self, token_authentication, authfunc=djangouser_auth,
+                 authentication=None, max_age=None):
+        """
+        token_authentication:
+            the TokenAuthentication instance that signs the
+            tokens and later verifies them
+        authfunc:
+            A user-defined function which takes a username and
+            password as its first and second arguments respectively
+            and returns True if the user is authenticated
+        authentication:
+            the authentication instance that checks whether a
+            request is authenticated
+        max_age:
+            Number of seconds an issued token is valid.
+            Default: token_authentication.max_age
+        """
+        Resource.__init__(self, authentication, ('POST',), 'application/json')
+        self.token_authentication = token_authentication
+        self.authfunc = authfunc
+        self.max_age = max_age
+    
+    def get_claims(self, request, username):
+        """
+        Returns the claims for a token issued to username.
+        Override to add further claims.
+        """
+        return {'username' : username}
+    
+    def create(self, request):
+        username = request.POST.get('username', '')
+        password = request.POST.get('password', '')
+        if not username or not self.authfunc(username=username, password=password):
+            response = HttpResponse(_('Authorization Required'), mimetype=self.mimetype)
+            response.status_code = 401
+            return response
+        token = self.token_authentication.issue_token(
+            self.get_claims(request, username), self.max_age)
+        claims = self.token_authentication.get_claims(token)
+        response = HttpResponse(mimetype=self.mimetype)
+        simplejson.dump({'token' : token, 'expires' : claims['exp']}, response)
+        return response
+
+class BatchResource(Resource):
+    """
+    Handles a list of sub-requests in a single request, e.g.
+    for clients on high-latency links. The POST body is a JSON
+    list of objects with the keys "method", "path" (may contain
+    a query string) and optionally "body" (string), "data"
+    (dictionary that is sent form-encoded), "content_type"
+    and "headers" (dictionary of HTTP headers). Each sub-request
+    is resolved against the URLconf and handled by the resource
+    the path maps to, with the headers of the batch request
+    (e.g. Authorization) unless it overrides them. The response
+    is a JSON object with the list "responses" of objects with
+    the keys "status", "headers" and "body".
+    
+    In transactional mode all sub-requests run in a single
+    database transaction that is rolled back if one of them
+    fails (status 400 or higher). The remaining sub-requests
+    are skipped, the response gets the status of the failed
+    sub-request and "rolled_back" is true.
+    """
+    def __init__(self, authentication=None, max_requests=20,
+                 transactional=False, max_body_size=None):
+        """
+        authentication:
+            the authentication instance that checks whether a
+            request is authenticated
+        max_requests:
+            the maximum number of sub-requests of a batch
+        transactional:
+            whether to run all sub-requests in a single
+            transaction (see above)
+        max_body_size:
+            the maximum size in bytes of the batch request body;
+            default: no limit
+        """
+        Resource.__init__(self, authentication, ('POST',), 'application/json',
+                          max_body_size=max_body_size)
+        self.max_requests = max_requests
+        self.transactional = transactional
+    
+    def get_subrequests(self, request):
+        """
+        Decodes and checks the list of sub-requests. Bodies
+        that announce more than max_body_size bytes are
+        refused before they are read.
+        """
+        if self.max_body_size is not None:
+            try:
+                content_length = int(request.META.get('CONTENT_LENGTH', 0) or 0)
+            except ValueError:
+                raise InvalidFormData
+            if content_length > self.max_body_size:
+                raise RequestEntityTooLarge
+            if len(request.raw_post_data) > self.max_body_size:
+                raise RequestEntityTooLarge
+        try:
+            subrequests = simplejson.loads(request.raw_post_data)
+        except ValueError:
+            raise InvalidFormData
+        if not isinstance(subrequests, list) or len(subrequests) > self.max_requests:
+            raise InvalidFormData
+        for subrequest in subrequests:
+            if not isinstance(subrequest, dict) \
+               or not isinstance(subrequest.get('method'), basestring) \
+               or not isinstance(subrequest.get('path'), basestring) \
+               or not isinstance(subrequest.get('headers', {}), dict):
+                raise InvalidFormData
+        return subrequests
+    
+    def make_request(self, request, subrequest):
+        """
+        Returns a WSGIRequest for subrequest that inherits the
+        headers and environment of the batch request.
+        """
+        environ = {}
+        for key, value in request.META.items():
+            if key.startswith('HTTP_') or key in ('SERVER_NAME', 'SERVER_PORT',
+                    'SERVER_PROTOCOL', 'REMOTE_ADDR', 'REMOTE_HOST',
+                    'SCRIPT_NAME', 'wsgi.url_scheme', 'wsgi.errors'):
+                environ[key] = value
+        for key, value in subrequest.get('headers', {}).items():
+            environ['HTTP_' + smart_str(key).upper().replace('-', '_')] = smart_str(value)
+        
+        path = smart_str(subrequest['path'])
+        if '?' in path:
+            path, query_string = path.split('?', 1)
+        else:
+            query_string = ''
+        script_name = environ.get('SCRIPT_NAME', '')
+        if script_name and path.startswith(script_name):
+            path = path[len(script_name):]
+        
+        if subrequest.has_key('data'):
+            data = subrequest['data']
+            if isinstance(data, dict):
+                data = data.items()
+            if not isinstance(data, list):
+                raise InvalidFormData
+            try:
+                body = urlencode([(smart_str(k), smart_str(v)) for (k, v) in data])
+            except (TypeError, ValueError):
+                raise InvalidFormData
+            content_type = 'application/x-www-form-urlencoded'
+        else:
+            body = subrequest.get('body') or ''
+            if isinstance(body, unicode):
+                body = body.encode('utf-8')
+            content_type = subrequest.get('content_type', 'application/x-www-form-urlencoded')
+        environ.update({
+            'REQUEST_METHOD' : smart_str(subrequest['method']).upper(),
+            'PATH_INFO' : path,
+            'QUERY_STRING' : query_string,
+            'CONTENT_TYPE' : smart_str(content_type),
+            'CONTENT_LENGTH' : str(len(body)),
+            'wsgi.input' : StringIO(body),
+        })
+        sub = WSGIRequest(environ)
+        if hasattr(request, 'user'):
+            sub.user = request.user
+        return sub
+    
+    def handle_subrequest(self, request, subrequest):
+        """
+        Resolves and handles subrequest. Returns the response.
+        """
+        try:
+            sub = self.make_request(request, subrequest)
+        except (InvalidFormData, UnicodeError):
+            # Only this sub-request is invalid
+            response = HttpResponse(_('Bad Request'), mimetype='text/plain')
+            response.status_code = 400
+            return response
+        resolver = get_resolver(getattr(request, 'urlconf', None))
+        try:
+            callback, args, kwargs = resolver.resolve(sub.path_info)
+        except Resolver404:
+            response = HttpResponse(_('Not Found'), mimetype='text/plain')
+            response.status_code = 404
+            return response
+        if isinstance(callback, BatchResource):
+            response = HttpResponse(_('Batch requests cannot be nested'), mimetype='text/plain')
+            response.status_code = 400
+            return response
+        try:
+            return callback(sub, *args, **kwargs)
+        except Http404:
+            response = HttpResponse(_('Not Found'), mimetype='text/plain')
+            response.status_code = 404
+            return response
+        except Exception:
+            if settings.DEBUG_PROPAGATE_EXCEPTIONS or self.transactional:
+                raise
+            response = HttpResponse(_('Internal Server Error'), mimetype='text/plain')
+            response.status_code = 500
+            return response
+    
+    def create(self, request):
+        subrequests = self.get_subrequests(request)
+        responses = []
+        failed = None
+        if self.transactional:
+            transaction.enter_transaction_management()
+            transaction.managed(True)
+        try:
+            try:
+                for subrequest in subrequests:
+                    response = self.handle_subrequest(request, subrequest)
+                    responses.append({
+                        'status' : response.status_code,
+                        'headers' : dict(response.items()),
+                        'body' : response.content.decode('utf-8', 'replace'),
+                    })
+                    if self.transactional and response.status_code >= 400:
+                        failed = response.status_code
+                        break
+                if self.transactional:
+                    if failed:
+                        transaction.rollback()
+                    else:
+                        transaction.commit()
+            except:
+                if self.transactional:
+                    transaction.rollback()
+                raise
+        finally:
+            if self.transactional:
+                transaction.leave_transaction_management()
+        
+        result = {'responses' : responses}
+        if failed:
+            result['rolled_back'] = True
+        response = HttpResponse(mimetype=self.mimetype)
+        simplejson.dump(result, response)
+        if failed:
+            response.status_code = failed
+        return response
@@ -3,21 +3,24 @@ Data format classes ("responders") that can be plugged
 into model_resource.ModelResource and determine how
 the objects of a ModelResource instance are rendered
 (e.g. serialized to XML, rendered by templates, ...).
+
+Serializers, paginators, the XML generator and the template
+machinery are imported by the methods that use them, so a
+deployment only loads the parts of Django its responders
+need.
 """
-from django.core import serializers
 from django.core.handlers.wsgi import STATUS_CODE_TEXT
-from django.core.paginator import QuerySetPaginator, InvalidPage
-# the correct paginator for Model objects is the QuerySetPaginator,
-# not the Paginator! (see Django doc)
-from django.core.xheaders import populate_xheaders
-from django import forms
 from django.http import Http404, HttpResponse
 from django.forms.util import ErrorDict
-from django.shortcuts import render_to_response
-from django.template import loader, RequestContext
 from django.utils import simplejson
-from django.utils.xmlutils import SimplerXMLGenerator
-from django.views.generic.simple import direct_to_template
+from instrumentation import NoInstrumentation
+from includes import InvalidInclude
+from sync import SyncError
+
+# Status codes used by resources that are missing
+# from Django's table
+STATUS_CODE_TEXT = dict(STATUS_CODE_TEXT)
+STATUS_CODE_TEXT.setdefault(429, 'TOO MANY REQUESTS')
 
 class SerializeResponder(object):
     """
@@ -40,30 +43,92 @@ class SerializeResponder(object):
         self.paginate_by = paginate_by
         self.allow_empty = allow_empty
         self.expose_fields = []
+        self.instrumentation = NoInstrumentation() # Set by Collection.__init__
+        self.includes = None # Set by Collection.__init__
+        # Fields that are not exposed by model (see get_unexposed_fields())
+        self.unexposed_fields = {}
+    
+    def get_unexposed_fields(self, model):
+        """
+        Returns the fields of model that are not in
+        expose_fields, computed once per model.
+        """
+        try:
+            return self.unexposed_fields[model]
+        except KeyError:
+            fields = [field for field in model._meta.fields
+                      if not field.name in self.expose_fields]
+            self.unexposed_fields[model] = fields
+            return fields
+    
+    def warm_up(self, model):
+        """
+        Loads the serializer (and the paginator, if any) and
+        computes the unexposed fields of model.
+        """
+        from django.core import serializers
+        serializers.get_serializer(self.format)
+        if self.paginate_by:
+            import django.core.paginator
+        if self.includes is not None:
+            import serialization
+        self.get_unexposed_fields(model)
         
-    def render(self, object_list):
+    def render(self, object_list, included=None, changes=None):
         """
         Serializes a queryset to the format specified in
-        self.format.
+        self.format, with the related objects in included
+        (see includes.IncludedObjects) embedded. If changes
+        (a sync.Changes instance) is given, object_list are
+        its changed objects, which are rendered with its
+        deleted objects and token.
         """
         # Hide unexposed fields
         hidden_fields = []
-        for obj in list(object_list):
-            for field in obj._meta.fields:
-                if not field.name in self.expose_fields and field.serialize:
+        for model in set([obj.__class__ for obj in object_list]):
+            for field in self.get_unexposed_fields(model):
+                if field.serialize:
                     field.serialize = False
                     hidden_fields.append(field)
-        response = serializers.serialize(self.format, object_list)
-        # Show unexposed fields again
-        for field in hidden_fields:
-            field.serialize = True
+        try:
+            if changes is not None:
+                from serialization import serialize_changes
+                response = serialize_changes(self.format, changes)
+            elif included is None:
+                from django.core import serializers
+                response = serializers.serialize(self.format, object_list)
+            else:
+                from serialization import serialize_included
+                response = serialize_included(self.format, object_list, included)
+        finally:
+            # Show unexposed fields again
+            for field in hidden_fields:
+                field.serialize = True
         return response
     
+    def get_included(self, request, object_list):
+        """
+        Loads the related objects requested by the GET
+        parameter "include", or returns None if there
+        are none.
+        """
+        if self.includes is None or not request.GET.get('include'):
+            return None
+        paths = self.includes.parse(request)
+        if not paths:
+            return None
+        return self.instrumentation.timed('query',
+            self.includes.load, object_list, paths)
+    
     def element(self, request, elem):
         """
         Renders single model objects to HttpResponse.
         """
-        return HttpResponse(self.render([elem]), self.mimetype)
+        try:
+            included = self.get_included(request, [elem])
+        except InvalidInclude:
+            return self.error(request, 400)
+        return HttpResponse(self.instrumentation.timed('render', self.render, [elem], included), self.mimetype)
     
     def error(self, request, status_code, error_dict=None):
         """
@@ -82,25 +147,54 @@ class SerializeResponder(object):
         response.status_code = status_code
         return response
     
-    def list(self, request, queryset, page=None):
+    def get_object_list(self, request, queryset, page=None):
         """
-        Renders a list of model objects to HttpResponse.
+        Returns the list of model objects on the requested
+        page, or None if the page does not exist.
         """
         if self.paginate_by:
+            # the correct paginator for Model objects is the QuerySetPaginator,
+            # not the Paginator! (see Django doc)
+            from django.core.paginator import QuerySetPaginator, InvalidPage
             paginator = QuerySetPaginator(queryset, self.paginate_by)
             if not page:
                 page = request.GET.get('page', 1)
             try:
                 page = int(page)
-                object_list = paginator.page(page).object_list
+                return list(paginator.page(page).object_list)
             except (InvalidPage, ValueError):
                 if page == 1 and self.allow_empty:
-                    object_list = []
+                    return []
                 else:
-                    return self.error(request, 404)
+                    return None
         else:
-            object_list = list(queryset)
-        return HttpResponse(self.render(object_list), self.mimetype)
+            return list(queryset)
+    
+    def list(self, request, queryset, page=None):
+        """
+        Renders a list of model objects to HttpResponse.
+        """
+        object_list = self.instrumentation.timed('query',
+            self.get_object_list, request, queryset, page)
+        if object_list is None:
+            return self.error(request, 404)
+        try:
+            included = self.get_included(request, object_list)
+        except InvalidInclude:
+            return self.error(request, 400)
+        return HttpResponse(self.instrumentation.timed('render', self.render, object_list, included), self.mimetype)
+    
+    def changes(self, request, changes):
+        """
+        Renders the changes of a sync request (see
+        sync.ChangeFeed) to HttpResponse.
+        """
+        try:
+            content = self.instrumentation.timed('render', self.render,
+                                                 changes.objects, changes=changes)
+        except SyncError:
+            return self.error(request, 400)
+        return HttpResponse(content, self.mimetype)
     
 class JSONResponder(SerializeResponder):
     """
@@ -143,6 +237,7 @@ class XMLResponder(SerializeResponder):
         status code.
         """
         from django.conf import settings
+        from django.utils.xmlutils import SimplerXMLGenerator
         if not error_dict:
             error_dict = ErrorDict()
         response = HttpResponse(mimetype = self.mimetype)
@@ -161,15 +256,26 @@ class XMLResponder(SerializeResponder):
         xml.endElement("django-error")
         xml.endDocument()
         return response
+    
+    def warm_up(self, model):
+        SerializeResponder.warm_up(self, model)
+        import django.utils.xmlutils
 
 class TemplateResponder(object):
     """
     Data format class that uses templates (similar to Django's
     generic views).
     """
-    def __init__(self, template_dir, paginate_by=None, template_loader=loader,
+    def __init__(self, template_dir, paginate_by=None, template_loader=None,
                  extra_context=None, allow_empty=False, context_processors=None,
                  template_object_name='object', mimetype=None):
+        """
+        template_loader:
+            the object whose get_template() loads the templates;
+            default: django.template.loader
+        """
+        if template_loader is None:
+            from django.template import loader as template_loader
         self.template_dir = template_dir
         self.paginate_by = paginate_by
         self.template_loader = template_loader
@@ -184,6 +290,34 @@ class TemplateResponder(object):
         self.template_object_name = template_object_name
         self.mimetype = mimetype
         self.expose_fields = None # Set by Collection.__init__
+        self.instrumentation = NoInstrumentation() # Set by Collection.__init__
+        # Templates loaded by warm_up() by name
+        self.templates = {}
+    
+    def get_template(self, template_name):
+        """
+        Returns a template loaded by warm_up(), or loads it.
+        """
+        template = self.templates.get(template_name)
+        if template is None:
+            template = self.template_loader.get_template(template_name)
+        return template
+    
+    def warm_up(self, model):
+        """
+        Loads and compiles the list and detail templates of
+        model, which are then reused by all requests, and the
+        modules that render them.
+        """
+        # Modules imported by list() and element()
+        from django.core import paginator, xheaders
+        from django.template import TemplateDoesNotExist, RequestContext
+        for suffix in ('list', 'detail'):
+            template_name = '%s/%s_%s.html' % (self.template_dir, model._meta.module_name, suffix)
+            try:
+                self.templates[template_name] = self.template_loader.get_template(template_name)
+            except TemplateDoesNotExist:
+                pass
             
     def _hide_unexposed_fields(self, obj, allowed_fields):
         """
@@ -198,6 +332,8 @@ class TemplateResponder(object):
         """
         Renders a list of model objects to HttpResponse.
         """
+        from django.core.paginator import QuerySetPaginator, InvalidPage
+        from django.template import RequestContext
         template_name = '%s/%s_list.html' % (self.template_dir, queryset.model._meta.module_name)
         if self.paginate_by:
             paginator = QuerySetPaginator(queryset, self.paginate_by)
@@ -205,7 +341,7 @@ class TemplateResponder(object):
                 page = request.GET.get('page', 1)
             try:
                 page = int(page)
-                object_list = paginator.page(page).object_list
+                object_list = self.instrumentation.timed('query', list, paginator.page(page).object_list)
             except (InvalidPage, ValueError):
                 if page == 1 and self.allow_empty:
                     object_list = []
@@ -227,33 +363,35 @@ class TemplateResponder(object):
                 'hits' : paginator.count,
             }, self.context_processors)
         else:
-            object_list = queryset
+            object_list = self.instrumentation.timed('query', list, queryset)
             c = RequestContext(request, {
                 '%s_list' % self.template_object_name: object_list,
                 'is_paginated': False
             }, self.context_processors)
-            if not self.allow_empty and len(queryset) == 0:
+            if not self.allow_empty and len(object_list) == 0:
                 raise Http404
         # Hide unexposed fields
         for obj in object_list:
             self._hide_unexposed_fields(obj, self.expose_fields)
         c.update(self.extra_context)        
-        t = self.template_loader.get_template(template_name)
-        return HttpResponse(t.render(c), mimetype=self.mimetype)
+        t = self.get_template(template_name)
+        return HttpResponse(self.instrumentation.timed('render', t.render, c), mimetype=self.mimetype)
 
     def element(self, request, elem):
         """
         Renders single model objects to HttpResponse.
         """
+        from django.core.xheaders import populate_xheaders
+        from django.template import RequestContext
         template_name = '%s/%s_detail.html' % (self.template_dir, elem._meta.module_name)
-        t = self.template_loader.get_template(template_name)
+        t = self.get_template(template_name)
         c = RequestContext(request, {
             self.template_object_name : elem,
         }, self.context_processors)
         # Hide unexposed fields
         self._hide_unexposed_fields(elem, self.expose_fields)
         c.update(self.extra_context)
-        response = HttpResponse(t.render(c), mimetype=self.mimetype)
+        response = HttpResponse(self.instrumentation.timed('render', t.render, c), mimetype=self.mimetype)
         populate_xheaders(request, response, elem.__class__, getattr(elem, elem._meta.pk.name))
         return response
     
@@ -261,6 +399,7 @@ class TemplateResponder(object):
         """
         Renders error template (template name: error status code).
         """
+        from django.views.generic.simple import direct_to_template
         if not error_dict:
             error_dict = ErrorDict()
         response = direct_to_template(request, 
@@ -274,6 +413,8 @@ class TemplateResponder(object):
         """
         Render form for creation of new collection entry.
         """
+        from django import forms
+        from django.shortcuts import render_to_response
         ResourceForm = forms.form_for_model(queryset.model, form=form_class)
         if request.POST:
             form = ResourceForm(request.POST)
@@ -286,6 +427,8 @@ class TemplateResponder(object):
         """
         Render edit form for single entry.
         """
+        from django import forms
+        from django.shortcuts import render_to_response
         # Remove queryset cache by cloning the queryset
         queryset = queryset._clone()
         elem = queryset.get(**{queryset.model._meta.pk.name : pk})
@@ -0,0 +1,148 @@
+"""
+Database routing classes that can be plugged into
+model_resource.Collection to choose the database of each
+request, e.g. to serve reads from a replica and send writes
+to the primary. Routing to database aliases needs Django's
+support for multiple databases (Django 1.2 or later).
+"""
+from django.core.exceptions import ImproperlyConfigured
+from store import LocalStore
+from throttling import key_by_ip
+import random
+
+DEFAULT_DB_ALIAS = 'default'
+
+# Request methods that are served by the read database
+READ_METHODS = ('GET', 'HEAD')
+
+def use_database(queryset, alias):
+    """
+    Returns queryset bound to the database alias (None:
+    unchanged).
+    """
+    if alias is None:
+        return queryset
+    if not hasattr(queryset, 'using'):
+        raise ImproperlyConfigured('Database routing requires support for '
+                                   'multiple databases (Django 1.2 or later).')
+    return queryset.using(alias)
+
+def save_form(form, alias):
+    """
+    Saves the model of a valid ModelForm to the database alias
+    (None: the default database) and returns it.
+    """
+    if alias is None:
+        return form.save()
+    model = form.save(commit=False)
+    model.save(using=alias)
+    form.save_m2m()
+    return model
+
+def using_kwargs(alias):
+    """
+    Returns the keyword arguments that select the database
+    alias (None: the default database) in calls of the
+    functions of django.db.transaction.
+    """
+    import django.db
+    if not hasattr(django.db, 'connections'):
+        if alias is not None:
+            raise ImproperlyConfigured('Database routing requires support for '
+                                       'multiple databases (Django 1.2 or later).')
+        return {}
+    return {'using' : alias or DEFAULT_DB_ALIAS}
+
+def get_connection(alias):
+    """
+    Returns the connection to the database alias (None: the
+    default database).
+    """
+    import django.db
+    if not hasattr(django.db, 'connections'):
+        if alias is not None:
+            raise ImproperlyConfigured('Database routing requires support for '
+                                       'multiple databases (Django 1.2 or later).')
+        return django.db.connection
+    return django.db.connections[alias or DEFAULT_DB_ALIAS]
+
+class NoRouting(object):
+    """
+    No routing: Use Django's default database.
+    """
+    def db_for_read(self, request):
+        return None
+
+    def db_for_write(self, request):
+        return None
+
+    def written(self, request):
+        pass
+
+class ReplicaRouting(object):
+    """
+    Serves GET and HEAD requests from a read replica and all
+    other requests (and the reads they make, e.g. the lookup
+    of the model a PUT updates) from the primary. After a
+    client has written, its reads can optionally be pinned to
+    the primary for a few seconds, so that it sees its own
+    writes despite replication lag.
+    """
+    def __init__(self, read_using, write_using=DEFAULT_DB_ALIAS,
+                 sticky_seconds=0, store=None, key_func=key_by_ip):
+        """
+        read_using:
+            the alias of the replica, a list of aliases to choose
+            from at random or a function that takes the request
+            and returns an alias
+        write_using:
+            the alias of the primary (or a function like above);
+            default: 'default'
+        sticky_seconds:
+            number of seconds a client's reads go to the primary
+            after it has written; 0 to disable
+        store:
+            the store that remembers recent writers, e.g. a
+            store.CacheStore shared by all processes.
+            Default: a store.LocalStore of this process
+        key_func:
+            function that returns the identifier of the client
+            of a request (see throttling.key_by_ip etc.)
+        """
+        self.read_using = read_using
+        self.write_using = write_using
+        self.sticky_seconds = sticky_seconds
+        if store is None:
+            store = LocalStore()
+        self.store = store
+        self.key_func = key_func
+
+    def choose(self, using, request):
+        if callable(using):
+            return using(request)
+        if isinstance(using, (list, tuple)):
+            return random.choice(using)
+        return using
+
+    def is_pinned(self, request):
+        """
+        True if the client has written within sticky_seconds.
+        """
+        if not self.sticky_seconds:
+            return False
+        return bool(self.store.get('sticky:%s' % self.key_func(request)))
+
+    def db_for_read(self, request):
+        if self.is_pinned(request):
+            return self.db_for_write(request)
+        return self.choose(self.read_using, request)
+
+    def db_for_write(self, request):
+        return self.choose(self.write_using, request)
+
+    def written(self, request):
+        """
+        Called after a request has written to the database.
+        """
+        if self.sticky_seconds:
+            self.store.set('sticky:%s' % self.key_func(request), True, self.sticky_seconds)
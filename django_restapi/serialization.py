@@ -0,0 +1,162 @@
+"""
+Serializers for the representations that Django's
+serializers cannot produce: compound documents with
+included related objects (see includes) and the changes of
+a change feed (see sync). This module imports Django's
+serialization framework, so it is only loaded by the
+responders that render such a representation.
+"""
+from django.conf import settings
+from django.core.serializers import python, xml_serializer
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import simplejson
+from django.utils.xmlutils import SimplerXMLGenerator
+from includes import InvalidInclude
+from sync import SyncError
+
+class IncludedPythonSerializer(python.Serializer):
+    """
+    Serializes objects like Django's python serializer and
+    adds the included objects of each object as a dictionary
+    "includes" that maps relation names to lists of
+    serialized objects.
+    """
+    def serialize(self, queryset, **options):
+        self.included = options.pop('included', None)
+        self.include_path = options.pop('include_path', '')
+        return python.Serializer.serialize(self, queryset, **options)
+
+    def end_object(self, obj):
+        python.Serializer.end_object(self, obj)
+        if self.included is None:
+            return
+        includes = {}
+        for name, path, fields in self.included.children(self.include_path):
+            includes[name] = IncludedPythonSerializer().serialize(
+                self.included.get(path, obj._get_pk_val()), fields=fields,
+                included=self.included, include_path=path)
+        if includes:
+            self.objects[-1]['includes'] = includes
+
+class IncludedJSONSerializer(IncludedPythonSerializer):
+    """
+    JSON version of IncludedPythonSerializer.
+    """
+    def end_serialization(self):
+        self.options.pop('stream', None)
+        self.options.pop('fields', None)
+        simplejson.dump(self.objects, self.stream, cls=DjangoJSONEncoder, **self.options)
+
+    def getvalue(self):
+        if callable(getattr(self.stream, 'getvalue', None)):
+            return self.stream.getvalue()
+
+class IncludedXMLSerializer(xml_serializer.Serializer):
+    """
+    Serializes objects like Django's XML serializer and adds
+    an <include name="..."> element with the serialized
+    related objects for each included relation to each
+    <object> element.
+    """
+    def serialize(self, queryset, **options):
+        self.included = options.pop('included', None)
+        self.include_path = ''
+        return xml_serializer.Serializer.serialize(self, queryset, **options)
+
+    def end_object(self, obj):
+        if self.included is not None:
+            for name, path, fields in self.included.children(self.include_path):
+                self.xml.startElement('include', {'name' : name})
+                parent_path = self.include_path
+                self.include_path = path
+                for related in self.included.get(path, obj._get_pk_val()):
+                    self.start_object(related)
+                    self.handle_fields(related, fields)
+                    self.end_object(related)
+                self.include_path = parent_path
+                self.xml.endElement('include')
+        xml_serializer.Serializer.end_object(self, obj)
+
+    def handle_fields(self, obj, fields):
+        """
+        Serializes the fields of obj that are in fields
+        (None: all fields).
+        """
+        for field in obj._meta.local_fields:
+            if not field.serialize or (fields is not None and field.name not in fields):
+                continue
+            if field.rel is None:
+                self.handle_field(obj, field)
+            else:
+                self.handle_fk_field(obj, field)
+        for field in obj._meta.many_to_many:
+            if field.serialize and (fields is None or field.name in fields):
+                self.handle_m2m_field(obj, field)
+
+INCLUDED_SERIALIZERS = {
+    'python' : IncludedPythonSerializer,
+    'json' : IncludedJSONSerializer,
+    'xml' : IncludedXMLSerializer,
+}
+
+def serialize_included(format, object_list, included, **options):
+    """
+    Serializes object_list with the objects in included
+    (an IncludedObjects instance) embedded.
+    """
+    if not INCLUDED_SERIALIZERS.has_key(format):
+        raise InvalidInclude('Includes are not available in %s.' % format)
+    serializer = INCLUDED_SERIALIZERS[format]()
+    serializer.serialize(object_list, included=included, **options)
+    return serializer.getvalue()
+
+class ChangesXMLSerializer(xml_serializer.Serializer):
+    """
+    Serializes the changed objects like Django's XML
+    serializer, with the token and a <deleted pk="..."/>
+    element for each deleted object added to the
+    <django-objects> element. Django's XML deserializer
+    still reads the changed objects.
+    """
+    def serialize(self, queryset, **options):
+        self.changes = options.pop('changes')
+        return xml_serializer.Serializer.serialize(self, queryset, **options)
+
+    def start_serialization(self):
+        self.xml = SimplerXMLGenerator(self.stream,
+            self.options.get('encoding', settings.DEFAULT_CHARSET))
+        self.xml.startDocument()
+        self.xml.startElement('django-objects', {
+            'version' : '1.0',
+            'token' : self.changes.token,
+            'more' : self.changes.more and 'true' or 'false',
+        })
+
+    def end_serialization(self):
+        for pk in self.changes.deleted:
+            self.indent(1)
+            self.xml.addQuickElement('deleted', attrs={'pk' : pk})
+        xml_serializer.Serializer.end_serialization(self)
+
+def serialize_changes(format, changes, **options):
+    """
+    Serializes changes (a Changes instance). JSON (and
+    Python) documents are objects with the keys "objects"
+    (the serialized changed objects), "deleted", "token" and
+    "more".
+    """
+    if format == 'xml':
+        serializer = ChangesXMLSerializer()
+        serializer.serialize(changes.objects, changes=changes, **options)
+        return serializer.getvalue()
+    if format not in ('python', 'json'):
+        raise SyncError('Change feeds are not available in %s.' % format)
+    result = {
+        'objects' : python.Serializer().serialize(changes.objects, **options),
+        'deleted' : changes.deleted,
+        'token' : changes.token,
+        'more' : changes.more,
+    }
+    if format == 'python':
+        return result
+    return simplejson.dumps(result, cls=DjangoJSONEncoder)
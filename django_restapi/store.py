@@ -0,0 +1,177 @@
+"""
+Key-value stores with bounded size and expiring entries.
+They hold short-lived state such as digest nonce counters,
+either in the current process (LocalStore) or in Django's
+cache framework (CacheStore) so that all worker processes
+share it.
+"""
+import threading, time
+
+class LocalStore(object):
+    """
+    In-process store. Holds at most max_entries keys and
+    evicts the least recently used one when full. Expired
+    entries are dropped when they are accessed.
+    """
+    def __init__(self, max_entries=1000, timeout=300):
+        """
+        max_entries:
+            the maximum number of keys kept in memory
+        timeout:
+            default number of seconds after which an entry
+            expires
+        """
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._lock = threading.RLock()
+        self._clear()
+
+    def _clear(self):
+        # Doubly linked list of [prev, next, key, value, expires]
+        # nodes, ordered from least to most recently used.
+        self._map = {}
+        self._root = root = []
+        root[:] = [root, root, None, None, None]
+
+    def _unlink(self, node):
+        prev, next = node[0], node[1]
+        prev[1] = next
+        next[0] = prev
+
+    def _append(self, node):
+        root = self._root
+        last = root[0]
+        node[0], node[1] = last, root
+        last[1] = root[0] = node
+
+    def _evict(self):
+        """
+        Drops the least recently used entries until there
+        is room for one more key.
+        """
+        while len(self._map) >= self.max_entries:
+            node = self._root[1]
+            self._unlink(node)
+            del self._map[node[2]]
+
+    def _get_node(self, key, now):
+        node = self._map.get(key)
+        if node is not None and node[4] <= now:
+            self._unlink(node)
+            del self._map[key]
+            node = None
+        return node
+
+    def get(self, key, default=None):
+        now = time.time()
+        self._lock.acquire()
+        try:
+            node = self._get_node(key, now)
+            if node is None:
+                return default
+            self._unlink(node)
+            self._append(node)
+            return node[3]
+        finally:
+            self._lock.release()
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        now = time.time()
+        self._lock.acquire()
+        try:
+            node = self._get_node(key, now)
+            if node is not None:
+                self._unlink(node)
+                del self._map[key]
+            self._evict()
+            node = [None, None, key, value, now + timeout]
+            self._append(node)
+            self._map[key] = node
+        finally:
+            self._lock.release()
+
+    def add(self, key, value, timeout=None):
+        """
+        Sets key only if it does not exist yet. Returns True
+        if the value was stored.
+        """
+        self._lock.acquire()
+        try:
+            if self._get_node(key, time.time()) is not None:
+                return False
+            self.set(key, value, timeout)
+            return True
+        finally:
+            self._lock.release()
+
+    def delete(self, key):
+        self._lock.acquire()
+        try:
+            node = self._map.pop(key, None)
+            if node is not None:
+                self._unlink(node)
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return len(self._map)
+
+def has_shared_cache():
+    """
+    Returns True if Django's cache backend is shared by all
+    processes (e.g. memcached, database or file cache), False
+    for the per-process local memory and dummy caches.
+    """
+    from django.conf import settings
+    caches = getattr(settings, 'CACHES', None)
+    if caches:
+        backend = caches.get('default', {}).get('BACKEND', '')
+    else:
+        backend = settings.CACHE_BACKEND.split(':', 1)[0]
+    backend = backend.lower()
+    return not ('locmem' in backend or 'dummy' in backend)
+
+class CacheStore(object):
+    """
+    Store backed by Django's cache framework. With a shared
+    cache backend (e.g. memcached) all processes see the same
+    entries. Size limits and eviction are up to the backend.
+    """
+    def __init__(self, prefix='restapi', timeout=300, cache=None):
+        """
+        prefix:
+            string prepended to all keys to avoid collisions
+            with other users of the cache
+        timeout:
+            default number of seconds after which an entry
+            expires
+        cache:
+            the cache backend instance; default:
+            django.core.cache.cache
+        """
+        if cache is None:
+            from django.core.cache import cache
+        self.cache = cache
+        self.prefix = prefix
+        self.timeout = timeout
+
+    def make_key(self, key):
+        return '%s:%s' % (self.prefix, key)
+
+    def get(self, key, default=None):
+        return self.cache.get(self.make_key(key), default)
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        self.cache.set(self.make_key(key), value, int(timeout))
+
+    def add(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        return self.cache.add(self.make_key(key), value, int(timeout))
+
+    def delete(self, key):
+        self.cache.delete(self.make_key(key))
@@ -0,0 +1,166 @@
+"""
+Change feeds that can be plugged into
+model_resource.Collection to let clients synchronize a
+collection incrementally: GET /polls/?since=<token> returns
+only the objects changed after the token, the primary keys
+of the objects deleted since then and a new token. Deletions
+are recorded in a log of tombstones (models.Tombstone), so
+'django_restapi' must be in INSTALLED_APPS.
+"""
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.encoding import smart_str, smart_unicode
+from models import Tombstone
+
+class SyncError(Exception):
+    """
+    Raised if a sync token is invalid or the changes cannot
+    be rendered in the requested format.
+    """
+
+def model_label(model):
+    return '%s.%s' % (model._meta.app_label, model._meta.module_name)
+
+class NoChangeFeed(object):
+    """
+    No change feed: The GET parameter "since" is ignored and
+    deletions are not recorded.
+    """
+    def get_changes(self, queryset, token):
+        return None
+
+    def deleted(self, model, pk, using=None):
+        pass
+
+class Changes(object):
+    """
+    The result of a sync request.
+    """
+    def __init__(self, objects, deleted, token, more):
+        """
+        objects:
+            the changed objects, in the order of their changes
+        deleted:
+            the primary keys (strings) of the deleted objects
+        token:
+            the token of the next sync request
+        more:
+            True if there are further changes; the client
+            should repeat the request with the new token
+        """
+        self.objects = objects
+        self.deleted = deleted
+        self.token = token
+        self.more = more
+
+class ChangeFeed(object):
+    """
+    Change feed for models with a field whose value grows on
+    every save, e.g. a DateTimeField with auto_now=True or a
+    version number. The changes of each request are read with
+    one query for the objects and one for the tombstones.
+
+    The feed relies on objects being saved in the order of
+    their field values: an object saved by a transaction that
+    commits after a later value has been read is missed. Use
+    a version number assigned in the saving transaction, or
+    serialize writes, if that matters.
+
+    Only deletions through the resource (Entry.delete) are
+    recorded. Tombstones are recorded per model, so clients
+    of a collection with a filtered queryset may also receive
+    the keys of deleted objects they never had; clients
+    should apply the deletions before the changed objects.
+    """
+    def __init__(self, field, max_changes=1000):
+        """
+        field:
+            the name of the field that records the change
+            order, e.g. 'updated'
+        max_changes:
+            the maximum number of changed objects (and of
+            deleted objects) per response
+        """
+        self.field = field
+        self.max_changes = max_changes
+
+    def get_field(self, model):
+        return model._meta.get_field(self.field)
+
+    def make_token(self, value, pk, tombstone_id):
+        """
+        Returns the token that addresses the changes after the
+        object with the given change field value and primary
+        key (both None: before all objects) and after the
+        tombstone with the given id.
+        """
+        if value is None:
+            value = pk = ''
+        text = '%d|%s|%s' % (tombstone_id, smart_str(value), smart_str(pk))
+        return urlsafe_b64encode(text)
+
+    def parse_token(self, model, token):
+        """
+        Returns (change field value, primary key, tombstone id)
+        of a token made by make_token().
+        """
+        try:
+            tombstone_id, value, pk = urlsafe_b64decode(smart_str(token)).split('|', 2)
+            tombstone_id = int(tombstone_id)
+            if value:
+                value = self.get_field(model).to_python(value)
+                pk = model._meta.pk.to_python(pk)
+            else:
+                value = pk = None
+        except (TypeError, ValueError, ValidationError):
+            raise SyncError('Invalid token.')
+        return value, pk, tombstone_id
+
+    def get_changes(self, queryset, token):
+        """
+        Returns the Changes of the objects of queryset after
+        token. An empty token returns all objects (the initial
+        synchronization).
+        """
+        model = queryset.model
+        tombstones = Tombstone.objects.filter(model=model_label(model))
+        if token:
+            value, pk, tombstone_id = self.parse_token(model, token)
+            deleted = list(tombstones.filter(id__gt=tombstone_id)[:self.max_changes + 1])
+        else:
+            # Deletions before the initial synchronization do
+            # not matter. Read the position in the log first,
+            # so that no deletion goes unnoticed.
+            value = pk = None
+            tombstone_id = 0
+            for tombstone in tombstones.order_by('-id')[:1]:
+                tombstone_id = tombstone.id
+            deleted = []
+        field_name = self.get_field(model).name
+        pk_name = model._meta.pk.name
+        if value is not None:
+            queryset = queryset.filter(Q(**{'%s__gt' % field_name : value}) |
+                                       Q(**{field_name : value, '%s__gt' % pk_name : pk}))
+        objects = list(queryset.order_by(field_name, pk_name)[:self.max_changes + 1])
+        more = len(objects) > self.max_changes or len(deleted) > self.max_changes
+        objects, deleted = objects[:self.max_changes], deleted[:self.max_changes]
+        if objects:
+            value = getattr(objects[-1], self.get_field(model).attname)
+            pk = objects[-1]._get_pk_val()
+        if deleted:
+            tombstone_id = deleted[-1].id
+        return Changes(objects, [t.object_pk for t in deleted],
+                       self.make_token(value, pk, tombstone_id), more)
+
+    def deleted(self, model, pk, using=None):
+        """
+        Records a tombstone for the object of model with the
+        primary key pk, which has just been deleted from the
+        database alias using.
+        """
+        tombstone = Tombstone(model=model_label(model), object_pk=smart_unicode(pk))
+        if using is None:
+            tombstone.save()
+        else:
+            tombstone.save(using=using)
@@ -0,0 +1,174 @@
+"""
+Throttling classes that can be plugged into resources
+to limit how many requests a single client may make.
+"""
+from store import LocalStore
+from hashlib import sha1
+import math, threading, time
+
+def key_by_ip(request):
+    """
+    Identifies clients by their IP address.
+    """
+    return 'ip:%s' % request.META.get('REMOTE_ADDR', '')
+
+def key_by_user(request):
+    """
+    Identifies clients by the logged in Django user or by
+    the username in the claims of a verified token (see
+    authentication.TokenAuthentication). Falls back to the
+    IP address; the username in an Authorization header is
+    not used before it has been verified, so a client could
+    otherwise pick any bucket.
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated():
+        return 'user:%s' % user.pk
+    claims = getattr(request, 'token_claims', None)
+    if claims and claims.get('username'):
+        return 'user:%s' % sha1(claims['username'].encode('utf-8')).hexdigest()
+    return key_by_ip(request)
+
+def key_by_token(request):
+    """
+    Identifies clients by the token they have been
+    authenticated with (see authentication.TokenAuthentication),
+    otherwise by the logged in Django user. Falls back to the
+    IP address; unverified Authorization headers are not
+    used, so a client could otherwise get a new bucket with
+    every request.
+    """
+    if getattr(request, 'token_claims', None) is not None:
+        return 'auth:%s' % sha1(request.META.get('HTTP_AUTHORIZATION', '')).hexdigest()
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated():
+        return 'user:%s' % user.pk
+    return key_by_ip(request)
+
+class NoThrottling(object):
+    """
+    No throttling: Permit every request.
+    """
+    def check(self, request):
+        """
+        Returns the number of seconds the client has to wait
+        before the request is permitted, 0 if it is permitted.
+        Called after the request has been authenticated.
+        """
+        return 0
+
+    def check_failures(self, request):
+        """
+        Returns the number of seconds the client has to wait
+        before it may try to authenticate again, 0 if it may.
+        Called before the request is authenticated.
+        """
+        return 0
+
+    def failed(self, request):
+        """
+        Records a failed authentication of the client.
+        """
+        pass
+
+class TokenBucketThrottling(object):
+    """
+    Token bucket throttling. Every client has a bucket that
+    holds up to burst tokens and is refilled at rate tokens
+    per second. Each request takes one token; requests that
+    find the bucket empty are refused.
+    
+    Failed authentications are counted per IP address in a
+    separate bucket with the same rate and burst. Once it is
+    empty, requests from that address are refused before
+    they are authenticated, so that guessing passwords is
+    limited as well, without the cost of checking them.
+    
+    A bucket is read and written back under a lock of this
+    process. With a CacheStore that several processes share,
+    requests that arrive at the same time in different
+    processes may take the same token, so the limits are
+    approximate: a client can exceed burst by up to one
+    request per process.
+    """
+    def __init__(self, rate, burst=None, key_func=key_by_ip, store=None):
+        """
+        rate:
+            the number of requests per second a client may
+            make in the long run
+        burst:
+            the number of requests a client may make at once.
+            Default: rate, but at least 1
+        key_func:
+            A function which takes a request and returns the
+            key that identifies the client, e.g. key_by_ip,
+            key_by_user or key_by_token
+        store:
+            The store (see django_restapi.store) that holds the
+            buckets. Use a CacheStore with a shared cache backend
+            to apply the limits (approximately) across all
+            processes.
+            Default: LocalStore with up to 10000 clients
+        """
+        self.rate = float(rate)
+        if burst is None:
+            burst = max(1, rate)
+        self.burst = burst
+        self.key_func = key_func
+        # A bucket that has not been touched for this long
+        # is full again and need not be stored any more.
+        self.timeout = int(math.ceil(burst / self.rate)) + 1
+        if store is None:
+            store = LocalStore(max_entries=10000, timeout=self.timeout)
+        self.store = store
+        self._lock = threading.Lock()
+
+    def take(self, key, consume=True):
+        """
+        Takes a token from the bucket key (only checks whether
+        it holds one if consume is False). Returns the number
+        of seconds until the bucket holds a token again if it
+        is empty, 0 otherwise.
+        """
+        self._lock.acquire()
+        try:
+            now = time.time()
+            tokens, last = self.store.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens >= 1:
+                if consume:
+                    self.store.set(key, (tokens - 1, now), self.timeout)
+                return 0
+            self.store.set(key, (tokens, now), self.timeout)
+            return (1 - tokens) / self.rate
+        finally:
+            self._lock.release()
+
+    def check(self, request):
+        """
+        Takes a token from the client's bucket. Returns the number
+        of seconds until the bucket holds a token again if it is
+        empty, 0 otherwise.
+        """
+        return self.take('throttle:%s' % self.key_func(request))
+
+    def check_failures(self, request):
+        """
+        Returns the number of seconds until the failure bucket
+        of the client's IP address holds a token again if it is
+        empty, 0 otherwise.
+        """
+        return self.take('throttle:failed:%s' % key_by_ip(request), False)
+
+    def failed(self, request):
+        """
+        Takes a token from the failure bucket of the client's
+        IP address.
+        """
+        self.take('throttle:failed:%s' % key_by_ip(request))
+
+def retry_after(wait):
+    """
+    Formats a waiting time for the Retry-After header.
+    """
+    return str(int(math.ceil(wait)))
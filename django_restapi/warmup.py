@@ -0,0 +1,108 @@
+"""
+Warm-up of the resources of a project before a worker takes
+traffic. The first requests of a new worker otherwise pay
+for importing the urlconf, populating the URL resolver,
+building form classes (modelform_factory), loading
+serializers and compiling templates.
+
+Call warm_up() once per process, e.g. in the WSGI script
+after the handler has been created, or in the parent process
+of a preforking server so that the workers share the results:
+
+    from django_restapi.warmup import warm_up
+    report = warm_up()
+
+The management command warm_up runs the same steps and
+prints their timings; it checks that all resources can be
+warmed up, but does not warm up other processes.
+"""
+from django.core.urlresolvers import get_resolver, RegexURLResolver
+from django.core.exceptions import ViewDoesNotExist
+from resource import ResourceBase, url_registries
+import time
+
+class WarmUpReport(object):
+    """
+    Timings of a warm-up.
+    """
+    def __init__(self):
+        self.timings = []
+        self.started = time.time()
+        self.finished = None
+
+    def add(self, name, seconds):
+        self.timings.append((name, seconds))
+
+    def get_seconds(self):
+        return (self.finished or time.time()) - self.started
+
+    def __str__(self):
+        lines = ['%9.1f ms  %s' % (seconds * 1000, name) for (name, seconds) in self.timings]
+        lines.append('Warmed up %d resources in %.1f ms' % (
+            len(self.timings) - 1, self.get_seconds() * 1000))
+        return '\n'.join(lines)
+
+def iter_callbacks(resolver, prefix=''):
+    """
+    Yields the regular expression and the view of all URL
+    patterns of resolver and of the urlconfs it includes.
+    """
+    for pattern in resolver.url_patterns:
+        regex = prefix + pattern.regex.pattern.lstrip('^')
+        if isinstance(pattern, RegexURLResolver):
+            for item in iter_callbacks(pattern, regex):
+                yield item
+        else:
+            try:
+                yield regex, pattern.callback
+            except (ImportError, ViewDoesNotExist):
+                pass
+
+def find_resources(resolver):
+    """
+    Returns (name, resource) pairs of the resources in the
+    URL patterns of resolver and in resource registries,
+    followed by the collections that other resources wrap
+    (e.g. an ExportResource's). The names are the URL
+    patterns or registered paths.
+    """
+    resources = []
+    for regex, callback in iter_callbacks(resolver):
+        if isinstance(callback, ResourceBase):
+            resources.append(('^' + regex, callback))
+    for registry in url_registries:
+        for resource, routes in registry.routes.items():
+            path = '/'.join([str(segment) for segment in routes[0].segments])
+            resources.append(('^%s%s/' % (registry.prefix, path), resource))
+    for name, resource in list(resources):
+        collection = getattr(resource, 'collection', None)
+        if isinstance(collection, ResourceBase):
+            resources.append(('%s (collection)' % name, collection))
+    unique = []
+    seen = set()
+    for name, resource in resources:
+        if id(resource) not in seen:
+            seen.add(id(resource))
+            unique.append((name, resource))
+    return unique
+
+def warm_up(urlconf=None):
+    """
+    Imports the urlconf (default: settings.ROOT_URLCONF),
+    populates the URL resolver, compiles the resource
+    registries and calls the warm_up() method of each
+    resource. Returns a WarmUpReport.
+    """
+    report = WarmUpReport()
+    start = time.time()
+    resolver = get_resolver(urlconf)
+    resolver.reverse_dict # Imports the urlconfs
+    for registry in url_registries:
+        registry.compile()
+    report.add('URL resolver', time.time() - start)
+    for name, resource in find_resources(resolver):
+        start = time.time()
+        resource.warm_up()
+        report.add(name, time.time() - start)
+    report.finished = time.time()
+    return report
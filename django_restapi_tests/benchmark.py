@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+"""
+Benchmarks for the request hot paths of django_restapi.
+
+Creates a test database with generated polls, choices and
+people and sends list, entry, create, update and delete
+requests through Django's test client to the example
+resources with JSONResponder, XMLResponder and
+TemplateResponder. For each scenario it reports requests
+per second, latency percentiles and the peak resident
+memory of the process.
+
+Results can be stored as JSON and compared with the
+results of another revision:
+
+    python benchmark.py --output new.json --compare old.json
+"""
+import os, random, sys, time
+from optparse import OptionParser
+
+try:
+    import settings # Assumed to be in the same directory.
+except ImportError:
+    sys.stderr.write("Error: Can't find the file 'settings.py' in the directory containing %r.\n" % __file__)
+    sys.exit(1)
+
+from django.core.management import setup_environ
+setup_environ(settings)
+
+from django.db import connection, transaction
+from django.test.client import Client
+from django.utils import simplejson
+from django_restapi_tests.people.models import Person
+from django_restapi_tests.polls.models import Poll, Choice
+
+# Collection URLs of the example resources for each representation
+FORMATS = {
+    'xml' : ('/xml/polls/', '/xml/choices/'),
+    'json' : ('/json/polls/', '/json/polls/%(poll_id)d/choices/'),
+    'html' : ('/html/polls/', '/html/choices/'),
+}
+
+def setup_database(database_name=None, verbosity=0):
+    """
+    Creates the test database (in memory unless a file name
+    is given) and returns its name.
+    """
+    if database_name:
+        from django.conf import settings as django_settings
+        django_settings.TEST_DATABASE_NAME = database_name
+    return connection.creation.create_test_db(verbosity, autoclobber=True)
+
+def generate_fixtures(polls=1000, choices_per_poll=5, people=100, friends_per_person=5, seed=0):
+    """
+    Adds generated polls with choices and people with
+    friendships to the database. Returns the ids of the
+    new polls.
+    """
+    rng = random.Random(seed)
+    transaction.enter_transaction_management()
+    transaction.managed(True)
+    try:
+        poll_ids = []
+        for i in xrange(polls):
+            poll = Poll.objects.create(question='Question %d?' % i, password='secret')
+            poll_ids.append(poll.id)
+            for j in xrange(choices_per_poll):
+                Choice.objects.create(poll=poll, choice='Choice %d' % j, votes=rng.randint(0, 1000))
+        persons = [Person.objects.create(name='Person %d' % i) for i in xrange(people)]
+        for person in persons:
+            friends = rng.sample(persons, min(friends_per_person, len(persons)))
+            person.friends.add(*[friend for friend in friends if friend != person])
+        transaction.commit()
+    finally:
+        transaction.leave_transaction_management()
+    return poll_ids
+
+def percentile(sorted_values, p):
+    """
+    Returns the p-th percentile (nearest rank) of a sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    index = int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1
+    return sorted_values[max(0, min(index, len(sorted_values) - 1))]
+
+def peak_rss_kb():
+    """
+    Returns the peak resident set size of this process in
+    kilobytes, or None where the resource module is missing.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        maxrss = maxrss // 1024 # bytes on Mac OS X
+    return maxrss
+
+def summarize(latencies, errors, seconds):
+    """
+    Returns the statistics of a series of requests.
+    """
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        'requests' : count,
+        'errors' : errors,
+        'seconds' : seconds,
+        'requests_per_second' : seconds and count / seconds or 0.0,
+        'latency_ms' : {
+            'mean' : count and sum(latencies) / count * 1000 or 0.0,
+            'p50' : percentile(latencies, 50) * 1000,
+            'p90' : percentile(latencies, 90) * 1000,
+            'p99' : percentile(latencies, 99) * 1000,
+            'max' : count and latencies[-1] * 1000 or 0.0,
+        },
+    }
+
+def run_requests(client, requests, warmup=0):
+    """
+    Sends (method, path, data, expected status) requests and
+    returns their statistics. The first warmup requests are
+    repeated beforehand without being measured.
+    """
+    methods = {
+        'GET' : client.get,
+        'POST' : client.post,
+        'PUT' : lambda path, data: client.post(path, data, REQUEST_METHOD='PUT'),
+        'DELETE' : lambda path, data: client.get(path, data, REQUEST_METHOD='DELETE'),
+    }
+    for method, path, data, status in requests[:warmup]:
+        methods[method](path, data)
+    latencies = []
+    errors = 0
+    started = time.time()
+    for method, path, data, status in requests:
+        start = time.time()
+        response = methods[method](path, data)
+        latencies.append(time.time() - start)
+        if response.status_code != status:
+            errors += 1
+    result = summarize(latencies, errors, time.time() - started)
+    result['peak_rss_kb'] = peak_rss_kb()
+    return result
+
+def run_benchmarks(poll_ids, requests=200, warmup=5, formats=None, seed=0):
+    """
+    Runs all scenarios and returns a dictionary that maps
+    scenario names (e.g. "json.list") to their statistics.
+    """
+    rng = random.Random(seed)
+    client = Client()
+    results = {}
+    pages = max(1, len(poll_ids) // 10)
+    for format in formats or sorted(FORMATS.keys()):
+        polls_url, choices_url = FORMATS[format]
+        scenarios = []
+        scenarios.append(('list', [('GET', polls_url, {'page' : rng.randint(1, pages)}, 200)
+                                   for i in xrange(requests)]))
+        scenarios.append(('entry', [('GET', '%s%d/' % (polls_url, rng.choice(poll_ids)), {}, 200)
+                                    for i in xrange(requests)]))
+        scenarios.append(('choices', [('GET', choices_url % {'poll_id' : rng.choice(poll_ids)}, {}, 200)
+                                      for i in xrange(requests)]))
+        for name, scenario in scenarios:
+            results['%s.%s' % (format, name)] = run_requests(client, scenario, warmup)
+
+        # Create polls first, then update and delete them
+        new_poll = {'question' : 'New poll?', 'password' : 'secret', 'pub_date' : '2008-01-01'}
+        scenario = [('POST', polls_url, new_poll, 201) for i in xrange(requests)]
+        results['%s.create' % format] = run_requests(client, scenario)
+        created_ids = [poll.id for poll in Poll.objects.filter(question='New poll?')]
+        changed_poll = {'question' : 'Changed poll?', 'password' : 'secret', 'pub_date' : '2008-01-02'}
+        scenario = [('PUT', '%s%d/' % (polls_url, poll_id), changed_poll, 200) for poll_id in created_ids]
+        results['%s.update' % format] = run_requests(client, scenario)
+        scenario = [('DELETE', '%s%d/' % (polls_url, poll_id), {}, 200) for poll_id in created_ids]
+        results['%s.delete' % format] = run_requests(client, scenario)
+
+    scenario = [('GET', '/friends/', {}, 200) for i in xrange(requests)]
+    results['generic.friends'] = run_requests(client, scenario)
+    return results
+
+def get_revision():
+    """
+    Returns the git revision of the working copy, if any.
+    """
+    try:
+        pipe = os.popen('git rev-parse --short HEAD 2>/dev/null')
+        revision = pipe.read().strip()
+        pipe.close()
+        return revision or None
+    except OSError:
+        return None
+
+def print_results(results, stream=sys.stdout):
+    stream.write('%-18s %8s %7s %9s %9s %9s %10s\n' % (
+        'scenario', 'req/s', 'errors', 'p50 ms', 'p90 ms', 'p99 ms', 'rss KB'))
+    for name in sorted(results.keys()):
+        result = results[name]
+        latency = result['latency_ms']
+        stream.write('%-18s %8.1f %7d %9.2f %9.2f %9.2f %10s\n' % (
+            name, result['requests_per_second'], result['errors'],
+            latency['p50'], latency['p90'], latency['p99'], result['peak_rss_kb']))
+
+def print_comparison(old_results, new_results, stream=sys.stdout):
+    stream.write('%-18s %10s %10s %8s %10s %10s %8s\n' % (
+        'scenario', 'old req/s', 'new req/s', 'change', 'old p50', 'new p50', 'change'))
+    for name in sorted(new_results.keys()):
+        if name not in old_results:
+            continue
+        old, new = old_results[name], new_results[name]
+        old_rps, new_rps = old['requests_per_second'], new['requests_per_second']
+        old_p50, new_p50 = old['latency_ms']['p50'], new['latency_ms']['p50']
+        stream.write('%-18s %10.1f %10.1f %+7.1f%% %10.2f %10.2f %+7.1f%%\n' % (
+            name, old_rps, new_rps, old_rps and (new_rps / old_rps - 1) * 100 or 0.0,
+            old_p50, new_p50, old_p50 and (new_p50 / old_p50 - 1) * 100 or 0.0))
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--polls', type='int', default=1000,
+                      help='number of generated polls [%default]')
+    parser.add_option('--choices', type='int', default=5,
+                      help='number of choices per poll [%default]')
+    parser.add_option('--people', type='int', default=100,
+                      help='number of generated people [%default]')
+    parser.add_option('--requests', type='int', default=200,
+                      help='number of requests per scenario [%default]')
+    parser.add_option('--warmup', type='int', default=5,
+                      help='number of unmeasured requests before read scenarios [%default]')
+    parser.add_option('--format', action='append', dest='formats', choices=FORMATS.keys(),
+                      help='representation to benchmark (xml, json, html); may be repeated')
+    parser.add_option('--seed', type='int', default=0,
+                      help='seed for fixtures and request mix [%default]')
+    parser.add_option('--output', help='write the results to this JSON file')
+    parser.add_option('--compare', help='compare with the results in this JSON file')
+    options, args = parser.parse_args()
+
+    setup_database()
+    poll_ids = generate_fixtures(options.polls, options.choices, options.people, seed=options.seed)
+    results = run_benchmarks(poll_ids, options.requests, options.warmup,
+                             options.formats, options.seed)
+    print_results(results)
+
+    if options.output:
+        import django
+        data = {
+            'revision' : get_revision(),
+            'time' : time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python' : sys.version.split()[0],
+            'django' : django.get_version(),
+            'options' : {
+                'polls' : options.polls,
+                'choices' : options.choices,
+                'people' : options.people,
+                'requests' : options.requests,
+                'seed' : options.seed,
+            },
+            'results' : results,
+        }
+        output = open(options.output, 'w')
+        simplejson.dump(data, output, indent=2, sort_keys=True)
+        output.close()
+
+    if options.compare:
+        old_data = simplejson.load(open(options.compare))
+        print
+        print 'Compared with revision %s:' % old_data.get('revision')
+        print_comparison(old_data['results'], results)
+
+if __name__ == "__main__":
+    main()
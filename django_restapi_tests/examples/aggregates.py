@@ -0,0 +1,41 @@
+from django.conf.urls.defaults import *
+from django.db.models import Count, Sum
+from django_restapi.aggregates import AggregateResource
+from django_restapi.model_resource import Collection
+from django_restapi.responder import *
+from django_restapi_tests.polls.models import Choice
+
+# Aggregates
+#
+# /aggregated/votes/ lists the total votes and the number of
+# choices of each poll, computed by one GROUP BY query;
+# /aggregated/votes/?poll=1 only those of poll 1.
+# /aggregated/votes/summary/ serves the same from a summary
+# in memory that is updated when choices are saved or deleted.
+
+aggregated_choice_resource = Collection(
+    queryset = Choice.objects.all(),
+    permitted_methods = ('GET', 'POST', 'PUT', 'DELETE'),
+    expose_fields = ('id', 'poll', 'choice', 'votes'),
+    responder = JSONResponder(paginate_by=10)
+)
+
+votes_resource = AggregateResource(
+    collection = aggregated_choice_resource,
+    group_by = 'poll',
+    aggregates = {'votes' : Sum('votes'), 'choices' : Count('id')}
+)
+
+votes_summary_resource = AggregateResource(
+    collection = aggregated_choice_resource,
+    group_by = 'poll',
+    aggregates = {'votes' : Sum('votes'), 'choices' : Count('id')},
+    summary = True,
+    max_age = 300
+)
+
+urlpatterns = patterns('',
+   url(r'^aggregated/votes/$', votes_resource),
+   url(r'^aggregated/votes/summary/$', votes_summary_resource),
+   url(r'^aggregated/choices/(.*?)/?$', aggregated_choice_resource)
+)
@@ -1,5 +1,6 @@
 from django.conf.urls.defaults import *
 from django_restapi.model_resource import Collection
+from django_restapi.resource import TokenResource
 from django_restapi.responder import *
 from django_restapi.authentication import *
 from django_restapi_tests.polls.models import Poll
@@ -16,6 +17,17 @@ basicauth_poll_resource = Collection(
     authentication = HttpBasicAuthentication()
 )
 
+# HTTP Basic with cached verifications
+#
+# Repeated requests with the same credentials skip
+# the user lookup and password check.
+
+cachedauth_poll_resource = Collection(
+    queryset = Poll.objects.all(), 
+    responder = XMLResponder(),
+    authentication = HttpBasicAuthentication(credential_cache=CredentialCache())
+)
+
 # HTTP Digest
 
 def digest_authfunc(username, realm):
@@ -36,7 +48,25 @@ digestauth_poll_resource = Collection(
     authentication = HttpDigestAuthentication(digest_authfunc, 'realm1')
 )
 
+# Signed tokens
+#
+# POST username and password to /token/ to get a token,
+# then send it as "Authorization: Bearer <token>".
+
+token_authentication = TokenAuthentication()
+
+token_resource = TokenResource(token_authentication)
+
+tokenauth_poll_resource = Collection(
+    queryset = Poll.objects.all(),
+    responder = XMLResponder(),
+    authentication = token_authentication
+)
+
 urlpatterns = patterns('',
    url(r'^basic/polls/(.*?)/?$', basicauth_poll_resource),
-   url(r'^digest/polls/(.*?)/?$', digestauth_poll_resource)
+   url(r'^cachedbasic/polls/(.*?)/?$', cachedauth_poll_resource),
+   url(r'^digest/polls/(.*?)/?$', digestauth_poll_resource),
+   url(r'^token/$', token_resource),
+   url(r'^token/polls/(.*?)/?$', tokenauth_poll_resource)
 )
\ No newline at end of file
@@ -0,0 +1,19 @@
+from django.conf.urls.defaults import *
+from django_restapi.resource import BatchResource
+
+# Batch requests
+#
+# POST a JSON list of sub-requests to /batch/, e.g.
+# [{"method": "GET", "path": "/json/polls/1/"},
+#  {"method": "PUT", "path": "/json/polls/2/", "data": {...}}]
+# The sub-requests to /batch/atomic/ run in a single
+# transaction that is rolled back if one of them fails.
+
+batch_resource = BatchResource(max_requests=20)
+
+atomic_batch_resource = BatchResource(max_requests=20, transactional=True)
+
+urlpatterns = patterns('',
+   url(r'^batch/$', batch_resource),
+   url(r'^batch/atomic/$', atomic_batch_resource)
+)
@@ -0,0 +1,32 @@
+from django.conf.urls.defaults import *
+from django_restapi.caching import ResponseCache
+from django_restapi.model_resource import Collection
+from django_restapi.responder import *
+from django_restapi_tests.polls.models import Poll
+
+# Response cache
+#
+# GET requests to /cached/polls/ are answered from a cache of
+# rendered responses (header X-Cache: hit). Every write through
+# the resource and every saved or deleted Poll invalidates the
+# cache. For ten seconds after that, the outdated responses are
+# still served while a single request renders them again
+# (X-Cache: stale).
+
+poll_cache = ResponseCache(
+    name = 'polls',
+    timeout = 60,
+    stale_seconds = 10
+)
+
+cached_poll_resource = Collection(
+    queryset = Poll.objects.all(),
+    permitted_methods = ('GET', 'POST', 'PUT', 'DELETE'),
+    expose_fields = ('id', 'question', 'pub_date'),
+    responder = JSONResponder(paginate_by=10),
+    response_cache = poll_cache
+)
+
+urlpatterns = patterns('',
+   url(r'^cached/polls/(.*?)/?$', cached_poll_resource)
+)
@@ -0,0 +1,31 @@
+from django.conf.urls.defaults import *
+from django_restapi.events import EventStreamResource
+from django_restapi.model_resource import Collection
+from django_restapi.responder import *
+from django_restapi_tests.polls.models import Poll
+
+# Server-sent events
+#
+# /events/polls/ streams the polls created, updated and deleted
+# (through /live/polls/ or anywhere else in this process) as
+# server-sent events, e.g. for
+#   new EventSource('/events/polls/')
+# Connections are closed after 30 seconds; EventSource then
+# reconnects and resumes with the header Last-Event-ID.
+
+live_poll_resource = Collection(
+    queryset = Poll.objects.all(),
+    permitted_methods = ('GET', 'POST', 'PUT', 'DELETE'),
+    expose_fields = ('id', 'question', 'pub_date'),
+    responder = JSONResponder(paginate_by=10)
+)
+
+poll_stream = EventStreamResource(
+    collection = live_poll_resource,
+    timeout = 30
+)
+
+urlpatterns = patterns('',
+   url(r'^live/polls/(.*?)/?$', live_poll_resource),
+   url(r'^events/polls/$', poll_stream)
+)
@@ -0,0 +1,28 @@
+from django.conf.urls.defaults import *
+from django_restapi.export import ExportResource
+from django_restapi_tests.examples.basic import xml_poll_resource, xml_choice_resource
+
+# Exports
+#
+# /export/polls/ downloads all polls (with the fields exposed
+# by /xml/polls/) as CSV, /export/polls/?format=json as JSON.
+# The same export can be written to a file with
+#   python manage.py export_collection \
+#       django_restapi_tests.examples.basic.xml_poll_resource \
+#       --format=csv --output=polls.csv
+
+poll_export = ExportResource(
+    collection = xml_poll_resource,
+    format = 'csv'
+)
+
+choice_export = ExportResource(
+    collection = xml_choice_resource,
+    format = 'json',
+    chunk_size = 3
+)
+
+urlpatterns = patterns('',
+   url(r'^export/polls/$', poll_export),
+   url(r'^export/choices/$', choice_export)
+)
@@ -1,29 +1,27 @@
 from django.conf.urls.defaults import *
-from django.http import HttpResponseRedirect
-from django.shortcuts import render_to_response
-from django_restapi.resource import Resource
+from django_restapi.relationship import RelationshipCollection, RelationshipEntry
 from django_restapi_tests.people.models import *
 
 # Urls for a resource that does not map 1:1 
-# to Django models.
+# to Django models: the pairs of friends, read
+# from the intermediary table of Person.friends.
 
-class FriendshipCollection(Resource):
-    def read(self, request):
-        friendships = get_friendship_list()
-        context = {'friendships':friendships}
-        return render_to_response('people/friends_list.html', context)
+friendship_collection = RelationshipCollection(
+    model = Person,
+    field_name = 'friends',
+    template_name = 'people/friends_list.html',
+    order_field = 'name',
+    paginate_by = 50,
+    template_object_name = 'friendship'
+)
 
-class FriendshipEntry(Resource):
-    def read(self, request, person_id, friend_id):
-        friendship = get_friendship(person_id, friend_id)
-        context = {'friendship':friendship}
-        return render_to_response('people/friends_detail.html', context)
-    def delete(self, request, person_id, friend_id):
-        friendship = get_friendship(person_id, friend_id)
-        friendship[0].friends.remove(friendship[1])
-        return HttpResponseRedirect('/friends/')
+friendship_entry = RelationshipEntry(
+    collection = friendship_collection,
+    template_name = 'people/friends_detail.html',
+    permitted_methods = ('GET', 'DELETE')
+)
 
 urlpatterns = patterns('',
-   url(r'^friends/$', FriendshipCollection()),
-   url(r'^friends/(?P<person_id>\d+)-(?P<friend_id>\d+)/$', FriendshipEntry(permitted_methods=('GET','DELETE'))),
-)
\ No newline at end of file
+   url(r'^friends/$', friendship_collection),
+   url(r'^friends/(?P<source_pk>\d+)-(?P<target_pk>\d+)/$', friendship_entry),
+)
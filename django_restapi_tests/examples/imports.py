@@ -0,0 +1,32 @@
+from django.conf.urls.defaults import *
+from django_restapi.imports import ImportResource
+from django_restapi.model_resource import Collection
+from django_restapi.responder import *
+from django_restapi_tests.polls.models import Poll
+
+# Bulk import
+#
+# POST a CSV file (Content-Type: text/csv) with the header
+#   question,password,pub_date
+# or NDJSON (Content-Type: application/x-ndjson) to
+# /import/polls/ to add polls in batches of 100. The response
+# links (Location header) to the status of the import,
+# /import/polls/<id>/, with the progress and the rows that
+# failed validation.
+
+imported_poll_resource = Collection(
+    queryset = Poll.objects.all(),
+    permitted_methods = ('GET', 'POST'),
+    expose_fields = ('id', 'question', 'pub_date'),
+    responder = JSONResponder(paginate_by=10)
+)
+
+poll_import = ImportResource(
+    collection = imported_poll_resource,
+    batch_size = 100,
+    max_body_size = 10 * 1024 * 1024
+)
+
+urlpatterns = patterns('',
+   url(r'^import/polls/(.*?)/?$', poll_import)
+)
@@ -0,0 +1,47 @@
+from django.conf.urls.defaults import *
+from django_restapi.model_resource import Collection
+from django_restapi.responder import *
+from django_restapi.includes import Includes
+from django_restapi_tests.polls.models import Poll, Choice
+
+# Compound documents
+#
+# /compound/json/polls/?include=choice_set returns the polls
+# with their choices embedded (one query for all choices).
+# /compound/xml/choices/?include=poll,poll.choice_set returns
+# the choices with their polls and the polls' choices.
+
+poll_includes = Includes({
+    'choice_set' : ('choice', 'votes'),
+}, max_size=100)
+
+choice_includes = Includes({
+    'poll' : ('question', 'pub_date'),
+    'poll.choice_set' : ('choice', 'votes'),
+}, max_size=100)
+
+compound_json_poll_resource = Collection(
+    queryset = Poll.objects.all(),
+    responder = JSONResponder(paginate_by=10),
+    expose_fields = ('id', 'question', 'pub_date'),
+    includes = poll_includes
+)
+
+compound_xml_poll_resource = Collection(
+    queryset = Poll.objects.all(),
+    responder = XMLResponder(paginate_by=10),
+    expose_fields = ('id', 'question', 'pub_date'),
+    includes = poll_includes
+)
+
+compound_xml_choice_resource = Collection(
+    queryset = Choice.objects.all(),
+    responder = XMLResponder(paginate_by=10),
+    includes = choice_includes
+)
+
+urlpatterns = patterns('',
+   url(r'^compound/json/polls/(.*?)/?$', compound_json_poll_resource),
+   url(r'^compound/xml/polls/(.*?)/?$', compound_xml_poll_resource),
+   url(r'^compound/xml/choices/(.*?)/?$', compound_xml_choice_resource)
+)
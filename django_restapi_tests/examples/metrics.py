@@ -0,0 +1,42 @@
+from django.conf.urls.defaults import *
+from django_restapi.model_resource import Collection
+from django_restapi.resource import MetricsResource
+from django_restapi.responder import *
+from django_restapi.authentication import *
+from django_restapi.instrumentation import Instrumentation, MetricsRegistry
+from django_restapi_tests.polls.models import Poll, Choice
+
+# Instrumentation
+#
+# The time spent in authentication, queries, rendering and
+# in the whole dispatch of each request is recorded per
+# resource. /metrics/ exports the histograms in the
+# Prometheus text format (username 'rest', password 'rest').
+
+registry = MetricsRegistry()
+
+metrics_poll_resource = Collection(
+    queryset = Poll.objects.all(),
+    responder = JSONResponder(paginate_by=10),
+    instrumentation = Instrumentation('polls', registry)
+)
+
+metrics_choice_resource = Collection(
+    queryset = Choice.objects.all(),
+    responder = TemplateResponder(
+        template_dir = 'polls',
+        template_object_name = 'choice'
+    ),
+    instrumentation = Instrumentation('choices', registry)
+)
+
+metrics_resource = MetricsResource(
+    registry = registry,
+    authentication = HttpBasicAuthentication()
+)
+
+urlpatterns = patterns('',
+   url(r'^metrics/$', metrics_resource),
+   url(r'^measured/polls/(.*?)/?$', metrics_poll_resource),
+   url(r'^measured/choices/(.*?)/?$', metrics_choice_resource)
+)
@@ -0,0 +1,34 @@
+from django.conf.urls.defaults import *
+from django_restapi.model_resource import Collection
+from django_restapi.resource import ProfileResource
+from django_restapi.responder import *
+from django_restapi.authentication import *
+from django_restapi.profiling import SamplingProfiler, ProfileRegistry
+from django_restapi_tests.polls.models import Poll
+
+# Profiling
+#
+# One in five requests to /profiled/polls/ is profiled, and
+# every request with the header "X-Profile: secret". The
+# aggregated profiles are served by /profiles/ (username
+# 'rest', password 'rest'), e.g.
+# /profiles/?resource=polls&method=GET&sort=time
+
+profile_registry = ProfileRegistry()
+
+profiled_poll_resource = Collection(
+    queryset = Poll.objects.all(),
+    responder = JSONResponder(paginate_by=10),
+    profiling = SamplingProfiler('polls', rate=5, secret='secret',
+                                 registry=profile_registry)
+)
+
+profile_resource = ProfileResource(
+    registry = profile_registry,
+    authentication = HttpBasicAuthentication()
+)
+
+urlpatterns = patterns('',
+   url(r'^profiles/$', profile_resource),
+   url(r'^profiled/polls/(.*?)/?$', profiled_poll_resource)
+)
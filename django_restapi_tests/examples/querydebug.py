@@ -0,0 +1,34 @@
+from django.conf.urls.defaults import *
+from django_restapi.model_resource import Collection
+from django_restapi.responder import *
+from django_restapi.querydebug import QueryInspector
+from django_restapi_tests.polls.models import Poll, Choice
+
+# Query inspection
+#
+# Every request records its SQL queries. The response
+# headers X-Query-Count, X-Query-Time, X-Query-Budget and
+# X-Query-Suspects summarize them.
+#
+# The choice list template shows the poll of each choice,
+# which takes one query per choice (an N+1 problem).
+
+inspected_poll_resource = Collection(
+    queryset = Poll.objects.all(),
+    responder = JSONResponder(),
+    query_inspection = QueryInspector(budget=1)
+)
+
+inspected_choice_resource = Collection(
+    queryset = Choice.objects.all(),
+    responder = TemplateResponder(
+        template_dir = 'inspected',
+        template_object_name = 'choice'
+    ),
+    query_inspection = QueryInspector(budget=2)
+)
+
+urlpatterns = patterns('',
+   url(r'^inspected/polls/(.*?)/?$', inspected_poll_resource),
+   url(r'^inspected/choices/(.*?)/?$', inspected_choice_resource)
+)
@@ -0,0 +1,35 @@
+from django_restapi.model_resource import Collection, NestedCollection
+from django_restapi.registry import ResourceRegistry
+from django_restapi.responder import *
+from django_restapi_tests.polls.models import Poll, Choice
+
+# Registered resources
+#
+# Instead of one URL pattern per resource, the resources are
+# registered with a ResourceRegistry that generates their
+# collection and entry URLs: /registered/polls/ and
+# /registered/polls/[poll_id]/, /registered/polls/[poll_id]/choices/
+# and /registered/polls/[poll_id]/choices/[number of choice]/.
+
+registered_poll_resource = Collection(
+    queryset = Poll.objects.all(),
+    permitted_methods = ('GET', 'POST', 'PUT', 'DELETE'),
+    expose_fields = ('id', 'question', 'pub_date'),
+    responder = JSONResponder(paginate_by=10)
+)
+
+registered_choice_resource = NestedCollection(
+    queryset = Choice.objects.all(),
+    parent_field = 'poll',
+    entry_kwarg = 'choice_num',
+    ordinal = True,
+    permitted_methods = ('GET', 'POST', 'PUT', 'DELETE'),
+    expose_fields = ('id', 'poll_id', 'choice', 'votes'),
+    responder = JSONResponder(paginate_by=5)
+)
+
+registry = ResourceRegistry('registered/')
+registry.register('polls', registered_poll_resource)
+registry.register('polls/<int:poll_id>/choices', registered_choice_resource)
+
+urlpatterns = registry.urlpatterns
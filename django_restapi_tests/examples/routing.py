@@ -0,0 +1,31 @@
+from django.conf.urls.defaults import *
+from django_restapi.model_resource import Collection
+from django_restapi.responder import *
+from django_restapi.routing import ReplicaRouting
+from django_restapi_tests.polls.models import Poll
+
+# Read replica
+#
+# GET requests to /replicated/polls/ are served from the
+# database 'replica' (see DATABASES in settings.py), all other
+# requests from 'default'. For five seconds after a write, the
+# reads of the same client go to 'default' as well.
+# Needs Django 1.2 or later.
+
+replica_routing = ReplicaRouting(
+    read_using = 'replica',
+    write_using = 'default',
+    sticky_seconds = 5
+)
+
+replicated_poll_resource = Collection(
+    queryset = Poll.objects.all(),
+    permitted_methods = ('GET', 'POST', 'PUT', 'DELETE'),
+    expose_fields = ('id', 'question', 'pub_date'),
+    responder = JSONResponder(paginate_by=10),
+    routing = replica_routing
+)
+
+urlpatterns = patterns('',
+   url(r'^replicated/polls/(.*?)/?$', replicated_poll_resource)
+)
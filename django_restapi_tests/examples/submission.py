@@ -7,13 +7,13 @@ from django_restapi_tests.polls.models import Poll
 fullxml_poll_resource = Collection(
     queryset = Poll.objects.all(), 
     permitted_methods = ('GET', 'POST', 'PUT', 'DELETE'),
-    receiver = XMLReceiver(),
+    receiver = XMLReceiver(max_size=64*1024),
     responder = XMLResponder(),
 )
 fulljson_poll_resource = Collection(
     queryset = Poll.objects.all(),
     permitted_methods = ('GET', 'POST', 'PUT', 'DELETE'),
-    receiver = JSONReceiver(),
+    receiver = JSONReceiver(max_size=64*1024),
     responder = JSONResponder()
 )
 
@@ -0,0 +1,36 @@
+from django.conf.urls.defaults import *
+from django_restapi.model_resource import Collection
+from django_restapi.responder import *
+from django_restapi.sync import ChangeFeed
+from django_restapi_tests.polls.models import Poll
+
+# Incremental synchronization
+#
+# GET /synced/polls/?since= returns all polls and a token;
+# GET /synced/polls/?since=<token> returns only the polls
+# changed (by Poll.updated) after the token, the primary keys
+# of the polls deleted through the resource since then and the
+# next token. Without "since" the resource works as usual.
+
+poll_changes = ChangeFeed('updated', max_changes=100)
+
+synced_poll_resource = Collection(
+    queryset = Poll.objects.all(),
+    permitted_methods = ('GET', 'POST', 'PUT', 'DELETE'),
+    expose_fields = ('id', 'question', 'pub_date'),
+    responder = JSONResponder(paginate_by=10),
+    change_feed = poll_changes
+)
+
+synced_xml_poll_resource = Collection(
+    queryset = Poll.objects.all(),
+    permitted_methods = ('GET', 'DELETE'),
+    expose_fields = ('id', 'question', 'pub_date'),
+    responder = XMLResponder(paginate_by=10),
+    change_feed = poll_changes
+)
+
+urlpatterns = patterns('',
+   url(r'^synced/polls/(.*?)/?$', synced_poll_resource),
+   url(r'^synced/xml/polls/(.*?)/?$', synced_xml_poll_resource)
+)
@@ -0,0 +1,35 @@
+from django.conf.urls.defaults import *
+from django.http import HttpResponse
+from django_restapi.model_resource import Collection
+from django_restapi.resource import Resource
+from django_restapi.responder import *
+from django_restapi.throttling import *
+from django_restapi_tests.examples.authentication import token_authentication
+from django_restapi_tests.polls.models import Poll
+
+# Throttling
+#
+# Every client (identified by IP address) may make two
+# requests at once and one request per minute after that.
+# Further requests are answered with "429 Too Many Requests".
+# Pings are limited per user of a verified token.
+
+throttled_poll_resource = Collection(
+    queryset = Poll.objects.all(),
+    responder = JSONResponder(),
+    throttling = TokenBucketThrottling(rate=1.0/60, burst=2)
+)
+
+class PingResource(Resource):
+    def read(self, request):
+        return HttpResponse('pong')
+
+throttled_ping_resource = PingResource(
+    authentication = token_authentication,
+    throttling = TokenBucketThrottling(rate=1.0/60, burst=1, key_func=key_by_user)
+)
+
+urlpatterns = patterns('',
+   url(r'^throttled/polls/(.*?)/?$', throttled_poll_resource),
+   url(r'^throttled/ping/$', throttled_ping_resource)
+)
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+"""
+Load test for the example resources under concurrency.
+
+Starts a local WSGI server with several worker processes
+(optionally multi-threaded) that serves the example urlconf
+from a generated test database, and replays a mix of
+requests against it from an increasing number of concurrent
+client processes. For each concurrency level it reports
+throughput, latency percentiles and error rates.
+
+The request mix is synthetic by default. A recorded mix can
+be replayed with --replay FILE, where each line is either
+"METHOD PATH" or a JSON object with the keys method, path
+and optionally body, content_type and headers.
+
+    python loadtest.py --workers 4 --concurrency 1,4,16
+"""
+import httplib, os, random, signal, sys, tempfile, time
+from optparse import OptionParser
+from SocketServer import ThreadingMixIn
+from wsgiref.simple_server import make_server, WSGIServer, WSGIRequestHandler
+
+# Sets up the Django environment and provides the fixtures
+from benchmark import setup_database, generate_fixtures, percentile, FORMATS
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection
+from django.utils import simplejson
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+def start_server(workers=4, threaded=False, port=0):
+    """
+    Binds a WSGI server for the Django handler and forks
+    worker processes that accept connections on the shared
+    socket. Returns the server address and the worker pids.
+    """
+    server_class = threaded and ThreadingWSGIServer or WSGIServer
+    server = make_server('127.0.0.1', port, WSGIHandler(),
+                         server_class, QuietRequestHandler)
+    server.request_queue_size = 128
+    # Each worker needs its own database connection
+    connection.close()
+    pids = []
+    for i in xrange(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                server.serve_forever()
+            finally:
+                os._exit(0)
+        pids.append(pid)
+    server.socket.close()
+    return server.server_address, pids
+
+def stop_server(pids):
+    for pid in pids:
+        os.kill(pid, signal.SIGTERM)
+    for pid in pids:
+        os.waitpid(pid, 0)
+
+def basic_auth_header():
+    from base64 import b64encode
+    return {'Authorization' : 'Basic %s' % b64encode('rest:rest')}
+
+def synthetic_mix(poll_ids, size=1000, seed=0):
+    """
+    Returns a list of requests that read, create and update
+    polls and choices through all example representations.
+    """
+    rng = random.Random(seed)
+    pages = max(1, len(poll_ids) // 10)
+    requests = []
+    for i in xrange(size):
+        format = rng.choice(FORMATS.keys())
+        polls_url, choices_url = FORMATS[format]
+        poll_id = rng.choice(poll_ids)
+        action = rng.random()
+        if action < 0.35:
+            request = {'method' : 'GET', 'path' : '%s%d/' % (polls_url, poll_id)}
+        elif action < 0.65:
+            request = {'method' : 'GET', 'path' : '%s?page=%d' % (polls_url, rng.randint(1, pages))}
+        elif action < 0.8:
+            request = {'method' : 'GET', 'path' : choices_url % {'poll_id' : poll_id}}
+        elif action < 0.85:
+            request = {'method' : 'GET', 'path' : '/basic/polls/', 'headers' : basic_auth_header()}
+        elif action < 0.93:
+            request = {'method' : 'POST', 'path' : polls_url,
+                       'body' : 'question=New+poll%3F&password=secret&pub_date=2008-01-01'}
+        else:
+            request = {'method' : 'PUT', 'path' : '%s%d/' % (polls_url, poll_id),
+                       'body' : 'question=Changed+poll%3F&password=secret&pub_date=2008-01-02'}
+        requests.append(request)
+    return requests
+
+def load_mix(filename):
+    """
+    Reads a recorded request mix.
+    """
+    requests = []
+    for line in open(filename):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('{'):
+            request = simplejson.loads(line)
+        else:
+            method, path = line.split(None, 1)
+            request = {'method' : method, 'path' : path}
+        requests.append(request)
+    return requests
+
+def send_request(host, port, request, timeout=30):
+    """
+    Sends a single request and returns its status code.
+    """
+    headers = dict(request.get('headers') or {})
+    body = request.get('body')
+    if body is not None:
+        headers.setdefault('Content-Type', request.get('content_type', 'application/x-www-form-urlencoded'))
+    conn = httplib.HTTPConnection(host, port)
+    try:
+        if hasattr(conn, 'timeout'):
+            conn.timeout = timeout
+        conn.request(str(request['method']), str(request['path']), body, headers)
+        response = conn.getresponse()
+        response.read()
+        return response.status
+    finally:
+        conn.close()
+
+def run_client(args):
+    """
+    Replays requests until the deadline. Returns a list of
+    (latency, status) pairs; status is None for requests that
+    failed without a response.
+    """
+    host, port, requests, deadline, seed = args
+    rng = random.Random(seed)
+    index = rng.randint(0, len(requests) - 1)
+    samples = []
+    while time.time() < deadline:
+        request = requests[index % len(requests)]
+        index += 1
+        start = time.time()
+        try:
+            status = send_request(host, port, request)
+        except Exception:
+            status = None
+        samples.append((time.time() - start, status))
+    return samples
+
+def run_level(address, requests, concurrency, duration, seed=0):
+    """
+    Runs concurrency client processes for duration seconds
+    and returns the statistics of all their requests.
+    """
+    from multiprocessing import Pool
+    host, port = address
+    pool = Pool(concurrency)
+    try:
+        deadline = time.time() + duration
+        started = time.time()
+        results = pool.map(run_client, [(host, port, requests, deadline, seed + i)
+                                        for i in xrange(concurrency)])
+        elapsed = time.time() - started
+    finally:
+        pool.close()
+        pool.join()
+    samples = []
+    for result in results:
+        samples.extend(result)
+    latencies = [latency for (latency, status) in samples]
+    latencies.sort()
+    count = len(samples)
+    failed = len([1 for (latency, status) in samples if status is None])
+    server_errors = len([1 for (latency, status) in samples if status is not None and status >= 500])
+    client_errors = len([1 for (latency, status) in samples if status is not None and 400 <= status < 500])
+    return {
+        'concurrency' : concurrency,
+        'requests' : count,
+        'seconds' : elapsed,
+        'requests_per_second' : elapsed and count / elapsed or 0.0,
+        'latency_ms' : {
+            'p50' : percentile(latencies, 50) * 1000,
+            'p95' : percentile(latencies, 95) * 1000,
+            'p99' : percentile(latencies, 99) * 1000,
+            'max' : count and latencies[-1] * 1000 or 0.0,
+        },
+        'connection_errors' : failed,
+        'server_errors' : server_errors,
+        'client_errors' : client_errors,
+        'error_rate' : count and float(failed + server_errors) / count or 0.0,
+    }
+
+def print_levels(levels, stream=sys.stdout):
+    stream.write('%5s %9s %9s %9s %9s %9s %7s %7s %7s\n' % (
+        'conc', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms', 'errors', '4xx', 'err %'))
+    for level in levels:
+        latency = level['latency_ms']
+        stream.write('%5d %9.1f %9.2f %9.2f %9.2f %9.2f %7d %7d %6.2f%%\n' % (
+            level['concurrency'], level['requests_per_second'],
+            latency['p50'], latency['p95'], latency['p99'], latency['max'],
+            level['connection_errors'] + level['server_errors'], level['client_errors'],
+            level['error_rate'] * 100))
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--workers', type='int', default=4,
+                      help='number of server worker processes [%default]')
+    parser.add_option('--threads', action='store_true', default=False,
+                      help='serve requests in threads within each worker')
+    parser.add_option('--warm-up', action='store_true', default=False, dest='warm_up',
+                      help='warm up the resources before the workers are forked')
+    parser.add_option('--concurrency', default='1,2,4,8,16',
+                      help='comma separated numbers of concurrent clients [%default]')
+    parser.add_option('--duration', type='float', default=10,
+                      help='seconds per concurrency level [%default]')
+    parser.add_option('--polls', type='int', default=1000,
+                      help='number of generated polls [%default]')
+    parser.add_option('--replay', help='replay the requests in this file instead of the synthetic mix')
+    parser.add_option('--seed', type='int', default=0,
+                      help='seed for fixtures and request mix [%default]')
+    parser.add_option('--port', type='int', default=0,
+                      help='server port; default: any free port')
+    parser.add_option('--output', help='write the results to this JSON file')
+    options, args = parser.parse_args()
+
+    # Worker processes share the database, so it must be a file
+    fd, database_name = tempfile.mkstemp(suffix='.db', prefix='restapi-loadtest-')
+    os.close(fd)
+    pids = []
+    try:
+        setup_database(database_name)
+        poll_ids = generate_fixtures(options.polls, people=0, seed=options.seed)
+        if options.replay:
+            requests = load_mix(options.replay)
+        else:
+            requests = synthetic_mix(poll_ids, seed=options.seed)
+        if options.warm_up:
+            from django_restapi.warmup import warm_up
+            print warm_up()
+        address, pids = start_server(options.workers, options.threads, options.port)
+        print 'Serving on %s:%d with %d worker processes%s' % (address[0], address[1],
+            options.workers, options.threads and ' (threaded)' or '')
+        levels = []
+        for concurrency in [int(c) for c in options.concurrency.split(',')]:
+            levels.append(run_level(address, requests, concurrency, options.duration, options.seed))
+        print_levels(levels)
+    finally:
+        stop_server(pids)
+        os.remove(database_name)
+
+    if options.output:
+        output = open(options.output, 'w')
+        simplejson.dump({
+            'workers' : options.workers,
+            'threads' : options.threads,
+            'duration' : options.duration,
+            'replay' : options.replay,
+            'levels' : levels,
+        }, output, indent=2, sort_keys=True)
+        output.close()
+
+if __name__ == "__main__":
+    main()
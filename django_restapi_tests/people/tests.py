@@ -31,4 +31,117 @@ class GenericTest(TestCase):
         self.failUnlessEqual(response.status_code, 302)
 
         response = self.client.get(url)
-        self.failUnlessEqual(response.status_code, 404)
\ No newline at end of file
+        self.failUnlessEqual(response.status_code, 404)
+
+class RelationshipTest(TestCase):
+    
+    fixtures = ['initial_data.json']
+    
+    def get_expected_pairs(self):
+        from django_restapi_tests.people.models import Person
+        pairs = set()
+        for person in Person.objects.all():
+            for friend in person.friends.all():
+                pair = [person, friend]
+                pair.sort(key=lambda p: (p.name, p.id))
+                pairs.add((pair[0].id, pair[1].id))
+        pairs = list(pairs)
+        names = dict([(p.id, p.name) for p in Person.objects.all()])
+        pairs.sort(key=lambda (a, b): (names[a], names[b], a, b))
+        return pairs
+    
+    def test_pairs(self):
+        from django_restapi.querydebug import QueryInspector
+        from django_restapi_tests.examples.generic_resource import friendship_collection
+        expected = self.get_expected_pairs()
+        pairs = [(a.id, b.id) for (a, b) in friendship_collection.get_pairs()]
+        self.failUnlessEqual(pairs, expected)
+        
+        # Pages are cut from the ordered list of pairs
+        pairs = friendship_collection.get_pairs(limit=5, offset=5)
+        self.failUnlessEqual([(a.id, b.id) for (a, b) in pairs], expected[5:10])
+        
+        # Pairs are found in either direction
+        a, b = expected[0]
+        for source_pk, target_pk in ((a, b), (b, a)):
+            pair = friendship_collection.get_pair(source_pk, target_pk)
+            self.failUnlessEqual((pair[0].id, pair[1].id), (a, b))
+        
+        # Listing and entry lookup take a single query each
+        inspector = QueryInspector(headers=False)
+        response = inspector.inspect(self.client.get, '/friends/')
+        self.failUnlessEqual(response.status_code, 200)
+        self.failUnlessEqual(response.query_report.count, 1)
+        self.failUnlessEqual(response.content.count('<li>'), len(expected))
+        response = inspector.inspect(self.client.get, '/friends/%d-%d/' % (b, a))
+        self.failUnlessEqual(response.status_code, 200)
+        self.failUnlessEqual(response.query_report.count, 1)
+    
+    def test_pagination(self):
+        from django_restapi_tests.examples.generic_resource import friendship_collection
+        expected = self.get_expected_pairs()
+        paginate_by = friendship_collection.paginate_by
+        friendship_collection.paginate_by = 5
+        try:
+            response = self.client.get('/friends/', {'page' : 2})
+            self.failUnlessEqual(response.status_code, 200)
+            self.failUnlessEqual(response.content.count('<li>'), 5)
+            self.failUnless('?page=3' in response.content)
+            self.failUnless('?page=1' in response.content)
+            last_page = (len(expected) + 4) // 5
+            response = self.client.get('/friends/', {'page' : last_page + 1})
+            self.failUnlessEqual(response.status_code, 404)
+            response = self.client.get('/friends/', {'page' : 'x'})
+            self.failUnlessEqual(response.status_code, 404)
+        finally:
+            friendship_collection.paginate_by = paginate_by
+
+class PutParsingTest(TestCase):
+    
+    def get_request(self, data, method='PUT'):
+        from django.core.handlers.wsgi import WSGIRequest
+        from django.test.client import encode_multipart, BOUNDARY, MULTIPART_CONTENT, FakePayload
+        body = encode_multipart(BOUNDARY, data)
+        return WSGIRequest({
+            'REQUEST_METHOD': method,
+            'PATH_INFO': '/',
+            'CONTENT_TYPE': MULTIPART_CONTENT,
+            'CONTENT_LENGTH': len(body),
+            'wsgi.input': FakePayload(body),
+        })
+    
+    def test_multipart(self):
+        from django.conf import settings
+        from django.core.files.uploadedfile import TemporaryUploadedFile
+        from django_restapi.resource import load_put_and_files
+        from django_restapi.receiver import RequestEntityTooLarge
+        from StringIO import StringIO
+        
+        upload = StringIO('x' * 4096)
+        upload.name = 'upload.txt'
+        old_max_memory_size = settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        settings.FILE_UPLOAD_MAX_MEMORY_SIZE = 1024
+        try:
+            request = self.get_request({'name' : 'John', 'upload' : upload})
+            load_put_and_files(request)
+        finally:
+            settings.FILE_UPLOAD_MAX_MEMORY_SIZE = old_max_memory_size
+        self.failUnlessEqual(request.method, 'PUT')
+        self.failUnlessEqual(request.PUT['name'], 'John')
+        self.failIf(hasattr(request, '_post'))
+        
+        # Files larger than FILE_UPLOAD_MAX_MEMORY_SIZE are
+        # written to temporary files
+        self.failUnless(isinstance(request.FILES['upload'], TemporaryUploadedFile))
+        self.failUnlessEqual(request.FILES['upload'].size, 4096)
+        
+        # Other methods are left alone
+        request = self.get_request({'name' : 'Jim'}, method='PATCH')
+        load_put_and_files(request)
+        self.failIf(hasattr(request, 'PUT'))
+        
+        # Bodies that exceed max_size are refused before they are read
+        upload.seek(0)
+        request = self.get_request({'upload' : upload})
+        self.failUnlessRaises(RequestEntityTooLarge, load_put_and_files, request, 1024)
+        self.failUnlessEqual(request.environ['wsgi.input'].read(1), '-')
@@ -6,6 +6,8 @@ class Poll(models.Model):
     question = models.CharField(max_length=200)
     password = models.CharField(max_length=200)
     pub_date = models.DateTimeField(_('date published'), default=datetime.now)
+    # Change order for synchronization (see examples/sync.py)
+    updated = models.DateTimeField(auto_now=True, serialize=False)
     class Admin:
         pass
     def __str__(self):
@@ -13,10 +15,13 @@ class Poll(models.Model):
     def get_choice_list(self):
         return list(self.choice_set.order_by('id'))
     def get_choice_from_num(self, choice_num):
-        try:
-            return self.get_choice_list()[int(choice_num)-1]
-        except IndexError:
+        choice_num = int(choice_num)
+        if choice_num < 1:
             raise Choice.DoesNotExist
+        choices = list(self.choice_set.order_by('id')[choice_num-1:choice_num])
+        if not choices:
+            raise Choice.DoesNotExist
+        return choices[0]
 
 class Choice(models.Model):
     poll = models.ForeignKey(Poll)
@@ -27,7 +32,6 @@ class Choice(models.Model):
     def __str__(self):
         return self.choice
     def get_num(self):
-        try:
-            return self.poll.get_choice_list().index(self)+1
-        except ValueError:
-            raise Choice.DoesNotExist
\ No newline at end of file
+        if self.id is None:
+            raise Choice.DoesNotExist
+        return self.poll.choice_set.filter(id__lt=self.id).count() + 1
@@ -1,12 +1,16 @@
 from binascii import b2a_base64
+from cStringIO import StringIO
 from datetime import datetime
 from django.core import serializers
-from django.test import TestCase
+from django.http import HttpRequest
+from django.test import TestCase, TransactionTestCase
 from django.utils.functional import curry
-from django_restapi.authentication import HttpDigestAuthentication
-from django_restapi_tests.examples.authentication import digest_authfunc
+from django.utils import simplejson
+from django_restapi.authentication import HttpDigestAuthentication, TokenAuthentication
+from django_restapi.querydebug import QueryBudgetTestMixin
+from django_restapi_tests.examples.authentication import digest_authfunc, cachedauth_poll_resource
 from django_restapi_tests.polls.models import Poll
-import webbrowser, re
+import webbrowser, re, time
 
 DIGEST_AUTH = 'Digest username="%(username)s", realm="%(realm)s", nonce="%(nonce)s", uri="%(fullpath)s", algorithm=MD5, response="%(response)s", qop=%(qop)s, nc=%(nc)s, cnonce="%(cnonce)s"'
 
@@ -153,7 +157,6 @@ class BasicTest(TestCase):
         # Create choice
         url = '/json/polls/1/choices/'
         params = {
-            'poll' : 1, # TODO: Should be taken from URL
             'choice' : 'New choice',
             'votes' : 0
         }
@@ -260,7 +263,1018 @@ class BasicTest(TestCase):
         updated_poll = Poll.objects.get(id=2)
         self.failUnlessEqual(updated_poll.question, "Another question")
         self.failUnlessEqual(updated_poll.password, "another_secret")
+    
+    def test_invalid_submission(self):
+        for format, url in (('xml', '/fullxml/polls/'), ('json', '/fulljson/polls/')):
+            content_type = 'application/%s' % format
+            
+            # Malformed or empty documents
+            for data in ('', '<django-objects', '[{"pk": 1, ', '{"fields": {}}', '[]'):
+                response = self.client.post(url, data=data, content_type=content_type)
+                self.failUnlessEqual(response.status_code, 400)
+            
+            # Documents with more than one object
+            polls = [Poll(question='Q1', password='secret', pub_date=datetime.now()),
+                     Poll(question='Q2', password='secret', pub_date=datetime.now())]
+            response = self.client.post(url, data=serializers.serialize(format, polls), content_type=content_type)
+            self.failUnlessEqual(response.status_code, 400)
+            
+            # Documents that exceed the maximum size
+            poll = Poll(question='x' * 70000, password='secret', pub_date=datetime.now())
+            response = self.client.post(url, data=serializers.serialize(format, [poll]), content_type=content_type)
+            self.failUnlessEqual(response.status_code, 413)
+        
+class ThrottlingTest(TestCase):
+    
+    fixtures = ['initial_data.json']
+    
+    def test_token_bucket(self):
+        url = '/throttled/polls/'
+        response = self.client.get(url)
+        self.failUnlessEqual(response.status_code, 200)
+        response = self.client.get(url, REMOTE_ADDR='10.0.0.1')
+        self.failUnlessEqual(response.status_code, 200)
+        response = self.client.get('%s1/' % url)
+        self.failUnlessEqual(response.status_code, 200)
+        response = self.client.get(url)
+        self.failUnlessEqual(response.status_code, 429)
+        self.failUnless(0 < int(response['Retry-After']) <= 60)
+        self.failUnlessEqual(simplejson.loads(response.content)['status-code'], 429)
+        
+        # Other clients have their own buckets
+        response = self.client.get(url, REMOTE_ADDR='10.0.0.1')
+        self.failUnlessEqual(response.status_code, 200)
+        
+        # Pings are limited per verified user
+        from django_restapi_tests.examples.authentication import token_authentication
+        url = '/throttled/ping/'
+        def get_headers(username):
+            token = token_authentication.issue_token({'username' : username})
+            return {'HTTP_AUTHORIZATION': 'Bearer %s' % token}
+        response = self.client.get(url, **get_headers('rest'))
+        self.failUnlessEqual(response.status_code, 200)
+        response = self.client.get(url, REMOTE_ADDR='10.0.0.2', **get_headers('rest'))
+        self.failUnlessEqual(response.status_code, 429)
+        self.failUnless(response.has_header('Retry-After'))
+        response = self.client.get(url, **get_headers('other'))
+        self.failUnlessEqual(response.status_code, 200)
+        
+        # Unverified credentials do not select a bucket
+        from django_restapi.throttling import key_by_user, key_by_token
+        request = HttpRequest()
+        request.META['REMOTE_ADDR'] = '10.0.0.3'
+        request.META['HTTP_AUTHORIZATION'] = 'Basic %s' % b2a_base64('rest:wrong')[:-1]
+        self.failUnlessEqual(key_by_user(request), 'ip:10.0.0.3')
+        self.failUnlessEqual(key_by_token(request), 'ip:10.0.0.3')
+        request.token_claims = {'username' : 'rest'}
+        self.failUnless(key_by_token(request).startswith('auth:'))
+        
+        # Failed authentications are limited per IP address
+        # before the credentials are checked
+        headers = {'HTTP_AUTHORIZATION': 'Bearer invalid', 'REMOTE_ADDR': '10.0.0.4'}
+        response = self.client.get(url, **headers)
+        self.failUnlessEqual(response.status_code, 401)
+        response = self.client.get(url, **headers)
+        self.failUnlessEqual(response.status_code, 429)
+        self.failUnless(response.has_header('Retry-After'))
+        response = self.client.get(url, REMOTE_ADDR='10.0.0.5', **get_headers('third'))
+        self.failUnlessEqual(response.status_code, 200)
+
+class InstrumentationTest(TestCase):
+    
+    fixtures = ['initial_data.json']
+    
+    def test_metrics(self):
+        from django_restapi_tests.examples.metrics import registry
+        registry.clear()
+        for url in ('/measured/polls/', '/measured/polls/1/', '/measured/choices/'):
+            response = self.client.get(url)
+            self.failUnlessEqual(response.status_code, 200)
+        
+        # The metrics are only available to authorized users
+        response = self.client.get('/metrics/')
+        self.failUnlessEqual(response.status_code, 401)
+        headers = {
+            'HTTP_AUTHORIZATION': 'Basic %s' % b2a_base64('rest:rest')[:-1]
+        }
+        response = self.client.get('/metrics/', **headers)
+        self.failUnlessEqual(response.status_code, 200)
+        self.failUnless(response['Content-Type'].startswith('text/plain'))
+        lines = response.content.splitlines()
+        self.failUnless('# TYPE restapi_phase_duration_seconds histogram' in lines)
+        for resource, phase, count in (('polls', 'authentication', 2), ('polls', 'query', 2),
+                                       ('polls', 'render', 2), ('polls', 'dispatch', 2),
+                                       ('choices', 'query', 1), ('choices', 'render', 1)):
+            line = 'restapi_phase_duration_seconds_count{resource="%s",phase="%s"} %d' % (resource, phase, count)
+            self.failUnless(line in lines, line)
+            line = 'restapi_phase_duration_seconds_bucket{resource="%s",phase="%s",le="+Inf"} %d' % (resource, phase, count)
+            self.failUnless(line in lines, line)
+
+class NestedCollectionTest(TestCase):
+    
+    fixtures = ['initial_data.json']
+    
+    def test_ordinals(self):
+        from django_restapi.querydebug import QueryInspector
+        from django_restapi_tests.polls.models import Poll, Choice
+        poll = Poll.objects.get(id=1)
+        choices = poll.get_choice_list()
+        inspector = QueryInspector(headers=False)
+        
+        # Entries are found by ordinal with a single query
+        for num, choice in enumerate(choices):
+            response = inspector.inspect(self.client.get, '/json/polls/1/choices/%d/' % (num + 1))
+            self.failUnlessEqual(response.status_code, 200)
+            self.failUnlessEqual(simplejson.loads(response.content)[0]['pk'], choice.id)
+            self.failUnlessEqual(response.query_report.count, 1)
+            self.failUnlessEqual(choice.get_num(), num + 1)
+            self.failUnlessEqual(poll.get_choice_from_num(num + 1), choice)
+        for num in ('0', str(len(choices) + 1)):
+            response = self.client.get('/json/polls/1/choices/%s/' % num)
+            self.failUnlessEqual(response.status_code, 404)
+        self.failUnlessRaises(Choice.DoesNotExist, poll.get_choice_from_num, 0)
+        
+        # Choices of other polls are not part of the collection
+        other_choice = Choice.objects.exclude(poll=poll)[0]
+        response = self.client.get('/json/polls/1/choices/')
+        ids = [obj['pk'] for obj in simplejson.loads(response.content)]
+        self.failUnlessEqual(ids, [choice.id for choice in choices])
+        self.failIf(other_choice.id in ids)
+    
+    def test_parent_from_url(self):
+        from django_restapi_tests.polls.models import Choice
+        
+        # The poll is taken from the URL, not from the data
+        response = self.client.post('/json/polls/2/choices/', {'poll' : 1, 'choice' : 'New choice', 'votes' : 0})
+        self.failUnlessEqual(response.status_code, 201)
+        choice = Choice.objects.get(choice='New choice')
+        self.failUnlessEqual(choice.poll_id, 2)
+        self.failUnless(response['Location'].endswith('/json/polls/2/choices/%d/' % choice.get_num()))
+        
+        response = self.client.post('/json/polls/2/choices/%d/' % choice.get_num(),
+                                    {'choice' : 'Changed choice', 'votes' : 1},
+                                    REQUEST_METHOD='PUT')
+        self.failUnlessEqual(response.status_code, 200)
+        choice = Choice.objects.get(id=choice.id)
+        self.failUnlessEqual((choice.poll_id, choice.choice), (2, 'Changed choice'))
+
+class IncludesTest(TestCase):
+    
+    fixtures = ['initial_data.json']
+    
+    def test_json(self):
+        from django_restapi.querydebug import QueryInspector
+        from django_restapi_tests.polls.models import Poll
+        inspector = QueryInspector(headers=False)
+        response = inspector.inspect(self.client.get, '/compound/json/polls/', {'include' : 'choice_set'})
+        self.failUnlessEqual(response.status_code, 200)
+        polls = simplejson.loads(response.content)
+        for poll in polls:
+            choices = poll['includes']['choice_set']
+            expected = Poll.objects.get(id=poll['pk']).get_choice_list()
+            self.failUnlessEqual([choice['pk'] for choice in choices], [choice.id for choice in expected])
+            for choice in choices:
+                self.failUnlessEqual(sorted(choice['fields'].keys()), ['choice', 'votes'])
+            self.failIf(poll['fields'].has_key('password'))
+        # Count and page query plus one query for all choices
+        self.failUnlessEqual(response.query_report.count, 3)
+        
+        response = self.client.get('/compound/json/polls/1/', {'include' : 'choice_set'})
+        self.failUnlessEqual(response.status_code, 200)
+        poll = simplejson.loads(response.content)[0]
+        self.failUnlessEqual(len(poll['includes']['choice_set']), 3)
+        
+        # Without include, the representation is unchanged
+        response = self.client.get('/compound/json/polls/1/')
+        self.failIf(simplejson.loads(response.content)[0].has_key('includes'))
+    
+    def test_xml(self):
+        from xml.dom import minidom
+        response = self.client.get('/compound/xml/choices/1/', {'include' : 'poll.choice_set'})
+        self.failUnlessEqual(response.status_code, 200)
+        document = minidom.parseString(response.content)
+        choice = document.documentElement.getElementsByTagName('object')[0]
+        includes = [node for node in choice.childNodes if node.nodeName == 'include']
+        self.failUnlessEqual([node.getAttribute('name') for node in includes], ['poll'])
+        poll = includes[0].getElementsByTagName('object')[0]
+        self.failUnlessEqual(poll.getAttribute('pk'), '1')
+        fields = [node.getAttribute('name') for node in poll.childNodes if node.nodeName == 'field']
+        self.failUnlessEqual(fields, ['question', 'pub_date'])
+        choice_set = [node for node in poll.childNodes if node.nodeName == 'include'][0]
+        self.failUnlessEqual(choice_set.getAttribute('name'), 'choice_set')
+        self.failUnlessEqual(len(choice_set.getElementsByTagName('object')), 3)
+    
+    def test_limits(self):
+        from django_restapi_tests.examples.includes import poll_includes
+        # Undeclared relations and too deeply nested paths
+        for include in ('password', 'choice_set.poll', 'choice_set,foo'):
+            response = self.client.get('/compound/json/polls/', {'include' : include})
+            self.failUnlessEqual(response.status_code, 400)
+        # Too many included objects
+        max_size = poll_includes.max_size
+        poll_includes.max_size = 2
+        try:
+            response = self.client.get('/compound/json/polls/1/', {'include' : 'choice_set'})
+            self.failUnlessEqual(response.status_code, 400)
+        finally:
+            poll_includes.max_size = max_size
+
+class BatchTest(TransactionTestCase):
+    
+    fixtures = ['initial_data.json']
+    
+    def post_batch(self, url, subrequests, **extra):
+        return self.client.post(url, simplejson.dumps(subrequests),
+                                content_type='application/json', **extra)
+    
+    def test_body_size(self):
+        from django_restapi.receiver import RequestEntityTooLarge
+        from django_restapi.resource import BatchResource
+        resource = BatchResource(max_body_size=10)
+        # The body of a bare HttpRequest can't be read at all
+        request = HttpRequest()
+        request.META['CONTENT_LENGTH'] = '1000'
+        self.failUnlessRaises(RequestEntityTooLarge, resource.get_subrequests, request)
+    
+    def test_batch(self):
+        new_poll = {'question' : 'Batch poll?', 'password' : 'secret', 'pub_date' : '2008-01-01'}
+        response = self.post_batch('/batch/', [
+            {'method' : 'GET', 'path' : '/json/polls/1/'},
+            {'method' : 'GET', 'path' : '/json/polls/?page=1'},
+            {'method' : 'POST', 'path' : '/json/polls/', 'data' : new_poll},
+            {'method' : 'GET', 'path' : '/json/polls/1/choices/9/'},
+            {'method' : 'GET', 'path' : '/nowhere/'},
+            {'method' : 'GET', 'path' : '/basic/polls/'},
+            {'method' : 'POST', 'path' : '/batch/', 'body' : '[]'},
+        ])
+        self.failUnlessEqual(response.status_code, 200)
+        responses = simplejson.loads(response.content)['responses']
+        self.failUnlessEqual([r['status'] for r in responses], [200, 200, 201, 404, 404, 401, 400])
+        self.failUnlessEqual(simplejson.loads(responses[0]['body'])[0]['pk'], 1)
+        self.failUnless(responses[2]['headers']['Location'].startswith('/json/polls/'))
+        self.failUnlessEqual(Poll.objects.filter(question='Batch poll?').count(), 1)
+        
+        # Sub-requests get the headers of the batch request
+        headers = {
+            'HTTP_AUTHORIZATION': 'Basic %s' % b2a_base64('rest:rest')[:-1]
+        }
+        response = self.post_batch('/batch/', [{'method' : 'GET', 'path' : '/basic/polls/'}], **headers)
+        self.failUnlessEqual(simplejson.loads(response.content)['responses'][0]['status'], 200)
+        
+        # Non-ASCII data, headers and paths; invalid data fails
+        # only its own sub-request
+        unicode_poll = dict(new_poll, question=u'Umfrage \xfcber \u2603?')
+        response = self.post_batch('/batch/', [
+            {'method' : 'POST', 'path' : '/json/polls/', 'data' : unicode_poll,
+             'headers' : {'X-Note' : u'\xfc'}},
+            {'method' : 'GET', 'path' : u'/nowhere/\xfc/'},
+            {'method' : 'POST', 'path' : '/json/polls/', 'data' : 'question'},
+        ])
+        self.failUnlessEqual(response.status_code, 200)
+        responses = simplejson.loads(response.content)['responses']
+        self.failUnlessEqual([r['status'] for r in responses], [201, 404, 400])
+        self.failUnlessEqual(Poll.objects.filter(question=u'Umfrage \xfcber \u2603?').count(), 1)
+        
+        # Invalid and oversized batches
+        response = self.client.post('/batch/', 'no json', content_type='application/json')
+        self.failUnlessEqual(response.status_code, 400)
+        response = self.post_batch('/batch/', [{'method' : 'GET'}])
+        self.failUnlessEqual(response.status_code, 400)
+        response = self.post_batch('/batch/', [{'method' : 'GET', 'path' : '/json/polls/'}] * 21)
+        self.failUnlessEqual(response.status_code, 400)
+        response = self.client.get('/batch/')
+        self.failUnlessEqual(response.status_code, 405)
+    
+    def test_transactional(self):
+        changed_poll = {'question' : 'Changed poll?', 'password' : 'secret', 'pub_date' : '2008-01-01'}
+        response = self.post_batch('/batch/atomic/', [
+            {'method' : 'PUT', 'path' : '/json/polls/1/', 'data' : changed_poll},
+            {'method' : 'PUT', 'path' : '/json/polls/2/', 'data' : {'question' : 'Incomplete?'}},
+            {'method' : 'GET', 'path' : '/json/polls/1/'},
+        ])
+        self.failUnlessEqual(response.status_code, 400)
+        result = simplejson.loads(response.content)
+        self.failUnless(result['rolled_back'])
+        self.failUnlessEqual([r['status'] for r in result['responses']], [200, 400])
+        self.failIfEqual(Poll.objects.get(id=1).question, 'Changed poll?')
+        
+        response = self.post_batch('/batch/atomic/', [
+            {'method' : 'PUT', 'path' : '/json/polls/1/', 'data' : changed_poll},
+            {'method' : 'GET', 'path' : '/json/polls/1/'},
+        ])
+        self.failUnlessEqual(response.status_code, 200)
+        result = simplejson.loads(response.content)
+        self.failIf(result.has_key('rolled_back'))
+        self.failUnlessEqual(simplejson.loads(result['responses'][1]['body'])[0]['fields']['question'], 'Changed poll?')
+        self.failUnlessEqual(Poll.objects.get(id=1).question, 'Changed poll?')
+
+class RoutingTest(TestCase):
+    
+    def get_request(self, method='GET', remote_addr='127.0.0.1'):
+        from django.http import HttpRequest
+        request = HttpRequest()
+        request.method = method
+        request.META['REMOTE_ADDR'] = remote_addr
+        return request
+    
+    def test_replica_routing(self):
+        from django_restapi.routing import ReplicaRouting
+        routing = ReplicaRouting('replica', sticky_seconds=5)
+        request = self.get_request()
+        self.failUnlessEqual(routing.db_for_read(request), 'replica')
+        self.failUnlessEqual(routing.db_for_write(request), 'default')
+        
+        # Reads go to the primary for a while after a write
+        routing.written(self.get_request('POST'))
+        self.failUnlessEqual(routing.db_for_read(request), 'default')
+        self.failUnlessEqual(routing.db_for_read(self.get_request(remote_addr='10.0.0.1')), 'replica')
+        
+        # Routers and lists of replicas
+        routing = ReplicaRouting(lambda request: request.META['REMOTE_ADDR'] == '127.0.0.1' and 'a' or 'b')
+        self.failUnlessEqual(routing.db_for_read(request), 'a')
+        routing = ReplicaRouting(['r1', 'r2'])
+        self.failUnless(routing.db_for_read(request) in ('r1', 'r2'))
+        routing.written(request)
+        self.failUnless(routing.db_for_read(request) in ('r1', 'r2'))
+    
+    def test_unsupported(self):
+        from django.core.exceptions import ImproperlyConfigured
+        from django_restapi.routing import use_database, using_kwargs
+        queryset = Poll.objects.all()
+        self.failUnless(use_database(queryset, None) is queryset)
+        if not hasattr(queryset, 'using'):
+            self.failUnlessRaises(ImproperlyConfigured, use_database, queryset, 'replica')
+            self.failUnlessEqual(using_kwargs(None), {})
+            self.failUnlessRaises(ImproperlyConfigured, using_kwargs, 'replica')
+        else:
+            self.failUnlessEqual(using_kwargs(None), {'using' : 'default'})
+    
+    def test_routed_copy(self):
+        from django_restapi_tests.examples.simple import simple_poll_resource
+        queryset = simple_poll_resource.queryset
+        routed = simple_poll_resource.routed(self.get_request())
+        self.failIf(routed is simple_poll_resource)
+        self.failIf(routed.queryset is queryset)
+        self.failUnless(simple_poll_resource.queryset is queryset)
+        self.failUnless(routed.root is simple_poll_resource)
+
+if hasattr(Poll.objects.all(), 'using'):
+    class ReplicaTest(TestCase):
+        
+        fixtures = ['initial_data.json']
+        multi_db = True
+        
+        def test_replica(self):
+            from django_restapi_tests.examples.routing import replica_routing
+            replica_routing.store.delete('sticky:ip:127.0.0.1')
+            response = self.client.get('/replicated/polls/1/')
+            self.failUnlessEqual(response.status_code, 200)
+            
+            # The new poll is written to the primary only
+            new_poll = {'question' : 'Replicated?', 'password' : 'secret', 'pub_date' : '2008-01-01'}
+            response = self.client.post('/replicated/polls/', new_poll)
+            self.failUnlessEqual(response.status_code, 201)
+            poll = Poll.objects.using('default').get(question='Replicated?')
+            self.failIf(Poll.objects.using('replica').filter(question='Replicated?'))
+            
+            # Read-your-writes within the sticky window
+            response = self.client.get('/replicated/polls/%d/' % poll.id)
+            self.failUnlessEqual(response.status_code, 200)
+            replica_routing.store.delete('sticky:ip:127.0.0.1')
+            response = self.client.get('/replicated/polls/%d/' % poll.id)
+            self.failUnlessEqual(response.status_code, 404)
+        
+        def test_query_inspection(self):
+            from django_restapi.querydebug import QueryInspector
+            from django_restapi_tests.examples.routing import replica_routing
+            replica_routing.store.delete('sticky:ip:127.0.0.1')
+            response = QueryInspector(headers=False).inspect(self.client.get, '/replicated/polls/1/')
+            self.failUnlessEqual(response.status_code, 200)
+            self.failUnlessEqual([query['using'] for query in response.query_report.queries],
+                                 ['replica'])
+
+class CachingTest(TestCase):
+    
+    fixtures = ['initial_data.json']
+    
+    def setUp(self):
+        from django_restapi.store import LocalStore
+        from django_restapi_tests.examples.caching import poll_cache
+        poll_cache.store = LocalStore()
+        self.cache = poll_cache
+    
+    def get(self, url, data={}):
+        from django_restapi.querydebug import QueryInspector
+        return QueryInspector(headers=False).inspect(self.client.get, url, data)
+    
+    def test_default_store(self):
+        from django.conf import settings
+        from django.core.cache import cache # Set up with the test settings
+        from django_restapi.caching import ResponseCache
+        from django_restapi.store import CacheStore, LocalStore
+        
+        # Writes must invalidate the responses of all processes
+        old_backend = settings.CACHE_BACKEND
+        try:
+            settings.CACHE_BACKEND = 'memcached://127.0.0.1:11211/'
+            self.failUnless(isinstance(ResponseCache('test').store, CacheStore))
+            settings.CACHE_BACKEND = 'locmem://'
+            self.failUnless(isinstance(ResponseCache('test').store, LocalStore))
+        finally:
+            settings.CACHE_BACKEND = old_backend
+    
+    def test_cache(self):
+        response = self.get('/cached/polls/')
+        self.failUnlessEqual(response.status_code, 200)
+        self.failUnlessEqual(response['X-Cache'], 'miss')
+        content = response.content
+        
+        # Cached responses need no queries
+        response = self.get('/cached/polls/')
+        self.failUnlessEqual(response['X-Cache'], 'hit')
+        self.failUnlessEqual(response.query_report.count, 0)
+        self.failUnlessEqual(response.content, content)
+        self.failUnlessEqual(response['Content-Type'], 'application/json')
+        response = self.get('/cached/polls/', {'page' : '1'})
+        self.failUnlessEqual(response['X-Cache'], 'miss')
+        response = self.get('/cached/polls/1/')
+        self.failUnlessEqual(response['X-Cache'], 'miss')
+        self.failUnlessEqual(self.get('/cached/polls/1/')['X-Cache'], 'hit')
+        
+        # Writes through the resource invalidate the cache
+        new_poll = {'question' : 'Cached?', 'password' : 'secret', 'pub_date' : '2008-01-01'}
+        response = self.client.post('/cached/polls/', new_poll)
+        self.failUnlessEqual(response.status_code, 201)
+        response = self.get('/cached/polls/')
+        self.failUnlessEqual(response['X-Cache'], 'miss')
+        self.failUnless('Cached?' in response.content)
+        content = response.content
+        
+        # So do changes of the model elsewhere. While one
+        # request renders the response again, the others get
+        # the stale response.
+        Poll.objects.filter(question='Cached?').delete()
+        # Publish the event of the delete now, not with the
+        # inspected request (see EventStreamResource)
+        from django_restapi_tests.examples.events import poll_stream
+        poll_stream.publish_pending()
+        request = HttpRequest()
+        request.path = '/cached/polls/'
+        self.failUnless(self.cache.store.add('revalidate:%s' % self.cache.get_key(request), True))
+        response = self.get('/cached/polls/')
+        self.failUnlessEqual(response['X-Cache'], 'stale')
+        self.failUnlessEqual(response.query_report.count, 0)
+        self.failUnlessEqual(response.content, content)
+        self.cache.store.delete('revalidate:%s' % self.cache.get_key(request))
+        response = self.get('/cached/polls/')
+        self.failUnlessEqual(response['X-Cache'], 'miss')
+        self.failIf('Cached?' in response.content)
+        
+        # Errors are not cached
+        self.failIf(self.get('/cached/polls/999/').has_header('X-Cache'))
+
+class SyncTest(TestCase):
+    
+    fixtures = ['initial_data.json']
+    
+    def sync(self, token, url='/synced/polls/'):
+        response = self.client.get(url, {'since' : token})
+        self.failUnlessEqual(response.status_code, 200)
+        return simplejson.loads(response.content)
+    
+    def test_sync(self):
+        # Initial synchronization
+        changes = self.sync('')
+        self.failUnlessEqual([poll['pk'] for poll in changes['objects']], [1, 2, 3])
+        self.failUnlessEqual(changes['deleted'], [])
+        self.failIf(changes['more'])
+        token = changes['token']
+        changes = self.sync(token)
+        self.failUnlessEqual(changes['objects'], [])
+        self.failUnlessEqual(changes['token'], token)
+        
+        # Changed, created and deleted polls
+        poll = Poll.objects.get(id=3)
+        poll.question = 'Cherry or cheese?'
+        poll.save()
+        new_poll = {'question' : 'Synced?', 'password' : 'secret', 'pub_date' : '2008-01-01'}
+        response = self.client.post('/synced/polls/', new_poll)
+        self.failUnlessEqual(response.status_code, 201)
+        response = self.client.delete('/synced/polls/2/')
+        self.failUnlessEqual(response.status_code, 200)
+        changes = self.sync(token)
+        self.failUnlessEqual([poll['fields']['question'] for poll in changes['objects']],
+                             ['Cherry or cheese?', 'Synced?'])
+        self.failUnlessEqual(changes['deleted'], ['2'])
+        self.failIf(changes['objects'][0]['fields'].has_key('password'))
+        changes = self.sync(changes['token'])
+        self.failUnlessEqual((changes['objects'], changes['deleted']), ([], []))
+        
+        # Deleted polls do not show up in a new initial synchronization
+        changes = self.sync('')
+        self.failUnlessEqual([poll['pk'] for poll in changes['objects']], [1, 3, 4])
+        self.failUnlessEqual(self.sync(changes['token'])['deleted'], [])
+        
+        # Large changes are split up
+        from django_restapi_tests.examples.sync import poll_changes
+        poll_changes.max_changes = 1
+        try:
+            pks, deleted, more = [], [], True
+            while more:
+                changes = self.sync(token)
+                pks.extend([poll['pk'] for poll in changes['objects']])
+                deleted.extend(changes['deleted'])
+                token, more = changes['token'], changes['more']
+            self.failUnlessEqual((pks, deleted), ([3, 4], ['2']))
+        finally:
+            poll_changes.max_changes = 100
+        
+        # Without "since" the resource lists the polls
+        response = self.client.get('/synced/polls/')
+        self.failUnlessEqual(len(simplejson.loads(response.content)), 3)
+        
+        # Invalid tokens
+        for token in ('foo', 'MXxmb298MQ=='):
+            response = self.client.get('/synced/polls/', {'since' : token})
+            self.failUnlessEqual(response.status_code, 400)
+    
+    def test_xml(self):
+        response = self.client.get('/synced/xml/polls/', {'since' : ''})
+        token = re.search('token="(.*?)"', response.content).group(1)
+        response = self.client.delete('/synced/xml/polls/1/')
+        self.failUnlessEqual(response.status_code, 200)
+        response = self.client.get('/synced/xml/polls/', {'since' : token})
+        self.failUnless('<deleted pk="1"></deleted>' in response.content)
+        self.failIf('<object' in response.content)
+
+class EventStreamTest(TestCase):
+    
+    fixtures = ['initial_data.json']
+    
+    def setUp(self):
+        from django_restapi_tests.examples.events import poll_stream
+        self.stream = poll_stream
+        self.stream.timeout = 0
+    
+    def tearDown(self):
+        self.stream.timeout = 30
+    
+    def get_events(self, **headers):
+        response = self.client.get('/events/polls/', **headers)
+        self.failUnlessEqual(response.status_code, 200)
+        self.failUnlessEqual(response['Content-Type'], 'text/event-stream')
+        events = []
+        for block in response.content.split('\n\n'):
+            event = {}
+            for line in block.splitlines():
+                if line and not line.startswith(':'):
+                    name, value = line.split(': ', 1)
+                    event[name] = value
+            if event.has_key('event'):
+                events.append(event)
+        return events
+    
+    def test_events(self):
+        # A new stream starts with the next change
+        last_id = self.stream.buffer.last_id
+        self.failUnlessEqual(self.get_events(), [])
+        
+        new_poll = {'question' : 'Live?', 'password' : 'secret', 'pub_date' : '2008-01-01'}
+        response = self.client.post('/live/polls/', new_poll)
+        self.failUnlessEqual(response.status_code, 201)
+        poll = Poll.objects.get(question='Live?')
+        poll.question = 'Still live?'
+        poll.save()
+        # Changes outside a request are published after their
+        # transaction has ended
+        self.stream.publish_pending()
+        response = self.client.delete('/live/polls/%d/' % poll.id)
+        self.failUnlessEqual(response.status_code, 200)
+        
+        # Resume after the last event received
+        events = self.get_events(HTTP_LAST_EVENT_ID=str(last_id))
+        self.failUnlessEqual([e['event'] for e in events], ['create', 'update', 'delete'])
+        self.failUnlessEqual([int(e['id']) for e in events], [last_id + 1, last_id + 2, last_id + 3])
+        created = simplejson.loads(events[0]['data'])
+        self.failUnlessEqual(created['fields']['question'], 'Live?')
+        self.failIf(created['fields'].has_key('password'))
+        self.failUnlessEqual(simplejson.loads(events[2]['data'])['pk'], poll.id)
+        events = self.get_events(HTTP_LAST_EVENT_ID=events[1]['id'])
+        self.failUnlessEqual([e['event'] for e in events], ['delete'])
+        
+        # Clients that missed events have to reload
+        for last_event_id in (str(last_id - 5000), 'foo'):
+            events = self.get_events(HTTP_LAST_EVENT_ID=last_event_id)
+            self.failUnlessEqual([e['event'] for e in events], ['reset'])
+            self.failUnlessEqual(int(events[0]['id']), self.stream.buffer.last_id)
+    
+    def test_rollback(self):
+        # Changes that the database does not confirm, e.g. after
+        # a rollback, are not published
+        last_id = self.stream.buffer.last_id
+        self.stream.saved(Poll, Poll(pk=9999, question='Rolled back?'), created=True)
+        self.stream.deleted(Poll, Poll.objects.get(pk=1))
+        self.stream.publish_pending()
+        self.failUnlessEqual(self.stream.buffer.last_id, last_id)
+    
+    def test_buffer(self):
+        from django_restapi.events import EventBuffer
+        buffer = EventBuffer(max_events=2)
+        first_id = buffer.last_id
+        for i in range(3):
+            buffer.append('update', i)
+        self.failUnlessEqual(buffer.get_after(first_id), None)
+        self.failUnlessEqual([data for (id, type, data) in buffer.get_after(first_id + 1)], [1, 2])
+        self.failUnlessEqual(buffer.get_after(first_id + 3, 0.01), [])
+
+class AggregateTest(TestCase):
+    
+    fixtures = ['initial_data.json']
+    
+    def get(self, url, data={}):
+        from django_restapi.querydebug import QueryInspector
+        response = QueryInspector(headers=False).inspect(self.client.get, url, data)
+        self.failUnlessEqual(response.status_code, 200)
+        return simplejson.loads(response.content), response.query_report.count
+    
+    def test_aggregates(self):
+        totals = [{'poll' : 1, 'votes' : 93, 'choices' : 3},
+                  {'poll' : 2, 'votes' : 76, 'choices' : 3},
+                  {'poll' : 3, 'votes' : 57, 'choices' : 2}]
+        self.failUnlessEqual(self.get('/aggregated/votes/'), (totals, 1))
+        self.failUnlessEqual(self.get('/aggregated/votes/', {'poll' : '2'}), (totals[1:2], 1))
+        self.failUnlessEqual(self.get('/aggregated/votes/', {'poll' : 'foo'})[0], [])
+    
+    def test_summary(self):
+        from django_restapi_tests.examples.aggregates import votes_summary_resource
+        from django_restapi_tests.polls.models import Choice
+        votes_summary_resource.summary.refresh()
+        rows, count = self.get('/aggregated/votes/summary/')
+        self.failUnlessEqual(count, 0)
+        self.failUnlessEqual([row['votes'] for row in rows], [93, 76, 57])
+        self.failUnlessEqual(self.get('/aggregated/votes/summary/', {'poll' : '3'})[0],
+                             [{'poll' : 3, 'votes' : 57, 'choices' : 2}])
+        
+        # Writes mark their groups, which the next read
+        # recomputes with one query
+        choice = Choice.objects.get(id=8)
+        choice.votes += 10
+        choice.save()
+        Choice.objects.get(id=1).delete()
+        rows, count = self.get('/aggregated/votes/summary/')
+        self.failUnlessEqual(count, 1)
+        self.failUnlessEqual([row['votes'] for row in rows], [46, 76, 67])
+        
+        # The test runs in a transaction, so the groups are
+        # marked again when a request has finished; they may
+        # have been read before a commit or rollback
+        self.failUnlessEqual(self.get('/aggregated/votes/summary/')[1], 1)
+        self.failUnlessEqual(self.get('/aggregated/votes/summary/')[1], 0)
+        
+        # Choices that move to another poll leave their group
+        choice.poll = Poll.objects.get(id=2)
+        choice.save()
+        Choice.objects.filter(poll=3).delete()
+        rows, count = self.get('/aggregated/votes/summary/')
+        self.failUnlessEqual(rows, [{'poll' : 1, 'votes' : 46, 'choices' : 2},
+                                    {'poll' : 2, 'votes' : 134, 'choices' : 4}])
+        self.failUnlessEqual(rows, self.get('/aggregated/votes/')[0])
+
+class ExportTest(TestCase):
+    
+    fixtures = ['initial_data.json']
+    
+    def test_export(self):
+        import csv
+        response = self.client.get('/export/polls/')
+        self.failUnlessEqual(response.status_code, 200)
+        self.failUnlessEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.failUnlessEqual(response['Content-Disposition'], 'attachment; filename=poll.csv')
+        rows = list(csv.reader(response.content.splitlines()))
+        self.failUnlessEqual(rows[0], ['id', 'question', 'pub_date'])
+        self.failUnlessEqual(rows[1], ['1', 'XML, JSON or YAML?', '2007-07-01 01:26:58'])
+        self.failUnlessEqual(len(rows), 4)
+        
+        response = self.client.get('/export/polls/', {'format' : 'json'})
+        self.failUnlessEqual(response['Content-Type'], 'application/json')
+        polls = simplejson.loads(response.content)
+        self.failUnlessEqual([poll['pk'] for poll in polls], [1, 2, 3])
+        self.failIf(polls[0]['fields'].has_key('password'))
+        response = self.client.get('/export/polls/', {'format' : 'xml'})
+        self.failUnlessEqual(response.status_code, 400)
+        
+        # Chunks of three choices
+        response = self.client.get('/export/choices/')
+        choices = simplejson.loads(response.content)
+        self.failUnlessEqual([choice['pk'] for choice in choices], range(1, 9))
+        self.failUnlessEqual(choices[0]['fields'], {'choice' : 'XML'})
+        Poll.objects.all().delete()
+        self.failUnlessEqual(self.client.get('/export/choices/').content, '[]')
+        self.failUnlessEqual(self.client.get('/export/polls/').content.strip(), 'id,question,pub_date')
+    
+    def test_chunks(self):
+        from django.conf import settings
+        from django.db import connection
+        from django_restapi.export import Exporter, get_engine
+        from django_restapi_tests.polls.models import Choice
+        exporter = Exporter(Choice.objects.filter(votes__gt=23), chunk_size=2)
+        self.failUnlessEqual([[c.id for c in chunk] for chunk in exporter.iter_chunks()],
+                             [[1, 4], [5, 8]])
+        self.failUnlessEqual(get_engine(connection), settings.DATABASE_ENGINE)
+        exporter.write(StringIO())
+        self.failUnlessEqual(exporter.report.objects, 4)
+    
+    def test_command(self):
+        import os, sys, tempfile
+        from django.core.management import call_command
+        fd, filename = tempfile.mkstemp()
+        os.close(fd)
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            call_command('export_collection', 'django_restapi_tests.examples.basic.xml_choice_resource',
+                         format='json', output=filename, chunk_size=5)
+            report = sys.stderr.getvalue()
+            choices = simplejson.load(open(filename))
+        finally:
+            sys.stderr = stderr
+            os.remove(filename)
+        self.failUnlessEqual(len(choices), 8)
+        self.failUnless(report.startswith('Exported 8 objects'))
+        
+        from django.core.management.base import CommandError
+        from django_restapi.management.commands.export_collection import Command
+        self.failUnlessRaises(CommandError, Command().get_exporter, 'polls', 'csv', 5)
+
+class WarmUpTest(TestCase):
+    
+    fixtures = ['initial_data.json']
+    
+    def test_warm_up(self):
+        from django_restapi.warmup import warm_up
+        from django_restapi_tests.examples.basic import xml_poll_resource
+        from django_restapi_tests.examples.registry import registry, registered_choice_resource
+        from django_restapi_tests.examples.template import template_poll_resource
+        from django_restapi_tests.polls.models import Choice
+        report = warm_up()
+        names = [name for (name, seconds) in report.timings]
+        self.failUnlessEqual(names[0], 'URL resolver')
+        self.failUnless('^html/polls/(.*?)/?$' in names)
+        self.failUnless('^registered/polls/<int:poll_id>/choices/' in names)
+        self.failUnless('^import/polls/(.*?)/?$ (collection)' in names)
+        self.failUnless(str(report).endswith('Warmed up %d resources in %.1f ms' % (
+            len(names) - 1, report.get_seconds() * 1000)))
+        
+        # The artifacts are reused by requests
+        self.failUnless(registry.compiled is not None)
+        self.failUnless(registered_choice_resource.get_form_class() is
+                        registered_choice_resource.form_classes[Choice])
+        self.failUnlessEqual([f.name for f in xml_poll_resource.responder.unexposed_fields[Poll]],
+                             ['password', 'updated'])
+        responder = template_poll_resource.responder
+        self.failUnlessEqual(sorted(responder.templates.keys()),
+                             ['polls/poll_detail.html', 'polls/poll_list.html'])
+        response = self.client.get('/html/polls/1/')
+        self.failUnlessEqual(response.status_code, 200)
+        self.failUnless(response.template is responder.templates['polls/poll_detail.html'])
+    
+    def test_command(self):
+        import sys
+        from django.core.management import call_command
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            call_command('warm_up')
+            report = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.failUnless(report.strip().split('\n')[-1].startswith('Warmed up'))
+
+class ImportTest(TestCase):
+    
+    fixtures = ['initial_data.json']
+    
+    def setUp(self):
+        from django_restapi_tests.examples.imports import poll_import
+        poll_import.batch_size = 2
+    
+    def tearDown(self):
+        from django_restapi_tests.examples.imports import poll_import
+        poll_import.batch_size = 100
+    
+    def test_csv(self):
+        from django_restapi_tests.examples.imports import poll_import
+        lines = [
+            'question,password,pub_date',
+            'Imported 1?,secret,2008-01-01',
+            'Imported 2?,secret,2008-01-02',
+            ',secret,2008-01-03',
+            'Imported 3?,secret,2008-01-04',
+            'Imported 4?,secret,not a date',
+            'Imported 5?,secret,2008-01-05',
+        ]
+        data = '\r\n'.join(lines)
+        progress = []
+        set_status = poll_import.set_status
+        def record_status(status):
+            progress.append(status['progress'])
+            set_status(status)
+        poll_import.set_status = record_status
+        try:
+            response = self.client.post('/import/polls/', data=data, content_type='text/csv')
+        finally:
+            del poll_import.set_status
+        
+        # The progress after a batch counts the rows read so far
+        self.failUnlessEqual(progress[-3:], [float(len('\r\n'.join(lines[:3])) + 2) / len(data),
+                                             1.0, 1.0])
+        self.failUnlessEqual(response.status_code, 200)
+        status = simplejson.loads(response.content)
+        self.failUnlessEqual((status['state'], status['rows'], status['imported'], status['failed']),
+                             ('done', 6, 4, 2))
+        self.failUnlessEqual(status['batches'], 2)
+        self.failUnlessEqual(status['progress'], 1.0)
+        self.failUnlessEqual([e['row'] for e in status['errors']], [3, 5])
+        self.failUnless(status['errors'][0]['errors'].has_key('question'))
+        self.failUnlessEqual(Poll.objects.filter(question__startswith='Imported').count(), 4)
+        
+        # Status sub-resource
+        url = response['Location']
+        self.failUnless(url.endswith('/import/polls/%s' % status['id']))
+        response = self.client.get(url)
+        self.failUnlessEqual(simplejson.loads(response.content), status)
+        response = self.client.get('/import/polls/unknown/')
+        self.failUnlessEqual(response.status_code, 404)
+    
+    def test_ndjson(self):
+        data = '\n'.join([
+            '{"question" : "NDJSON 1?", "password" : "secret", "pub_date" : "2008-01-01"}',
+            '{"question" : "NDJSON 2?", "password" : "secret"',
+            '',
+            '["NDJSON 3?"]',
+            '{"question" : "NDJSON 4?", "password" : "secret", "pub_date" : "2008-01-01"}',
+        ])
+        response = self.client.post('/import/polls/?format=ndjson', data=data, content_type='text/plain')
+        status = simplejson.loads(response.content)
+        self.failUnlessEqual((status['rows'], status['imported'], status['failed']), (4, 2, 2))
+        self.failUnlessEqual([e['row'] for e in status['errors']], [2, 3])
+        
+        # Unknown formats
+        response = self.client.post('/import/polls/', data=data, content_type='text/plain')
+        self.failUnlessEqual(response.status_code, 400)
+
+class RegistryTest(TestCase):
+    
+    fixtures = ['initial_data.json']
+    
+    def test_resolve(self):
+        from django_restapi_tests.examples.registry import registry, \
+            registered_poll_resource, registered_choice_resource
+        route, values = registry.resolve('polls/')
+        self.failUnlessEqual((route.resource, route.get_arguments(values)),
+                             (registered_poll_resource, ((), {'is_entry' : False})))
+        route, values = registry.resolve('polls/2')
+        self.failUnlessEqual(route.get_arguments(values), (('2',), {'is_entry' : True}))
+        route, values = registry.resolve('polls/2/choices/3/')
+        self.failUnlessEqual((route.resource, route.get_arguments(values)),
+                             (registered_choice_resource,
+                              ((), {'poll_id' : '2', 'choice_num' : '3', 'is_entry' : True})))
+        for path in ('unknown/', 'polls/2/unknown/', 'polls/x/choices/', 'polls/2/choices/3/4/'):
+            self.failUnlessEqual(registry.resolve(path), (None, None))
+        
+        # URLs are built from the same routes
+        self.failUnlessEqual(registry.reverse(registered_poll_resource), '/registered/polls/')
+        self.failUnlessEqual(registry.reverse(registered_poll_resource, (2,)), '/registered/polls/2/')
+        self.failUnlessEqual(registry.reverse(registered_choice_resource, (), {'poll_id' : 2}),
+                             '/registered/polls/2/choices/')
+        self.failUnlessEqual(registry.reverse(registered_choice_resource, (), {'poll_id' : 'x'}), None)
+        self.failUnlessEqual(registry.reverse(object()), None)
+    
+    def test_requests(self):
+        response = self.client.get('/registered/polls/')
+        self.failUnlessEqual(response.status_code, 200)
+        self.failUnlessEqual(len(simplejson.loads(response.content)), Poll.objects.count())
+        response = self.client.get('/registered/polls/1/')
+        self.failUnlessEqual(simplejson.loads(response.content)[0]['pk'], 1)
+        for url in ('/registered/polls/999/', '/registered/unknown/', '/registered/polls/x/choices/'):
+            response = self.client.get(url)
+            self.failUnlessEqual(response.status_code, 404)
+        
+        # Locations of new entries come from the registry
+        response = self.client.post('/registered/polls/', {'question' : 'Registered?',
+                                    'password' : 'secret', 'pub_date' : '2008-01-01'})
+        self.failUnlessEqual(response.status_code, 201)
+        poll = Poll.objects.get(question='Registered?')
+        self.failUnless(response['Location'].endswith('/registered/polls/%d/' % poll.id))
+        response = self.client.post('/registered/polls/%d/choices/' % poll.id,
+                                    {'choice' : 'Yes', 'votes' : 0})
+        self.failUnlessEqual(response.status_code, 201)
+        self.failUnless(response['Location'].endswith('/registered/polls/%d/choices/1/' % poll.id))
+        response = self.client.get('/registered/polls/%d/choices/1/' % poll.id)
+        self.failUnlessEqual(simplejson.loads(response.content)[0]['fields']['choice'], 'Yes')
+
+class ProfilingTest(TestCase):
+    
+    fixtures = ['initial_data.json']
+    
+    def test_sampling(self):
+        import marshal, pstats, shutil, tempfile
+        from django_restapi_tests.examples.profiling import profile_registry
+        profile_registry.clear()
+        
+        # One in five requests is profiled
+        for i in range(10):
+            response = self.client.get('/profiled/polls/')
+            self.failUnlessEqual(response.status_code, 200)
+        self.failUnlessEqual(profile_registry.keys(), [('polls', 'GET')])
+        self.failUnlessEqual(profile_registry.get_samples('polls', 'GET'), 2)
+        
+        # Requests with the trusted header are always profiled
+        response = self.client.get('/profiled/polls/1/', HTTP_X_PROFILE='secret')
+        self.failUnlessEqual(response.status_code, 200)
+        self.failUnlessEqual(profile_registry.get_samples('polls', 'GET'), 3)
+        response = self.client.get('/profiled/polls/1/', HTTP_X_PROFILE='wrong')
+        self.failUnlessEqual(profile_registry.get_samples('polls', 'GET'), 3)
+        
+        # The profiles are only available to authorized users
+        response = self.client.get('/profiles/')
+        self.failUnlessEqual(response.status_code, 401)
+        headers = {
+            'HTTP_AUTHORIZATION': 'Basic %s' % b2a_base64('rest:rest')[:-1]
+        }
+        response = self.client.get('/profiles/', **headers)
+        self.failUnlessEqual(response.status_code, 200)
+        self.failUnlessEqual(response.content, 'polls GET 3\n')
+        response = self.client.get('/profiles/', {'resource' : 'polls', 'sort' : 'time'}, **headers)
+        self.failUnlessEqual(response.status_code, 200)
+        self.failUnless('handle_request' in response.content)
+        response = self.client.get('/profiles/', {'resource' : 'polls', 'method' : 'PUT'}, **headers)
+        self.failUnlessEqual(response.status_code, 404)
+        response = self.client.get('/profiles/', {'resource' : 'polls', 'format' : 'pstats'}, **headers)
+        self.failUnlessEqual(response['Content-Type'], 'application/octet-stream')
+        self.failUnless(marshal.loads(response.content))
+        
+        # Dumped profiles can be loaded by pstats
+        directory = tempfile.mkdtemp()
+        try:
+            filenames = profile_registry.dump(directory)
+            self.failUnlessEqual(len(filenames), 1)
+            self.failUnless(filenames[0].endswith('polls.GET.prof'))
+            self.failUnless(pstats.Stats(filenames[0]).total_calls > 0)
+        finally:
+            shutil.rmtree(directory)
+
+class StartupTest(TestCase):
+    
+    def test_lazy_imports(self):
+        # A fresh interpreter that imports a JSON-only urlconf
+        # does not import the XML and template machinery
+        from django_restapi_tests.startup import measure, DEFAULT_URLCONF
+        result = measure(DEFAULT_URLCONF)
+        for name in ('django.core.serializers.xml_serializer',
+                     'django.template.loader', 'xml.dom.minidom'):
+            self.failIf(name in result['optional'], name)
+        self.failUnless(result['modules'] > 0)
+
+class QueryInspectionTest(TestCase, QueryBudgetTestMixin):
+    
+    fixtures = ['initial_data.json']
+    
+    def test_query_budget(self):
+        response = self.client.get('/inspected/polls/')
+        self.failUnlessEqual(response.status_code, 200)
+        self.assertWithinQueryBudget(response)
+        self.assertNoRepeatedQueries(response)
+        self.failUnlessEqual(response['X-Query-Count'], '1')
+        self.failUnlessEqual(response['X-Query-Budget'], '1')
+        self.failUnlessEqual(response['X-Query-Suspects'], '0')
+        query = response.query_report.queries[0]
+        self.failUnless(query['sql'].startswith('SELECT'))
+        self.failUnless(query['start'] >= 0 and query['time'] >= 0)
+        self.failUnless(query['using'] in (None, 'default'))
+        
+        response = self.client.get('/inspected/polls/1/')
+        self.failUnlessEqual(response.status_code, 200)
+        self.assertWithinQueryBudget(response)
+    
+    def test_repeated_queries(self):
+        from django_restapi_tests.polls.models import Choice
+        response = self.client.get('/inspected/choices/')
+        self.failUnlessEqual(response.status_code, 200)
+        report = response.query_report
         
+        # One query for the list and one per choice for its poll
+        self.failUnlessEqual(report.count, 1 + Choice.objects.count())
+        self.failUnless(report.exceeded)
+        self.failUnlessEqual(len(report.suspects), 1)
+        self.failUnlessEqual(report.suspects[0][1], Choice.objects.count())
+        self.failUnlessRaises(AssertionError, self.assertWithinQueryBudget, response)
+        self.failUnlessRaises(AssertionError, self.assertNoRepeatedQueries, response)
+        
+        # Queries outside of inspected requests are not recorded
+        Choice.objects.count()
+        self.failUnlessEqual(report.count, 1 + Choice.objects.count())
+
 class AuthenticationTest(TestCase):
     
     fixtures = ['initial_data.json']
@@ -279,6 +1293,15 @@ class AuthenticationTest(TestCase):
         auth_params.update({'http_method': 'GET', 'fullpath': url, 'username': 'john', 'cnonce': '12345678', 'nc': '00000001'})
         return auth_params
     
+    def get_digest_header(self, auth_params, auth_helper):
+        """
+        Returns an HTTP_AUTHORIZATION header with the response
+        key computed from auth_params.
+        """
+        auth_params = dict(auth_params)
+        auth_params['response'] = auth_helper.get_auth_response(**auth_params)
+        return DIGEST_AUTH % auth_params
+    
     def test_basic_authentication(self):
         # Basic authentication, no password
         url = '/basic/polls/'
@@ -299,6 +1322,90 @@ class AuthenticationTest(TestCase):
         response = self.client.get(url, **headers)
         self.failUnlessEqual(response.status_code, 200)
     
+    def test_credential_cache_store(self):
+        from django.conf import settings
+        from django.contrib.auth.models import User
+        from django.core.cache import cache # Set up with the test settings
+        from django_restapi.authentication import CredentialCache
+        from django_restapi.store import CacheStore, LocalStore
+        
+        # Invalidations must reach all processes, so a shared
+        # cache backend is used when one is configured
+        old_backend = settings.CACHE_BACKEND
+        try:
+            settings.CACHE_BACKEND = 'memcached://127.0.0.1:11211/'
+            credential_cache = CredentialCache(user_model=User)
+            self.failUnless(isinstance(credential_cache.store, CacheStore))
+            settings.CACHE_BACKEND = 'locmem://'
+            credential_cache = CredentialCache(user_model=User)
+            self.failUnless(isinstance(credential_cache.store, LocalStore))
+        finally:
+            settings.CACHE_BACKEND = old_backend
+    
+    def test_basic_authentication_cache(self):
+        from django.contrib.auth.models import User
+        url = '/cachedbasic/polls/'
+        cache = cachedauth_poll_resource.authentication.credential_cache
+        headers = {
+            'HTTP_AUTHORIZATION': 'Basic %s' % b2a_base64('rest:rest')[:-1]
+        }
+        response = self.client.get(url, **headers)
+        self.failUnlessEqual(response.status_code, 200)
+        self.failUnless(cache.lookup('rest', 'rest'))
+        self.failIf(cache.lookup('rest', 'somepass'))
+        
+        # Failed verifications are not remembered
+        wrong_headers = {
+            'HTTP_AUTHORIZATION': 'Basic %s' % b2a_base64('rest:somepass')[:-1]
+        }
+        response = self.client.get(url, **wrong_headers)
+        self.failUnlessEqual(response.status_code, 401)
+        self.failIf(cache.lookup('rest', 'somepass'))
+        
+        # Changing the password invalidates the cached verification
+        user = User.objects.get(username='rest')
+        user.set_password('newrest')
+        user.save()
+        self.failIf(cache.lookup('rest', 'rest'))
+        response = self.client.get(url, **headers)
+        self.failUnlessEqual(response.status_code, 401)
+        headers = {
+            'HTTP_AUTHORIZATION': 'Basic %s' % b2a_base64('rest:newrest')[:-1]
+        }
+        response = self.client.get(url, **headers)
+        self.failUnlessEqual(response.status_code, 200)
+    
+    def test_token_authentication(self):
+        url = '/token/polls/'
+        response = self.client.get(url)
+        self.failUnlessEqual(response.status_code, 401)
+        self.failUnlessEqual(response['WWW-Authenticate'][:7], 'Bearer ')
+        
+        # Tokens are only issued for valid credentials
+        response = self.client.post('/token/', {'username' : 'rest', 'password' : 'somepass'})
+        self.failUnlessEqual(response.status_code, 401)
+        response = self.client.get('/token/')
+        self.failUnlessEqual(response.status_code, 405)
+        response = self.client.post('/token/', {'username' : 'rest', 'password' : 'rest'})
+        self.failUnlessEqual(response.status_code, 200)
+        token = simplejson.loads(response.content)['token']
+        
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer %s' % token)
+        self.failUnlessEqual(response.status_code, 200)
+        
+        # Tampered, foreign and expired tokens are rejected
+        payload, signature = token.split('.')
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer %s.%s' % (payload[:-2], signature))
+        self.failUnlessEqual(response.status_code, 401)
+        foreign_token = TokenAuthentication(secret='other').issue_token({'username' : 'rest'})
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer %s' % foreign_token)
+        self.failUnlessEqual(response.status_code, 401)
+        token_authentication = TokenAuthentication()
+        expired_token = token_authentication.issue_token({'username' : 'rest'}, max_age=-1)
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer %s' % expired_token)
+        self.failUnlessEqual(response.status_code, 401)
+        self.failUnlessEqual(token_authentication.get_claims(token)['username'], 'rest')
+    
     def test_digest_authentication(self):
 
         # 1) Digest authentication, no password
@@ -331,3 +1438,91 @@ class AuthenticationTest(TestCase):
         }
         response = self.client.get(url, **headers)
         self.failUnlessEqual(response.status_code, 200)
+
+    def test_digest_nonces(self):
+        url = '/digest/polls/'
+        response = self.client.get(url)
+        auth_helper = HttpDigestAuthentication(authfunc=digest_authfunc, realm='realm1')
+        auth_params = self.get_digest_test_params(response, url, auth_helper)
+        
+        # Nonces are signed, so an instance that shares the
+        # secret (e.g. in another process) accepts them.
+        self.failUnless(auth_helper.is_valid_nonce(auth_params['nonce']))
+        forged_nonce = auth_params['nonce'][:-1] + 'x'
+        self.failIf(auth_helper.is_valid_nonce(forged_nonce))
+        other_helper = HttpDigestAuthentication(authfunc=digest_authfunc, realm='realm1', secret='other')
+        self.failIf(other_helper.is_valid_nonce(auth_params['nonce']))
+        expiring_helper = HttpDigestAuthentication(authfunc=digest_authfunc, realm='realm1', nonce_lifetime=-1)
+        self.failIf(expiring_helper.is_valid_nonce(auth_params['nonce']))
+        
+        # First use of a nonce count succeeds
+        headers = {
+            'SCRIPT_NAME' : '',
+            'HTTP_AUTHORIZATION': self.get_digest_header(auth_params, auth_helper)
+        }
+        response = self.client.get(url, **headers)
+        self.failUnlessEqual(response.status_code, 200)
+        
+        # Replaying the same nonce count fails
+        response = self.client.get(url, **headers)
+        self.failUnlessEqual(response.status_code, 401)
+        
+        # A higher nonce count for the same nonce succeeds
+        auth_params['nc'] = '00000002'
+        headers['HTTP_AUTHORIZATION'] = self.get_digest_header(auth_params, auth_helper)
+        response = self.client.get(url, **headers)
+        self.failUnlessEqual(response.status_code, 200)
+        
+        # A forged nonce is rejected
+        auth_params['nonce'] = forged_nonce
+        auth_params['nc'] = '00000003'
+        headers['HTTP_AUTHORIZATION'] = self.get_digest_header(auth_params, auth_helper)
+        response = self.client.get(url, **headers)
+        self.failUnlessEqual(response.status_code, 401)
+        self.failIf('stale' in auth_helper.get_auth_dict(response['WWW-Authenticate'][7:]))
+        
+        # An expired nonce with the right response is stale:
+        # the client can retry with the new nonce
+        value = '%d.12345678' % (time.time() - 1000)
+        auth_params['nonce'] = '%s.%s' % (value, auth_helper.sign_nonce(value))
+        headers['HTTP_AUTHORIZATION'] = self.get_digest_header(auth_params, auth_helper)
+        response = self.client.get(url, **headers)
+        self.failUnlessEqual(response.status_code, 401)
+        challenge = auth_helper.get_auth_dict(response['WWW-Authenticate'][7:])
+        self.failUnlessEqual(challenge['stale'], 'true')
+        self.failUnless(auth_helper.is_valid_nonce(challenge['nonce']))
+    
+    def test_digest_replay_across_processes(self):
+        from django.conf import settings
+        from django.core.cache import cache
+        from django_restapi.store import CacheStore
+        
+        # Two processes with their own store instances on a
+        # shared cache
+        url = '/digest/polls/'
+        helpers = [HttpDigestAuthentication(authfunc=digest_authfunc, realm='realm1',
+                                            nonce_store=CacheStore(prefix='digest-test', cache=cache))
+                   for i in range(2)]
+        auth_params = {'http_method': 'GET', 'fullpath': url, 'username': 'john',
+                       'realm': 'realm1', 'qop': 'auth', 'nonce': helpers[0].make_nonce(),
+                       'cnonce': '12345678', 'nc': '00000001'}
+        def get_request():
+            request = HttpRequest()
+            request.method = 'GET'
+            request.META.update({
+                'SCRIPT_NAME': '',
+                'PATH_INFO': url,
+                'HTTP_AUTHORIZATION': self.get_digest_header(auth_params, helpers[0])
+            })
+            return request
+        self.failUnless(helpers[0].is_authenticated(get_request()))
+        self.failIf(helpers[1].is_authenticated(get_request()))
+        
+        # The default store is shared if the cache backend is
+        old_backend = settings.CACHE_BACKEND
+        try:
+            settings.CACHE_BACKEND = 'memcached://127.0.0.1:11211/'
+            helper = HttpDigestAuthentication(authfunc=digest_authfunc)
+            self.failUnless(isinstance(helper.nonce_store, CacheStore))
+        finally:
+            settings.CACHE_BACKEND = old_backend
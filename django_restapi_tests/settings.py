@@ -9,6 +9,7 @@ INSTALLED_APPS = (
     'django.contrib.auth',
     'django.contrib.sessions',
     'django.contrib.sites',
+    'django_restapi',
     'django_restapi_tests.polls',
     'django_restapi_tests.people'
 )
@@ -17,6 +18,20 @@ ROOT_URLCONF = 'django_restapi_tests.urls'
 
 DATABASE_NAME = realpath('testdata')
 DATABASE_ENGINE = 'sqlite3'
+
+# Multiple databases (Django 1.2 or later; ignored by earlier
+# versions): a second SQLite database as read replica for the
+# routing example
+DATABASES = {
+    'default' : {
+        'ENGINE' : 'django.db.backends.sqlite3',
+        'NAME' : DATABASE_NAME,
+    },
+    'replica' : {
+        'ENGINE' : 'django.db.backends.sqlite3',
+        'NAME' : realpath('testdata-replica'),
+    },
+}
 TEMPLATE_DIRS = 'templates'
 
 MIDDLEWARE_CLASSES = (
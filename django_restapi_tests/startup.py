@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+"""
+Startup benchmark: the time it takes a fresh worker process
+to import a urlconf with its resources, and the resident
+memory of the process afterwards.
+
+Each run starts a new Python interpreter that sets up the
+Django environment, imports the urlconf and populates the
+URL resolver, like the first request of a worker does. The
+median of the runs is reported with the number of modules
+the urlconf imported and which of the optional parts of
+Django (serializers, templates, ...) were among them.
+
+    python startup.py --urlconf django_restapi_tests.examples.simple
+"""
+import os, subprocess, sys
+from optparse import OptionParser
+
+try:
+    import settings # Assumed to be in the same directory.
+except ImportError:
+    sys.stderr.write("Error: Can't find the file 'settings.py' in the directory containing %r.\n" % __file__)
+    sys.exit(1)
+
+# A JSON-only API with a collection and a nested collection
+DEFAULT_URLCONF = 'django_restapi_tests.examples.custom_urls'
+
+# Modules that are only needed by some deployments
+OPTIONAL_MODULES = (
+    'django.core.serializers.xml_serializer',
+    'django.core.serializers.json',
+    'django.core.paginator',
+    'django.template',
+    'django.template.loader',
+    'django.views.generic.simple',
+    'django.utils.xmlutils',
+    'xml.dom.minidom',
+)
+
+# Run in the measured interpreter; prints a JSON object
+MEASURE = r'''
+import os, sys, time
+sys.path[:0] = %(path)r
+from django.core.management import setup_environ
+import settings
+setup_environ(settings)
+from django.utils import simplejson
+
+def rss_kb():
+    try:
+        for line in open('/proc/self/status'):
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    except IOError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        maxrss = maxrss // 1024 # bytes on Mac OS X
+    return maxrss
+
+modules = set(sys.modules.keys())
+start_rss = rss_kb()
+start = time.time()
+from django.core.urlresolvers import get_resolver
+resolver = get_resolver(%(urlconf)r)
+resolver.reverse_dict
+seconds = time.time() - start
+imported = [name for name in sys.modules.keys()
+            if name not in modules and sys.modules[name] is not None]
+rss = rss_kb()
+if start_rss is None:
+    rss_growth = None
+else:
+    rss_growth = rss - start_rss
+simplejson.dump({
+    'import_ms' : seconds * 1000,
+    'rss_kb' : rss,
+    'rss_growth_kb' : rss_growth,
+    'modules' : len(imported),
+    'optional' : sorted([name for name in %(optional)r if name in imported]),
+}, sys.stdout)
+'''
+
+def measure(urlconf, python=sys.executable):
+    """
+    Imports urlconf in a new interpreter and returns its
+    measurements.
+    """
+    from django.utils import simplejson
+    directory = os.path.dirname(os.path.abspath(__file__))
+    code = MEASURE % {
+        'path' : [directory, os.path.dirname(directory)],
+        'urlconf' : urlconf,
+        'optional' : OPTIONAL_MODULES,
+    }
+    process = subprocess.Popen([python, '-c', code], stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+    output, errors = process.communicate()
+    if process.returncode:
+        raise RuntimeError('Measurement failed:\n%s' % errors)
+    return simplejson.loads(output)
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+def run_benchmark(urlconf, runs=5):
+    """
+    Returns the median measurements of several runs.
+    """
+    samples = [measure(urlconf) for i in xrange(runs)]
+    return {
+        'urlconf' : urlconf,
+        'runs' : runs,
+        'import_ms' : median([s['import_ms'] for s in samples]),
+        'rss_kb' : median([s['rss_kb'] for s in samples]),
+        'rss_growth_kb' : median([s['rss_growth_kb'] for s in samples]),
+        'modules' : median([s['modules'] for s in samples]),
+        'optional' : samples[-1]['optional'],
+    }
+
+def print_result(result, stream=sys.stdout):
+    stream.write('urlconf:          %s\n' % result['urlconf'])
+    stream.write('import time:      %.1f ms (median of %d runs)\n' % (result['import_ms'], result['runs']))
+    stream.write('resident memory:  %s KB (+%s KB)\n' % (result['rss_kb'], result['rss_growth_kb']))
+    stream.write('imported modules: %d\n' % result['modules'])
+    stream.write('optional modules: %s\n' % (', '.join(result['optional']) or '-'))
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--urlconf', default=DEFAULT_URLCONF,
+                      help='module with the urlpatterns to import [%default]')
+    parser.add_option('--runs', type='int', default=5,
+                      help='number of worker processes to measure [%default]')
+    parser.add_option('--output', help='write the result to this JSON file')
+    options, args = parser.parse_args()
+
+    from django.core.management import setup_environ
+    setup_environ(settings)
+    result = run_benchmark(options.urlconf, options.runs)
+    print_result(result)
+
+    if options.output:
+        from django.utils import simplejson
+        output = open(options.output, 'w')
+        simplejson.dump(result, output, indent=2, sort_keys=True)
+        output.close()
+
+if __name__ == "__main__":
+    main()
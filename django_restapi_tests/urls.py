@@ -8,6 +8,20 @@ urlpatterns = patterns('',
    url(r'', include('django_restapi_tests.examples.custom_urls')),
    url(r'', include('django_restapi_tests.examples.fixedend_urls')),
    url(r'', include('django_restapi_tests.examples.authentication')),
+   url(r'', include('django_restapi_tests.examples.throttling')),
+   url(r'', include('django_restapi_tests.examples.metrics')),
+   url(r'', include('django_restapi_tests.examples.querydebug')),
+   url(r'', include('django_restapi_tests.examples.profiling')),
+   url(r'', include('django_restapi_tests.examples.includes')),
+   url(r'', include('django_restapi_tests.examples.batch')),
+   url(r'', include('django_restapi_tests.examples.routing')),
+   url(r'', include('django_restapi_tests.examples.caching')),
+   url(r'', include('django_restapi_tests.examples.sync')),
+   url(r'', include('django_restapi_tests.examples.events')),
+   url(r'', include('django_restapi_tests.examples.aggregates')),
+   url(r'', include('django_restapi_tests.examples.export')),
+   url(r'', include('django_restapi_tests.examples.imports')),
+   url(r'', include('django_restapi_tests.examples.registry')),
    url(r'', include('django_restapi_tests.examples.submission')),
    url(r'', include('django_restapi_tests.examples.generic_resource')),
    url(r'^admin/(.*)', admin.site.root)